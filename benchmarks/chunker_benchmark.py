@@ -0,0 +1,70 @@
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chunker import iter_chunks, CHUNK_STRATEGIES
+
+# Throughput of utils.chunker.iter_chunks on multi-megabyte synthetic documents.
+# Run with: python benchmarks/chunker_benchmark.py --sizes 1 8 32
+
+def generate_text(size_mb, seed=0):
+    """Generate roughly size_mb megabytes of words, punctuation and paragraph breaks."""
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 10)))
+                  for _ in range(20000)]
+    parts = []
+    size = 0
+    target = size_mb * 1024 * 1024
+    while size < target:
+        sentence = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(5, 30)))
+        sentence = sentence.capitalize() + rng.choice(['.', '.', '.', '?', '!', ',', ';'])
+        separator = '\n\n' if rng.random() < 0.05 else ' '
+        parts.append(sentence + separator)
+        size += len(sentence) + len(separator)
+    return ''.join(parts)
+
+def legacy_split(text, chunk_size, overlap):
+    """The list-based splitter iter_chunks replaced, kept as the baseline."""
+    words = text.split()
+    return [' '.join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size - overlap)]
+
+def read_blocks(text, block_size):
+    """Stream a text in blocks, as a file object would."""
+    stream = io.StringIO(text)
+    return iter(lambda: stream.read(block_size), '')
+
+def measure(run):
+    """Run once and return (seconds, number of chunks)."""
+    start = time.perf_counter()
+    chunks = run()
+    return time.perf_counter() - start, chunks
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming chunker.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 8, 32], help="Document sizes in MB")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--overlap", type=int, default=50)
+    parser.add_argument("--block-size", type=int, default=64 * 1024, help="Block size of the streamed runs, in characters")
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'strategy':>16} {'chunks':>8} {'seconds':>9} {'MB/s':>9}")
+    for size_mb in args.sizes:
+        text = generate_text(size_mb)
+        megabytes = len(text.encode('utf-8')) / (1024 * 1024)
+        runs = [("legacy", lambda: len(legacy_split(text, args.chunk_size, args.overlap)))]
+        for strategy in CHUNK_STRATEGIES:
+            runs.append((strategy, lambda strategy=strategy: sum(
+                1 for _ in iter_chunks(text, args.chunk_size, args.overlap, strategy))))
+            runs.append((f"{strategy}/stream", lambda strategy=strategy: sum(
+                1 for _ in iter_chunks(read_blocks(text, args.block_size), args.chunk_size, args.overlap, strategy))))
+        for name, run in runs:
+            seconds, chunks = measure(run)
+            print(f"{megabytes:>7.1f}M {name:>16} {chunks:>8} {seconds:>9.3f} {megabytes / seconds:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+import asyncio
+import math
+from fnmatch import fnmatchcase
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+# In-process stand-in for the Elasticsearch client, so benchmarks run offline.
+# It implements the part of the elasticsearch-py surface the storage code calls
+# (ping, indices.exists/create/open/close, index, bulk, search, msearch,
+# delete_by_query) and the query shapes it sends: match on "data" scored with
+# BM25, terms with collapse, match_all, timestamp ranges, sort, size and max
+# aggregations, and comma-separated or wildcard multi-index searches with max
+# aggregations or a terms/top_hits aggregation on _index.
+
+TOKEN_PATTERN = re.compile(r"\w+")
+FIELD_SCRIPT_PATTERN = re.compile(r"doc\['(\w+)'\]")
+BM25_K1 = 1.2
+BM25_B = 0.75
+KEYWORD_FIELDS = ("unique_id", "chunk_id", "domain", "model")  # Indexed for terms queries
+
+def analyze(text):
+    """Split text into lowercase terms, roughly as the standard analyzer does."""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+def _parse_timestamp(value):
+    """Return an ISO timestamp as epoch milliseconds, treating naive times as UTC."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)  # Dates are stored with millisecond precision
+
+class IndexNotFoundError(Exception):
+    """Raised for requests against a missing index, like the client's NotFoundError."""
+
+class _FakeIndex:
+    """The documents of one index and an inverted index over their "data" field."""
+
+    def __init__(self, mappings=None):
+        self.mappings = mappings or {}
+        self.documents = {}
+        self.postings = defaultdict(dict)  # term -> {document id: term frequency}
+        self.keywords = {field: defaultdict(set) for field in KEYWORD_FIELDS}  # field -> value -> document ids
+        self.lengths = {}
+        self.total_length = 0
+
+    def put(self, document_id, source):
+        self.remove(document_id)
+        self.documents[document_id] = source
+        for field, values in self.keywords.items():
+            if field in source:
+                values[str(source[field])].add(document_id)
+        terms = Counter(analyze(source.get('data', '')))
+        for term, frequency in terms.items():
+            self.postings[term][document_id] = frequency
+        length = sum(terms.values())
+        self.lengths[document_id] = length
+        self.total_length += length
+
+    def remove(self, document_id):
+        source = self.documents.pop(document_id, None)
+        if source is None:
+            return False
+        for field, values in self.keywords.items():
+            if field in source:
+                matches = values[str(source[field])]
+                matches.discard(document_id)
+                if not matches:
+                    del values[str(source[field])]
+        for term in set(analyze(source.get('data', ''))):
+            postings = self.postings[term]
+            postings.pop(document_id, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(document_id)
+        return True
+
+    def match(self, text):
+        """Return {document id: BM25 score} of the documents sharing a term with text."""
+        scores = defaultdict(float)
+        count = len(self.documents)
+        if not count:
+            return scores
+        average_length = self.total_length / count or 1
+        for term in set(analyze(text)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for document_id, frequency in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[document_id] / average_length)
+                scores[document_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return scores
+
+    def query(self, query):
+        """Return {document id: score} of the documents matching a query clause."""
+        if not query or 'match_all' in query:
+            return dict.fromkeys(self.documents, 1.0)
+        if 'match' in query:
+            (field, value), = query['match'].items()
+            if isinstance(value, dict):
+                value = value['query']
+            if field == 'data':
+                return self.match(value)
+            terms = set(analyze(value))
+            return {document_id: 1.0 for document_id, source in self.documents.items()
+                    if terms & set(analyze(source.get(field, '')))}
+        if 'terms' in query or 'term' in query:
+            if 'terms' in query:
+                (field, values), = query['terms'].items()
+            else:
+                (field, value), = query['term'].items()
+                values = [value['value'] if isinstance(value, dict) else value]
+            values = {str(value) for value in values}
+            if field in self.keywords:
+                return {document_id: 1.0 for value in values for document_id in self.keywords[field].get(value, ())}
+            return {document_id: 1.0 for document_id, source in self.documents.items()
+                    if str(source.get(field)) in values}
+        if 'range' in query:
+            (field, bounds), = query['range'].items()
+            if field != 'timestamp':
+                raise ValueError(f"Unsupported range field: {field}")
+            low, high = float(bounds.get('gte', -math.inf)), float(bounds.get('lte', math.inf))
+            return {document_id: 1.0 for document_id, source in self.documents.items()
+                    if field in source and low <= _parse_timestamp(source[field]) <= high}
+        raise ValueError(f"Unsupported query: {sorted(query)}")
+
+    def aggregate(self, aggregations, document_ids=None):
+        """Compute max aggregations over the given documents (every document by default)."""
+        documents = list(self.documents.values()) if document_ids is None else [
+            self.documents[document_id] for document_id in document_ids]
+        results = {}
+        for name, aggregation in aggregations.items():
+            if 'max' not in aggregation:
+                raise ValueError(f"Unsupported aggregation: {sorted(aggregation)}")
+            spec = aggregation['max']
+            if 'script' in spec:
+                script = spec['script']
+                source = script['source'] if isinstance(script, dict) else script
+                field = FIELD_SCRIPT_PATTERN.search(source).group(1)
+                values = [int(document[field]) for document in documents if field in document]
+            else:
+                field = spec['field']
+                values = [_parse_timestamp(document[field]) if field == 'timestamp' else float(document[field])
+                          for document in documents if field in document]
+            results[name] = {'value': max(values) if values else None}
+        return results
+
+    def search(self, body):
+        scores = self.query(body.get('query'))
+        hits = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        for sort in reversed(body.get('sort', [])):
+            (field, order), = sort.items()
+            descending = (order.get('order') if isinstance(order, dict) else order) == 'desc'
+            hits.sort(key=lambda item: str(self.documents[item[0]].get(field, '')), reverse=descending)
+        if 'collapse' in body:
+            field = body['collapse']['field']
+            seen = set()
+            collapsed = []
+            for document_id, score in hits:
+                value = self.documents[document_id].get(field)
+                if value not in seen:
+                    seen.add(value)
+                    collapsed.append((document_id, score))
+            hits = collapsed
+        size = body.get('size', 10)
+        response = {
+            'hits': {
+                'total': {'value': len(hits), 'relation': 'eq'},
+                'hits': [{'_id': document_id, '_score': score, '_source': self.documents[document_id]}
+                         for document_id, score in hits[:size]],
+            }
+        }
+        if 'aggs' in body or 'aggregations' in body:
+            response['aggregations'] = self.aggregate(body.get('aggs') or body['aggregations'], scores)
+        return response
+
+class _FakeIndicesClient:
+    """The indices namespace of FakeElasticsearch."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def exists(self, index, **kwargs):
+        self._client._request()
+        return bool(self._client._resolve(index))
+
+    def create(self, index, body=None, mappings=None, **kwargs):
+        self._client._request()
+        with self._client._lock:
+            if index in self._client._indices:
+                raise ValueError(f"resource_already_exists_exception: {index}")
+            self._client._indices[index] = _FakeIndex((body or {}).get('mappings', mappings))
+        return {'acknowledged': True, 'index': index}
+
+    def delete(self, index, **kwargs):
+        self._client._request()
+        with self._client._lock:
+            self._client._indices.pop(index, None)
+        return {'acknowledged': True}
+
+    def open(self, index, **kwargs):
+        self._client._request()
+        return {'acknowledged': True}
+
+    def close(self, index, **kwargs):
+        self._client._request()
+        return {'acknowledged': True}
+
+    def refresh(self, index=None, **kwargs):
+        self._client._request()
+        return {}
+
+class FakeElasticsearch:
+    """
+    Thread-safe in-memory Elasticsearch client with the methods the storage code calls.
+
+    Writes are visible immediately, as if every request refreshed. A fixed latency
+    can be added to every request to model the network round trip of a real
+    cluster; requests are counted in self.requests.
+    """
+
+    def __init__(self, latency=0.0):
+        """
+        Args:
+            latency (float): Seconds each request sleeps before it is served.
+        """
+        self.latency = latency
+        self.requests = 0
+        self.rejections = {}  # document id -> [status, bulk index actions left to reject (None = all)]
+        self.indices = _FakeIndicesClient(self)
+        self._indices = {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        # Requests served for AsyncFakeElasticsearch have already awaited the latency
+        if self.latency and not getattr(self._local, 'awaited', False):
+            time.sleep(self.latency)
+
+    def _get_index(self, index, create=False):
+        found = self._indices.get(index)
+        if found is None:
+            if not create:
+                raise IndexNotFoundError(f"index_not_found_exception: no such index [{index}]")
+            found = self._indices[index] = _FakeIndex()
+        return found
+
+    def reject(self, document_id, status=429, times=1):
+        """
+        Make _bulk index actions for a document fail, as a cluster does under load or for a mapping error.
+
+        Args:
+            document_id (str): The _id of the document, e.g. a chunk_id.
+            status (int): The status of the rejected items (429 is retried by the storage code).
+            times (int): The number of actions to reject, or None to reject every one.
+        """
+        with self._lock:
+            self.rejections[str(document_id)] = [status, times]
+
+    def _rejected(self, document_id):
+        """Return the status to reject a bulk index action with, or None to accept it."""
+        rejection = self.rejections.get(document_id)
+        if rejection is None:
+            return None
+        status, times = rejection
+        if times is not None:
+            rejection[1] -= 1
+            if rejection[1] <= 0:
+                del self.rejections[document_id]
+        return status
+
+    def _resolve(self, index):
+        """Return the names of the existing indexes a comma-separated list of names or wildcards refers to."""
+        names = []
+        for pattern in index.split(','):
+            if '*' in pattern:
+                names.extend(sorted(name for name in self._indices if fnmatchcase(name, pattern)))
+            elif pattern in self._indices:
+                names.append(pattern)
+        return names
+
+    def ping(self, **kwargs):
+        self._request()
+        return True
+
+    def index(self, index, id=None, body=None, document=None, **kwargs):
+        self._request()
+        with self._lock:
+            self._get_index(index, create=True).put(str(id), dict(document if document is not None else body))
+        return {'_index': index, '_id': str(id), 'result': 'created'}
+
+    def bulk(self, operations=None, body=None, refresh=False, **kwargs):
+        self._request()
+        operations = operations if operations is not None else body
+        items = []
+        errors = False
+        with self._lock:
+            position = 0
+            while position < len(operations):
+                (action, meta), = operations[position].items()
+                target = self._get_index(meta['_index'], create=True)
+                if action == 'delete':
+                    found = target.remove(str(meta['_id']))
+                    items.append({action: {'_id': meta['_id'], 'status': 200 if found else 404}})
+                    position += 1
+                    continue
+                source = operations[position + 1]
+                position += 2
+                status = self._rejected(str(meta['_id']))
+                if status is not None:
+                    errors = True
+                    error_type = 'es_rejected_execution_exception' if status == 429 else 'document_parsing_exception'
+                    items.append({action: {'_id': meta['_id'], 'status': status,
+                                           'error': {'type': error_type, 'reason': f"rejected [{meta['_id']}]"}}})
+                    continue
+                target.put(str(meta['_id']), dict(source.get('doc', source) if action == 'update' else source))
+                items.append({action: {'_id': meta['_id'], 'status': 201}})
+        return {'errors': errors, 'items': items}
+
+    def search(self, index=None, body=None, ignore_unavailable=False, **kwargs):
+        self._request()
+        return self._search(index, dict(body or {}, **kwargs), ignore_unavailable)
+
+    def _search(self, index, body, ignore_unavailable=False):
+        with self._lock:
+            if '*' in index:
+                return self._search_many(self._resolve(index), body, ignore_unavailable)
+            if ',' in index or ignore_unavailable:
+                # Federated searches go through the multi-index path even when they cover one index
+                return self._search_many(index.split(','), body, ignore_unavailable)
+            return self._get_index(index).search(body)
+
+    def _search_many(self, index_names, body, ignore_unavailable):
+        """Search several indexes, supporting max aggregations and the terms aggregation on _index with a top_hits sub-aggregation."""
+        hits = []
+        matches = {}
+        for name in index_names:
+            if name not in self._indices and ignore_unavailable:
+                continue
+            target = self._get_index(name)
+            matches[name] = target.query(body.get('query'))
+            hits.extend({'_index': name, '_id': document_id, '_score': score, '_source': target.documents[document_id]}
+                        for document_id, score in matches[name].items())
+        hits.sort(key=lambda hit: hit['_score'], reverse=True)
+        response = {'hits': {'total': {'value': len(hits), 'relation': 'eq'}, 'hits': hits[:body.get('size', 10)]}}
+        aggregations = body.get('aggs') or body.get('aggregations')
+        if aggregations:
+            response['aggregations'] = {}
+            for name, aggregation in aggregations.items():
+                if 'max' in aggregation:
+                    values = [self._indices[index_name].aggregate({name: aggregation}, found)[name]['value']
+                              for index_name, found in matches.items()]
+                    values = [value for value in values if value is not None]
+                    response['aggregations'][name] = {'value': max(values) if values else None}
+                    continue
+                if aggregation.get('terms', {}).get('field') != '_index':
+                    raise ValueError(f"Unsupported multi-index aggregation: {sorted(aggregation)}")
+                (sub_name, sub_aggregation), = (aggregation.get('aggs') or aggregation['aggregations']).items()
+                size = sub_aggregation['top_hits'].get('size', 3)
+                groups = defaultdict(list)
+                for hit in hits:
+                    groups[hit['_index']].append(hit)
+                buckets = sorted(groups.items(), key=lambda item: len(item[1]), reverse=True)
+                response['aggregations'][name] = {'buckets': [
+                    {'key': index_name, 'doc_count': len(group),
+                     sub_name: {'hits': {'total': {'value': len(group), 'relation': 'eq'}, 'hits': group[:size]}}}
+                    for index_name, group in buckets[:aggregation['terms'].get('size', 10)]
+                ]}
+        return response
+
+    def msearch(self, searches=None, body=None, **kwargs):
+        self._request()
+        searches = searches if searches is not None else body
+        responses = []
+        for header, search_body in zip(searches[::2], searches[1::2]):
+            try:
+                responses.append(self._search(header.get('index', kwargs.get('index')), search_body))
+            except Exception as e:
+                responses.append({'error': {'type': type(e).__name__, 'reason': str(e)}, 'status': 404})
+        return {'responses': responses}
+
+    def delete_by_query(self, index, body=None, query=None, **kwargs):
+        self._request()
+        with self._lock:
+            target = self._get_index(index)
+            matched = list(target.query((body or {}).get('query', query)))
+            for document_id in matched:
+                target.remove(document_id)
+        return {'deleted': len(matched), 'failures': []}
+
+    def count(self, index, body=None, **kwargs):
+        self._request()
+        with self._lock:
+            return {'count': len(self._get_index(index).query((body or {}).get('query')))}
+
+    def close(self):
+        pass
+
+class AsyncFakeElasticsearch:
+    """Async counterpart of FakeElasticsearch, sharing the indexes of a sync instance."""
+
+    def __init__(self, client):
+        """
+        Args:
+            client (FakeElasticsearch): The instance whose indexes are served.
+        """
+        self._client = client
+
+    async def _serve(self, method, *args, **kwargs):
+        # The latency is awaited, so concurrent requests overlap as they would over the network
+        if self._client.latency:
+            await asyncio.sleep(self._client.latency)
+        self._client._local.awaited = True
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._client._local.awaited = False
+
+    async def ping(self, **kwargs):
+        return await self._serve(self._client.ping, **kwargs)
+
+    async def search(self, index=None, body=None, **kwargs):
+        return await self._serve(self._client.search, index, body, **kwargs)
+
+    async def msearch(self, searches=None, body=None, **kwargs):
+        return await self._serve(self._client.msearch, searches, body, **kwargs)
+
+    async def close(self):
+        pass
@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.faiss_storage import (create_faiss_index, save_batch_to_faiss, upgrade_index_if_needed, apply_search_params,
+                                   estimate_index_memory, fit_to_dimension, PRECISIONS)
+from storage.docstore import get_docstore
+from utils.chunker import iter_chunks
+from utils.embedder import get_embedder, get_domain_embedder
+from utils.logger import configure_logging
+
+# Recall versus memory of the vector storage precisions, to pick one per domain
+# (index_params "precision" and "rerank"). The same vectors are stored in flat,
+# HNSW and IVF indexes at each precision, and each is searched with and without
+# exact re-ranking; recall@k is measured against an exact float32 search.
+# Run on synthetic chunks with:
+#   python benchmarks/precision_benchmark.py --documents 5000
+# or on the chunks of an existing domain with:
+#   python benchmarks/precision_benchmark.py --domain news --model minilm
+
+def load_domain_texts(domain_name, model_name):
+    """Return the chunk texts of a domain from its docstore."""
+    texts = []
+    for _, batch in get_docstore(domain_name, model_name).iter_texts():
+        texts.extend(batch)
+    if not texts:
+        raise ValueError(f"Domain {domain_name} with model {model_name} has no chunks.")
+    return texts
+
+def sample_queries(texts, count, seed=1):
+    """Use the first words of randomly chosen chunks as queries."""
+    rng = random.Random(seed)
+    return [' '.join(text.split()[:rng.randint(3, 10)]) for text in rng.choices(texts, k=count)]
+
+def build_index(vectors, index_type, precision, params):
+    """Store vectors (FAISS ID = row) in an index built as a domain would build it."""
+    params = {**params, "precision": precision, "upgrade_threshold": 0}
+    index = create_faiss_index(vectors.shape[1], index_type, params)
+    for start in range(0, len(vectors), 10000):
+        save_batch_to_faiss(index, range(start, min(start + 10000, len(vectors))), vectors[start:start + 10000])
+    index = upgrade_index_if_needed(index, index_type, params)
+    apply_search_params(index, params)
+    return index
+
+def rerank(vectors, queries, candidates, k):
+    """Re-score candidate rows with exact float32 inner products, as RAGDomain does from the docstore."""
+    results = []
+    for query, row in zip(queries, candidates):
+        row = row[row != -1]
+        scores = vectors[row] @ query
+        results.append(row[np.argsort(-scores, kind='stable')[:k]])
+    return results
+
+def recall(results, exact, k):
+    """Return the fraction of the exact top k found in the results."""
+    return sum(len(set(found.tolist()) & set(truth.tolist())) for found, truth in zip(results, exact)) / (k * len(exact))
+
+def measure(index, vectors, queries, exact, k, rerank_factor):
+    """Search every query and return (recall@k, queries per second)."""
+    start = time.perf_counter()
+    _, candidates = index.search(queries, k * rerank_factor)
+    results = rerank(vectors, queries, candidates, k) if rerank_factor > 1 else list(candidates)
+    seconds = time.perf_counter() - start
+    return recall(results, exact, k), len(queries) / seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Report recall against memory for each vector storage precision.")
+    parser.add_argument("--documents", type=int, default=5000, help="Synthetic documents to chunk and embed")
+    parser.add_argument("--domain", help="Use the chunks of this domain instead of a synthetic corpus")
+    parser.add_argument("--model", help="The model of --domain")
+    parser.add_argument("--chunk-size", type=int, default=100, help="Words per synthetic chunk")
+    parser.add_argument("--overlap", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index-types", nargs="+", default=["flat", "hnsw", "ivf_flat"])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[1, 4], help="Re-ranking factors to compare")
+    parser.add_argument("--index-params", type=json.loads, default={},
+                        help='Index parameters as JSON, e.g. \'{"nprobe": 64, "ef_search": 128}\'')
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+    configure_logging("WARNING")
+
+    if args.domain:
+        if not args.model:
+            parser.error("--domain requires --model")
+        texts = load_domain_texts(args.domain, args.model)
+        embedder = get_domain_embedder(args.domain, args.model)
+        query_texts = sample_queries(texts, args.queries)
+    else:
+        from benchmarks.rag_benchmark import generate_corpus, generate_queries
+        texts = [text for document in generate_corpus(args.documents)
+                 for _, _, text in iter_chunks(document['data'], args.chunk_size, args.overlap)]
+        embedder = get_embedder()
+        query_texts = generate_queries(args.queries)
+
+    vectors = np.concatenate([embedder.embed_batch(texts[start:start + 10000])
+                              for start in range(0, len(texts), 10000)]).astype('float32', copy=False)
+    vectors = fit_to_dimension(vectors, embedder.dimension)
+    queries = fit_to_dimension(embedder.embed_batch(query_texts), embedder.dimension)
+    exact_index = faiss.IndexFlatIP(vectors.shape[1])
+    exact_index.add(vectors)
+    _, exact = exact_index.search(queries, args.k)
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, {len(queries)} queries, recall@{args.k}")
+
+    report = []
+    print(f"{'index':>9} {'precision':>9} {'rerank':>6} {'MB':>9} {'bytes/vec':>9} {'recall':>7} {'QPS':>9}")
+    for index_type in args.index_types:
+        for precision in PRECISIONS:
+            index = build_index(vectors, index_type, precision, args.index_params)
+            memory = estimate_index_memory(index)
+            for factor in args.rerank:
+                found, qps = measure(index, vectors, queries, exact, args.k, factor)
+                report.append({"index_type": index_type, "precision": precision, "rerank": factor,
+                               "memory_bytes": memory, "bytes_per_vector": memory / len(vectors),
+                               "recall": round(found, 4), "qps": round(qps, 1)})
+                print(f"{index_type:>9} {precision:>9} {factor:>6} {memory / (1024 * 1024):>9.2f} "
+                      f"{memory / len(vectors):>9.1f} {found:>7.3f} {qps:>9.1f}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"vectors": len(vectors), "dimension": vectors.shape[1], "k": args.k, "results": report}, file,
+                      indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# End-to-end benchmark of ingestion, search and the HTTP API on synthetic corpora,
+# against the in-process Elasticsearch of benchmarks/fake_elasticsearch.py so it
+# runs offline. Each corpus size runs in a fresh process with its own temporary
+# storage, so peak RSS is per size. Run with:
+#   python benchmarks/rag_benchmark.py --sizes 1000 5000 --baseline benchmarks/baseline.json
+# and refresh the baseline of a machine with --save-baseline benchmarks/baseline.json.
+
+STORAGE_PATHS = ("JSON_STORAGE_PATH", "FAISS_STORAGE_PATH", "FAISS_SHARD_PATH", "DOCSTORE_PATH",
+                 "DOMAIN_METADATA_PATH", "EMBEDDING_CACHE_PATH")
+DOMAIN_NAME = "bench"
+REBUILD_DOMAIN_NAME = "rebuild"
+MODEL_NAME = "synthetic"
+HIGHER_IS_BETTER = ("docs_per_second", "qps")  # Other metrics (latencies, RSS) regress when they grow
+
+def generate_vocabulary(size=30000, seed=0):
+    """Generate distinct pseudo-words, most frequent first."""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 10))))
+    return sorted(words, key=lambda word: (len(word), word))
+
+def zipf_weights(size, exponent=1.1):
+    return [1 / (rank ** exponent) for rank in range(1, size + 1)]
+
+def generate_corpus(count, mean_words=120, seed=0):
+    """
+    Generate documents of Zipf-distributed words with log-normal lengths.
+
+    Args:
+        count (int): The number of documents.
+        mean_words (int): The median document length in words.
+        seed (int): The random seed; the same seed gives the same corpus.
+
+    Returns:
+        list: The documents, as {"data": text}.
+    """
+    rng = random.Random(seed)
+    vocabulary = generate_vocabulary()
+    weights = zipf_weights(len(vocabulary))
+    documents = []
+    for _ in range(count):
+        length = max(5, int(rng.lognormvariate(0, 0.6) * mean_words))
+        words = rng.choices(vocabulary, weights, k=length)
+        sentences = []
+        for start in range(0, length, 15):
+            sentences.append(' '.join(words[start:start + 15]).capitalize() + '.')
+        documents.append({"data": ' '.join(sentences)})
+    return documents
+
+def generate_queries(count, seed=1):
+    """Generate distinct two to four word queries from the mid-frequency words, so no result is cached."""
+    rng = random.Random(seed)
+    vocabulary = generate_vocabulary()[100:5000]
+    queries = set()
+    while len(queries) < count:
+        queries.add(' '.join(rng.sample(vocabulary, rng.randint(2, 4))))
+    return sorted(queries)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(latencies, seconds, items=None, rate="qps"):
+    """Return the throughput and p50/p99 latency, in milliseconds, of timed calls."""
+    items = len(latencies) if items is None else items
+    return {
+        rate: round(items / seconds, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process, in megabytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def timed_calls(call, arguments):
+    """Call call(argument) for each argument in turn. Returns (latencies, total seconds)."""
+    latencies = []
+    start = time.perf_counter()
+    for argument in arguments:
+        call_start = time.perf_counter()
+        call(argument)
+        latencies.append(time.perf_counter() - call_start)
+    return latencies, time.perf_counter() - start
+
+def isolate_storage(directory):
+    """Point every storage path of utils.config into directory. Must run before other project imports."""
+    import utils.config as config
+    for name in STORAGE_PATHS:
+        path = os.path.join(directory, name.lower())
+        os.makedirs(path, exist_ok=True)
+        setattr(config, name, path)
+
+def install_fake_elasticsearch(latency):
+    """Make domains and federated searches use a FakeElasticsearch (and its async counterpart) instead of a cluster."""
+    from benchmarks.fake_elasticsearch import FakeElasticsearch, AsyncFakeElasticsearch
+    import rag_manager.domain
+    import rag_manager.manager
+    es = FakeElasticsearch(latency)
+    async_es = AsyncFakeElasticsearch(es)
+    for module in (rag_manager.domain, rag_manager.manager):
+        module.get_elasticsearch_client = lambda: es
+        module.get_async_elasticsearch_client = lambda: async_es
+    return es
+
+async def asgi_request(app, method, path, payload):
+    """Send one request to an ASGI app in process. Returns (status, body)."""
+    body = json.dumps(payload).encode('utf-8')
+    received = []
+    sent = []
+
+    async def receive():
+        if received:
+            return {'type': 'http.disconnect'}
+        received.append(True)
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({'type': 'http', 'method': method, 'path': path, 'headers': []}, receive, send)
+    return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+def bench_asgi_generate_prompt(app, queries, concurrency):
+    """Run /generate_prompt through the ASGI app with concurrency requests in flight."""
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def request(query):
+            async with semaphore:
+                start = time.perf_counter()
+                status, body = await asgi_request(app, 'POST', '/generate_prompt',
+                                                  {"domain_name": DOMAIN_NAME, "model_name": MODEL_NAME,
+                                                   "query": query, "mode": "hybrid"})
+                if status != 200:
+                    raise RuntimeError(f"/generate_prompt failed with {status}: {body[:200]!r}")
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(request(query) for query in queries))
+        return latencies, time.perf_counter() - start
+
+    latencies, seconds = asyncio.run(run())
+    return summarize(latencies, seconds)
+
+def run_size(size, options):
+    """
+    Run every benchmark phase on a corpus of size documents, in this process.
+
+    Args:
+        size (int): The number of documents ingested with add_data_batch and rebuilt by sync_json_to_es_faiss.
+        options (dict): The command line options.
+
+    Returns:
+        dict: The metrics of each phase and the peak RSS.
+    """
+    from utils.logger import configure_logging
+    configure_logging(options["log_level"])
+    es = install_fake_elasticsearch(options["es_latency_ms"] / 1000)
+    import wrapper.api_wrapper
+    import wrapper.asgi_app
+    from storage.json_storage import save_batch_to_json
+    from utils.helpers import sync_json_to_es_faiss
+
+    manager = wrapper.api_wrapper.manager
+    results = {}
+    corpus = generate_corpus(size, options["mean_words"], seed=size)
+    count = options["queries"]
+    queries = generate_queries(4 * count + options["add_data"], seed=size)
+    search_queries, embedding_queries, flask_queries, asgi_queries = (queries[i * count:(i + 1) * count]
+                                                                      for i in range(4))
+    add_queries = queries[4 * count:]
+
+    domain = manager.add_domain(DOMAIN_NAME, MODEL_NAME)
+    batch_size = options["batch_size"]
+    batches = [corpus[start:start + batch_size] for start in range(0, len(corpus), batch_size)]
+    _, seconds = timed_calls(domain.add_data_batch, batches)
+    results["add_data_batch"] = {"docs_per_second": round(size / seconds, 2)}
+
+    documents = [{"data": query} for query in add_queries]
+    latencies, seconds = timed_calls(domain.add_data, documents)
+    results["add_data"] = summarize(latencies, seconds, rate="docs_per_second")
+
+    latencies, seconds = timed_calls(lambda query: domain.text_search(query, options["k"]), search_queries)
+    results["text_search"] = summarize(latencies, seconds)
+    latencies, seconds = timed_calls(lambda query: domain.embedding_search(query, options["k"]), embedding_queries)
+    results["embedding_search"] = summarize(latencies, seconds)
+
+    # A rebuild of a different corpus of the same size, so no embedding is already cached
+    rebuild = generate_corpus(size, options["mean_words"], seed=size + 1)
+    timestamp = "2024-01-01T00:00:00"
+    for unique_id, document in enumerate(rebuild, 1):
+        document.update(unique_id=unique_id, domain=REBUILD_DOMAIN_NAME, timestamp=timestamp)
+    save_batch_to_json(rebuild, REBUILD_DOMAIN_NAME)
+    start = time.perf_counter()
+    sync_json_to_es_faiss(es, REBUILD_DOMAIN_NAME, MODEL_NAME, batch_size=options["batch_size"])
+    results["sync_json_to_es_faiss"] = {"docs_per_second": round(size / (time.perf_counter() - start), 2)}
+
+    client = wrapper.api_wrapper.app.test_client()
+
+    def post(path, payload):
+        response = client.post(path, json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} failed with {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+    latencies, seconds = timed_calls(
+        lambda query: post('/generate_prompt', {"domain_name": DOMAIN_NAME, "model_name": MODEL_NAME,
+                                                "query": query, "mode": "hybrid", "k": options["k"]}),
+        flask_queries)
+    results["http_generate_prompt"] = summarize(latencies, seconds)
+    http_documents = [f"{query} {query}" for query in add_queries]
+    latencies, seconds = timed_calls(
+        lambda document: post('/add_data', {"domain_name": DOMAIN_NAME, "model_name": MODEL_NAME,
+                                            "document": document}),
+        http_documents)
+    results["http_add_data"] = summarize(latencies, seconds, rate="docs_per_second")
+
+    # The ASGI app has its own manager, which loads the domain from the index saved here
+    manager.flush()
+    results["asgi_generate_prompt"] = bench_asgi_generate_prompt(wrapper.asgi_app.app, asgi_queries,
+                                                                 options["concurrency"])
+    wrapper.asgi_app.manager.shutdown()
+    manager.shutdown()
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+def _run_size_process(connection, size, options, directory):
+    try:
+        isolate_storage(directory)
+        connection.send(("ok", run_size(size, options)))
+    except BaseException:
+        connection.send(("error", traceback.format_exc()))
+    finally:
+        connection.close()
+
+def measure_size(size, options):
+    """Run run_size in a fresh spawned process with temporary storage, so memory and caches start cold."""
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    with tempfile.TemporaryDirectory(prefix="rag-benchmark-") as directory:
+        process = context.Process(target=_run_size_process, args=(sender, size, options, directory))
+        process.start()
+        sender.close()
+        try:
+            status, payload = receiver.recv()
+        except EOFError:
+            status, payload = "error", "the benchmark process exited without a result"
+        process.join()
+    if status != "ok":
+        raise RuntimeError(f"Benchmark of {size} documents failed:\n{payload}")
+    return payload
+
+def median_results(runs):
+    """Return the median of each metric over the results of repeated runs."""
+    median = {}
+    for phase, metrics in runs[0].items():
+        if isinstance(metrics, dict):
+            median[phase] = {metric: statistics.median(run[phase][metric] for run in runs) for metric in metrics}
+        else:
+            median[phase] = statistics.median(run[phase] for run in runs)
+    return median
+
+def flatten(results):
+    """Return {(size, phase, metric): value} of nested results."""
+    flat = {}
+    for size, phases in results.items():
+        for phase, metrics in phases.items():
+            if isinstance(metrics, dict):
+                for metric, value in metrics.items():
+                    flat[(size, phase, metric)] = value
+            else:
+                flat[(size, phase, phase)] = metrics
+    return flat
+
+def compare(results, baseline, tolerance, tail_tolerance):
+    """
+    Compare results with a baseline.
+
+    A throughput more than tolerance below the baseline, or a latency or RSS more
+    than tolerance above it, is a regression. p99 latencies of a few hundred calls
+    are noisy, so they are held to tail_tolerance instead. Metrics missing from
+    either side are not compared.
+
+    Args:
+        results (dict): The results, by size, phase and metric.
+        baseline (dict): The baseline results, in the same layout.
+        tolerance (float): The allowed relative change, e.g. 0.25.
+        tail_tolerance (float): The allowed relative change of p99 latencies.
+
+    Returns:
+        list: (size, phase, metric, value, baseline value, relative change, regressed) rows.
+    """
+    rows = []
+    reference = flatten(baseline)
+    for key, value in flatten(results).items():
+        if key not in reference or not reference[key]:
+            continue
+        size, phase, metric = key
+        expected = reference[key]
+        change = (value - expected) / expected
+        if metric in HIGHER_IS_BETTER:
+            regressed = change < -tolerance
+        else:
+            regressed = change > (tail_tolerance if metric == "p99_ms" else tolerance)
+        rows.append((size, phase, metric, value, expected, change, regressed))
+    return rows
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, search and the HTTP API offline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000], help="Corpus sizes, in documents")
+    parser.add_argument("--mean-words", type=int, default=120, help="Median document length, in words")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per search phase")
+    parser.add_argument("--add-data", type=int, default=100, help="Documents added one at a time, per add phase")
+    parser.add_argument("--batch-size", type=int, default=500, help="Documents per add_data_batch call")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=16, help="ASGI requests in flight")
+    parser.add_argument("--es-latency-ms", type=float, default=0.0,
+                        help="Simulated round trip of each Elasticsearch request")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size; the median of each metric is reported")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with a baseline file and exit with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative change from the baseline")
+    parser.add_argument("--tail-tolerance", type=float, default=1.0, help="Allowed relative change of p99 latencies")
+    parser.add_argument("--save-baseline", help="Write the results as a baseline file")
+    args = parser.parse_args()
+    options = {name: getattr(args, name) for name in ("mean_words", "queries", "add_data", "batch_size", "k",
+                                                      "concurrency", "es_latency_ms", "log_level")}
+
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = median_results([measure_size(size, options) for _ in range(args.repeat)])
+        print(f"{size} documents:")
+        for phase, metrics in results[str(size)].items():
+            if isinstance(metrics, dict):
+                print(f"  {phase:<24} " + "  ".join(f"{metric}={value}" for metric, value in metrics.items()))
+            else:
+                print(f"  {phase:<24} {metrics}")
+
+    report = {"environment": environment(), "options": options, "results": results}
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("options") != options:
+            print("Warning: the baseline was recorded with different options.")
+        rows = compare(results, baseline["results"], args.tolerance, args.tail_tolerance)
+        regressions = [row for row in rows if row[-1]]
+        print(f"\n{'size':>6} {'phase':<24} {'metric':<16} {'value':>10} {'baseline':>10} {'change':>8}")
+        for size, phase, metric, value, expected, change, regressed in rows:
+            print(f"{size:>6} {phase:<24} {metric:<16} {value:>10} {expected:>10} {change:>+8.1%}"
+                  + ("  REGRESSION" if regressed else ""))
+        print(f"\n{len(regressions)} of {len(rows)} metrics regressed.")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,10 @@
-from wrapper.api_wrapper import app
+import sys
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000)
+    if "--asgi" in sys.argv:
+        # Async server: concurrent searches on one event loop
+        import uvicorn
+        uvicorn.run("wrapper.asgi_app:app", host='0.0.0.0', port=5000)
+    else:
+        from wrapper.api_wrapper import app
+        app.run(host='0.0.0.0', port=5000)
@@ -1,53 +1,295 @@
-from utils.helpers import sync_json_to_es_faiss, split_text_into_chunks
-from storage.json_storage import save_to_json
-from storage.faiss_storage import save_to_faiss, get_top_k_from_faiss, generate_fake_embeddings
-from storage.elastic_storage import save_to_elasticsearch, text_search, initialize_elasticsearch, get_all_documents
-from utils.id_generator import generate_unique_id
+import asyncio
+import threading
+from utils.helpers import (sync_json_to_es_faiss, sync_log_range, get_domain_index_config, get_sync_checkpoint,
+                           upgrade_domain_index, save_domain_index, load_read_only_index)
+from utils.id_generator import get_id_allocator
+from utils.config import INGEST_BATCH_SIZE, LOG_SAMPLE_EVERY, RERANK_FACTOR
+from utils.embedder import get_domain_embedder
+from utils.locks import ReadWriteLock
+from utils.logger import get_logger
+from search.embedding_search import (search_neighbours_batch, embed_queries, rerank_neighbours, dedupe_neighbours,
+                                     resolve_chunks, faiss_executor)
+from search.coalescer import SearchCoalescer
+from search.hybrid_search import hybrid_search, hybrid_search_batch, hybrid_search_async
+from search.query_cache import query_cache
+from search.text_search import text_search, text_search_batch, async_text_search, scored_documents
+from storage.json_storage import save_to_json, save_batch_to_json
+from storage.faiss_storage import estimate_index_memory, compact_index, supports_remove
+from storage.faiss_shards import ShardedIndex
+from storage.docstore import get_docstore, split_chunk_faiss_id
+from storage.elastic_storage import get_elasticsearch_client, get_async_elasticsearch_client
 from datetime import datetime
 
+logger = get_logger(__name__)
+
 class RAGDomain:
-    def __init__(self, domain_name: str, model_name: str, chunk_size=500, overlap=50, embedding_size=128):
-        """Initialize a domain with Elasticsearch collections and FAISS index."""
+    def __init__(self, domain_name: str, model_name: str, chunk_size=500, overlap=50, embedding_size=128, batch_size=INGEST_BATCH_SIZE,
+                 index_type=None, index_params=None, read_only=False):
+        """
+        Initialize a domain with Elasticsearch collections and FAISS index.
+
+        A read_only domain memory-maps its saved FAISS index instead of syncing and
+        loading it into RAM; it serves searches but rejects writes.
+        """
         self.domain_name = domain_name
         self.model_name = model_name
         self.chunk_size = chunk_size
         self.overlap = overlap 
-        self.faiss_index, self.es, self.embedding_size = self.load(embedding_size)
+        self.batch_size = batch_size
+        self.read_only = read_only
+        # Searches and saves hold the read side; ingestion and index upgrades hold the write side
+        self.lock = ReadWriteLock()
+        self._save_lock = threading.Lock()
+        self.dirty = False  # FAISS has writes that are not saved to disk yet
+        # Concurrent embedding searches share batched FAISS searches
+        self.coalescer = SearchCoalescer(self._search_neighbours_batch, faiss_executor, name=f"{domain_name}_{model_name}")
+        self.faiss_index, self.es, self.embedding_size = self.load(embedding_size, index_type, index_params)
+        self.docstore = get_docstore(domain_name, model_name)
+        self.embedder = get_domain_embedder(domain_name, model_name, self.embedding_size)
+        self.index_type, self.index_params = get_domain_index_config(domain_name, model_name)
+        if not read_only:
+            self.sync_offset = get_sync_checkpoint(domain_name, model_name)[0] or 0
 
-    def load(self, embedding_size=128):
+    def load(self, embedding_size=128, index_type=None, index_params=None):
         """Load data from JSON to Elasticsearch and FAISS."""
-        es = initialize_elasticsearch()
-        faiss_index, es, embedding_size = sync_json_to_es_faiss(es, self.domain_name, self.model_name, embedding_size)
+        es = get_elasticsearch_client()
+        if self.read_only:
+            faiss_index, self.sync_offset = load_read_only_index(self.domain_name, self.model_name)
+            return faiss_index, es, faiss_index.d
+        faiss_index, es, embedding_size = sync_json_to_es_faiss(es, self.domain_name, self.model_name, embedding_size, self.batch_size,
+                                                                index_type, index_params, self.chunk_size, self.overlap)
         return faiss_index, es, embedding_size
 
+    def _ingest(self):
+        """
+        Writes every document logged since the last checkpoint to Elasticsearch and FAISS.
+
+        This also picks up documents logged through other models of the domain, and
+        upgrades the FAISS index once it outgrows flat search. The index is saved
+        later, by flush, rather than after every write. If ingestion fails, the
+        next call resumes after the last group that was fully written.
+        """
+        self._check_writable()
+        with self.lock.write():
+            try:
+                chunks, self.sync_offset = sync_log_range(self.es, self.faiss_index, self.domain_name, self.model_name,
+                                                          self.sync_offset, None, self.chunk_size, self.overlap,
+                                                          self.batch_size, self.embedder)
+            except Exception:
+                self.sync_offset = get_sync_checkpoint(self.domain_name, self.model_name)[0] or self.sync_offset
+                self.dirty = True
+                raise
+            self.dirty = self.dirty or chunks > 0
+            self.faiss_index = upgrade_domain_index(self.faiss_index, self.domain_name, self.model_name,
+                                                    self.index_type, self.index_params, self.sync_offset)
+        query_cache.invalidate_domain(self.domain_name, self.model_name)
+        return chunks
+
+    def save(self):
+        """Saves the FAISS index to disk together with the log offset it covers."""
+        if self.read_only:
+            return
+        with self._save_lock, self.lock.read():
+            self.dirty = False
+            save_domain_index(self.faiss_index, self.domain_name, self.model_name, self.sync_offset)
+
+    def flush(self):
+        """Saves the FAISS index if it has unsaved writes. Returns True if it was saved."""
+        if not self.dirty:
+            return False
+        self.save()
+        return True
+
+    def close(self):
+        """Stops the shard processes of a sharded index."""
+        if isinstance(self.faiss_index, ShardedIndex):
+            self.faiss_index.close()
+
+    def memory_usage(self):
+        """Returns the approximate memory held by the domain's FAISS index, in bytes."""
+        if self.read_only:
+            # Memory-mapped pages belong to the shared page cache, not to this process
+            return 0
+        return estimate_index_memory(self.faiss_index)
+
+    @property
+    def index_name(self):
+        """The Elasticsearch index of the domain-model pair."""
+        return f"{self.domain_name}_{self.model_name}".lower()
+
+    def _check_writable(self):
+        """Raises ValueError for a read-only domain, before anything is logged."""
+        if self.read_only:
+            raise ValueError(f"Domain {self.domain_name} with model {self.model_name} is read-only.")
+
     def add_data(self, document: dict):
         """Adds a document to JSON, then to Elasticsearch and FAISS."""
-        print("i'm here")
+        self._check_writable()
         document['domain'] = self.domain_name
         document['timestamp'] = datetime.utcnow().isoformat()
+        document['unique_id'] = get_id_allocator(self.domain_name, self.es).next_id()
         save_to_json(document, self.domain_name)
-        unique_id = generate_unique_id(self.es, f"{self.domain_name}_{self.model_name}".lower())
+        self._ingest()
+        logger.debug("Document added", domain=self.domain_name, model=self.model_name,
+                     unique_id=document['unique_id'], every=LOG_SAMPLE_EVERY)
+
+    def delete_document(self, unique_id):
+        """
+        Deletes a document from Elasticsearch and the docstore, logging the delete.
+
+        Its FAISS vectors are tombstoned and filtered out of searches until the
+        index is compacted. Documents logged by other models of the domain are
+        ingested first, so a document that is logged but not yet ingested is found.
+
+        Returns:
+            bool: False if the domain has no such document.
+        """
+        unique_id = str(unique_id)
+        self._ingest()
+        if not self.docstore.has_document(unique_id):
+            return False
+        save_to_json({'op': 'delete', 'unique_id': unique_id, 'domain': self.domain_name,
+                      'timestamp': datetime.utcnow().isoformat()}, self.domain_name)
+        self._ingest()
+        return True
+
+    def update_document(self, unique_id, document: dict):
+        """
+        Replaces a document, keeping its unique_id, by logging a delete followed by the new version.
+
+        The old vectors are removed from FAISS before the new ones are added; an
+        index that cannot remove vectors in place (HNSW) is compacted first.
+
+        Returns:
+            bool: False if the domain has no such document.
+        """
+        unique_id = str(unique_id)
+        if not self.delete_document(unique_id):
+            return False
+        if not supports_remove(self.faiss_index):
+            self.compact()
+        document['domain'] = self.domain_name
+        document['timestamp'] = datetime.utcnow().isoformat()
         document['unique_id'] = unique_id
-        chunks = split_text_into_chunks(document['data'], self.chunk_size, self.overlap)
-        for chunk in chunks:
-            chunk_document = document.copy()
-            chunk_document['data'] = chunk
-            chunk_embeddings = generate_fake_embeddings(chunk)
-            save_to_elasticsearch(self.es, chunk_document, self.model_name, unique_id)
-            save_to_faiss(chunk_document, self.model_name, self.faiss_index, unique_id, chunk_embeddings)
-        
-        # Print all documents in Elasticsearch
-        print("All documents in Elasticsearch:")
-        get_all_documents(self.es, f"{self.domain_name}_{self.model_name}".lower())
+        save_to_json(document, self.domain_name)
+        self._ingest()
+        return True
+
+    def tombstone_ratio(self):
+        """Returns the fraction of the FAISS index's vectors that belong to deleted documents."""
+        ntotal = self.faiss_index.ntotal
+        return self.docstore.tombstoned_vectors / ntotal if ntotal else 0.0
+
+    def compact(self):
+        """
+        Removes the vectors of deleted documents from the FAISS index and saves it.
+
+        Returns:
+            int: The number of vectors removed.
+        """
+        if self.read_only or not self.docstore.tombstones:
+            return 0
+        with self.lock.write():
+            unique_ids = list(self.docstore.tombstones)
+            self.faiss_index, removed = compact_index(self.faiss_index, unique_ids, self.index_type, self.index_params)
+            save_domain_index(self.faiss_index, self.domain_name, self.model_name, self.sync_offset)
+            self.docstore.clear_tombstones(unique_ids)
+            self.dirty = False
+        query_cache.invalidate_domain(self.domain_name, self.model_name)
+        logger.info("Compacted FAISS index", domain=self.domain_name, model=self.model_name, removed=removed)
+        return removed
+
+    def add_data_batch(self, documents: list):
+        """Adds many documents to JSON, then to Elasticsearch and FAISS in bulk batches."""
+        self._check_writable()
+        timestamp = datetime.utcnow().isoformat()
+        unique_ids = get_id_allocator(self.domain_name, self.es).allocate(len(documents))
+        for document, unique_id in zip(documents, unique_ids):
+            document['domain'] = self.domain_name
+            document['timestamp'] = timestamp
+            document['unique_id'] = unique_id
+        save_batch_to_json(documents, self.domain_name)
+        return self._ingest()
 
     def text_search(self, query: str, k=5):
-        """Performs keyword-based text search using Elasticsearch."""
-        return text_search(self.es, query, f"{self.domain_name}_{self.model_name}".lower(), k)
+        """Performs keyword-based text search using Elasticsearch, ranked by relevance; documents carry their 'score'."""
+        return scored_documents(text_search(self.es, query, self.index_name, k))
 
     def embedding_search(self, query_text: str, k=5):
-        """Finds similar embeddings using FAISS."""
-        return get_top_k_from_faiss(query_text, self.faiss_index, k)
+        """Finds the chunks closest to the query with FAISS and returns their text from the local docstore."""
+        return resolve_chunks([self.coalescer.search(query_text, k)], self.docstore, k)[0]
     
     def hybrid_search(self, query: str, k=5):
         """Combines keyword-based and embedding-based search."""
+        return hybrid_search(self.es, None, query, self.index_name, k, search_embeddings=self._search_embeddings,
+                             docstore=self.docstore)
+
+    def text_search_batch(self, queries: list, k=5):
+        """Runs text_search for many queries with one Elasticsearch _msearch request."""
+        return [scored_documents(hits) for hits in text_search_batch(self.es, queries, self.index_name, k)]
+
+    def embedding_search_batch(self, query_texts: list, k=5):
+        """Runs embedding_search for many queries with one FAISS search and one docstore lookup."""
+        return resolve_chunks(self._search_neighbours_batch(query_texts, k), self.docstore, k)
+
+    def hybrid_search_batch(self, queries: list, k=5):
+        """Runs hybrid_search for many queries with one _msearch and one FAISS search."""
+        return hybrid_search_batch(self.es, None, queries, self.index_name, k,
+                                   search_embeddings_batch=self._search_embeddings_batch, docstore=self.docstore)
+
+    def _search_neighbours_batch(self, queries: list, n: int):
+        """
+        Runs one batched FAISS search for the coalescer, skipping the vectors of deleted documents.
+
+        While tombstoned vectors remain in the index, extra neighbours are fetched and
+        the search is widened until n live neighbours are left per query or the whole
+        index has been searched. With re-ranking (index_params "rerank", or
+        RERANK_FACTOR, above 1), rerank times as many candidates are fetched and
+        re-scored with the exact vectors of their chunks.
+        """
+        tombstones = self.docstore.tombstones
+        rerank = max(self.index_params.get("rerank", RERANK_FACTOR), 1)
+        wanted = n * rerank
+        fetch = wanted + min(self.docstore.tombstoned_vectors, 4 * wanted) if tombstones else wanted
+        query_embeddings = embed_queries(queries, self.faiss_index.d, self.embedder)
+        while True:
+            with self.lock.read():
+                ntotal = self.faiss_index.ntotal
+                neighbours = search_neighbours_batch(self.faiss_index, queries, fetch, self.embedder, query_embeddings)
+            if tombstones:
+                neighbours = [[(faiss_id, score) for faiss_id, score in row
+                               if split_chunk_faiss_id(faiss_id)[0] not in tombstones] for row in neighbours]
+            if fetch >= ntotal or all(len(row) >= wanted for row in neighbours):
+                break
+            fetch *= 2
+        neighbours = [row[:wanted] for row in neighbours]
+        if rerank > 1:
+            return rerank_neighbours(query_embeddings, neighbours, self.docstore, self.embedder, n)
+        return neighbours
+
+    def _search_embeddings_batch(self, queries: list, k=5):
+        """The FAISS leg of hybrid_search_batch, deduplicated by document."""
+        return [dedupe_neighbours(row, k) for row in self._search_neighbours_batch(queries, k * 4)]
+
+    def _search_embeddings(self, query: str, k=5):
+        """The FAISS leg of hybrid_search, deduplicated by document."""
+        return dedupe_neighbours(self.coalescer.search(query, k * 4), k)
+
+    async def _search_embeddings_async(self, query: str, k=5):
+        """The FAISS leg of hybrid_search_async, deduplicated by document."""
+        return dedupe_neighbours(await asyncio.wrap_future(self.coalescer.submit(query, k * 4)), k)
+
+    async def text_search_async(self, query: str, k=5):
+        """Relevance-ranked text search with the async Elasticsearch client; documents carry their 'score'."""
+        return scored_documents(await async_text_search(get_async_elasticsearch_client(), query, self.index_name, k))
+
+    async def embedding_search_async(self, query_text: str, k=5):
+        """embedding_search through the coalescer, without blocking the event loop."""
+        neighbours = await asyncio.wrap_future(self.coalescer.submit(query_text, k))
+        loop = asyncio.get_running_loop()
+        return (await loop.run_in_executor(faiss_executor, resolve_chunks, [neighbours], self.docstore, k))[0]
 
+    async def hybrid_search_async(self, query: str, k=5):
+        """hybrid_search with the async Elasticsearch client and the coalesced FAISS leg."""
+        return await hybrid_search_async(get_async_elasticsearch_client(), self._search_embeddings_async, query,
+                                         self.index_name, k, docstore=self.docstore)
@@ -1,13 +1,47 @@
+import asyncio
+import inspect
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from rag_manager.domain import RAGDomain
-from utils.config import FAISS_STORAGE_PATH
+from utils.config import (FAISS_STORAGE_PATH, FAISS_FLUSH_INTERVAL, DOMAIN_LOAD_WORKERS, DOMAIN_WARMUP, DOMAIN_MAX_LOADED,
+                          DOMAIN_MEMORY_BUDGET, DOMAIN_READ_ONLY, COMPACTION_TOMBSTONE_RATIO, FEDERATED_DOMAIN_TIMEOUT)
+from search.federated_search import select_domains, federated_search, federated_search_async
+from search.query_cache import query_cache
+from storage.elastic_storage import get_pool_stats, get_elasticsearch_client, get_async_elasticsearch_client
+from storage.docstore import close_docstores
+from storage.embedding_cache import get_embedding_cache_stats
+from storage.json_storage import close_document_logs
+from utils.ingest_pipeline import shutdown_ingest_pool
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger(__name__)
+metrics.describe("rag_domain_load_seconds", "Latency of loading a domain (index load or rebuild and log catch-up).")
 
 class RAGManager:
-    def __init__(self):
+    def __init__(self, warmup=DOMAIN_WARMUP, max_loaded=DOMAIN_MAX_LOADED, memory_budget=DOMAIN_MEMORY_BUDGET,
+                 read_only=DOMAIN_READ_ONLY, flush_interval=FAISS_FLUSH_INTERVAL,
+                 compaction_ratio=COMPACTION_TOMBSTONE_RATIO):
         """Initialize RAG Manager and connect to everything."""
         self.domains = []
-        self.working_domains = {}
+        self.working_domains = OrderedDict()  # Loaded domains, least recently used first
+        self.max_loaded = max_loaded
+        self.memory_budget = memory_budget
+        self.read_only = {tuple(domain_key) for domain_key in read_only}
+        self.compaction_ratio = compaction_ratio
+        self._loading = {}  # domain_key -> Future of a domain being loaded
+        self._domain_options = {}  # domain_key -> RAGDomain options of a loading or loaded domain
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=DOMAIN_LOAD_WORKERS, thread_name_prefix="domain-load")
+        self._stop_maintenance = threading.Event()
+        self._maintenance = threading.Thread(target=self._maintenance_loop, args=(flush_interval,),
+                                             name="faiss-maintenance", daemon=True)
+        self._maintenance.start()
+        metrics.register_collector("rag_manager", self.collect_metrics)
         self.load_all_domains()
+        self.warm_up(warmup)
 
     def load_all_domains(self):
         """Load all domain-model variations from the FAISS storage path."""
@@ -18,47 +52,372 @@ class RAGManager:
                     domain_name, model_name = domain_model
                     self.domains.append({"domain": domain_name, "model": model_name})
 
-    def add_domain(self, domain_name: str, model_name: str, chunk_size=500, overlap=50, embedding_size=128):
-        """Creates a new RAG domain with Elasticsearch and a FAISS index."""
+    def warm_up(self, domains):
+        """Starts loading the given (domain, model) pairs in the background."""
+        return [self.load_domain_async(domain_name, model_name) for domain_name, model_name in domains]
+
+    def _is_known(self, domain_name: str, model_name: str):
+        return any(d["domain"] == domain_name and d["model"] == model_name for d in self.domains)
+
+    def load_domain_async(self, domain_name: str, model_name: str, **domain_options):
+        """
+        Returns a future for a loaded domain, starting the load on the worker pool if needed.
+
+        Concurrent callers asking for a domain that is still loading share one future.
+        domain_options are passed to RAGDomain when the domain is loaded. The options of
+        the load that started first win: a caller passing different options for a domain
+        that is loading or loaded gets a ValueError. Callers passing no options join any load.
+        """
         domain_key = (domain_name, model_name)
-        if domain_key in self.working_domains or any(d["domain"] == domain_name and d["model"] == model_name for d in self.domains):
-            return self.working_domains.get(domain_key) or RAGDomain(domain_name, model_name, chunk_size, overlap, embedding_size)
-        
-        domain = RAGDomain(domain_name, model_name, chunk_size, overlap, embedding_size)
-        self.domains.append({"domain": domain_name, "model": model_name})
-        self.working_domains[domain_key] = domain
+        with self._lock:
+            future = self._loading.get(domain_key)
+            if future is not None or domain_key in self.working_domains:
+                if domain_options:
+                    self._check_domain_options(domain_key, domain_options)
+                if future is not None:
+                    return future
+            options = self._resolve_domain_options(domain_key, domain_options)
+            future = self._executor.submit(self._load, domain_name, model_name, options)
+            self._loading[domain_key] = future
+            self._domain_options[domain_key] = options
+            future.add_done_callback(lambda _: self._finish_loading(domain_key, future))
+            return future
+
+    def _resolve_domain_options(self, domain_key, domain_options):
+        """Returns every RAGDomain option for a load, filling in the defaults."""
+        arguments = inspect.signature(RAGDomain).bind(*domain_key, **domain_options)
+        arguments.apply_defaults()
+        options = dict(arguments.arguments)
+        del options["domain_name"], options["model_name"]
+        if domain_options.get("read_only") is None:
+            options["read_only"] = domain_key in self.read_only
+        return options
+
+    def _check_domain_options(self, domain_key, domain_options):
+        """Raises ValueError if options differ from those a domain is loading or was loaded with. Caller holds the lock."""
+        current = self._domain_options.get(domain_key)
+        if current is None:
+            return
+        requested = self._resolve_domain_options(domain_key, domain_options)
+        conflicts = sorted(name for name in requested if requested[name] != current[name])
+        if conflicts:
+            raise ValueError(f"Domain {domain_key[0]} with model {domain_key[1]} is already loaded with different "
+                             f"options: {', '.join(conflicts)}")
+
+    def _load(self, domain_name: str, model_name: str, domain_options: dict):
+        """Builds a RAGDomain on a worker thread and registers it as loaded."""
+        with metrics.span("rag_domain_load_seconds"):
+            domain = RAGDomain(domain_name, model_name, **domain_options)
+        with self._lock:
+            self.working_domains[(domain_name, model_name)] = domain
+            if not self._is_known(domain_name, model_name):
+                self.domains.append({"domain": domain_name, "model": model_name})
+        self.evict_cold_domains(keep=(domain_name, model_name))
         return domain
 
+    def _finish_loading(self, domain_key, future):
+        with self._lock:
+            if self._loading.get(domain_key) is future:
+                del self._loading[domain_key]
+                if future.exception() is not None:
+                    self._domain_options.pop(domain_key, None)
+
+    def evict_cold_domains(self, keep=None):
+        """
+        Unloads least recently used domains while over the domain count or memory budget.
+
+        The FAISS index of each evicted domain is saved before it is dropped if it has unsaved writes.
+        """
+        evicted = []
+        with self._lock:
+            usage = {key: domain.memory_usage() for key, domain in self.working_domains.items()}
+            total = sum(usage.values())
+            for domain_key in list(self.working_domains):
+                if len(self.working_domains) <= self.max_loaded and total <= self.memory_budget:
+                    break
+                if domain_key == keep:
+                    continue
+                evicted.append(self.working_domains.pop(domain_key))
+                if domain_key not in self._loading:
+                    self._domain_options.pop(domain_key, None)
+                total -= usage[domain_key]
+        for domain in evicted:
+            domain.flush()
+            domain.close()
+            query_cache.invalidate_domain(domain.domain_name, domain.model_name)
+            logger.info("Evicted domain", domain=domain.domain_name, model=domain.model_name)
+        return evicted
+
+    def add_domain(self, domain_name: str, model_name: str, chunk_size=500, overlap=50, embedding_size=128,
+                   index_type=None, index_params=None, read_only=None):
+        """
+        Creates a new RAG domain with Elasticsearch and a FAISS index.
+
+        read_only opens an existing domain from its memory-mapped index; by default
+        domains listed in DOMAIN_READ_ONLY are read-only. Adding a domain that is
+        already loading or loaded returns it, and raises ValueError if it was
+        loaded with different options.
+        """
+        domain_key = (domain_name, model_name)
+        domain_options = dict(chunk_size=chunk_size, overlap=overlap, embedding_size=embedding_size,
+                              index_type=index_type, index_params=index_params, read_only=read_only)
+        with self._lock:
+            if domain_key in self.working_domains:
+                self._check_domain_options(domain_key, domain_options)
+                self.working_domains.move_to_end(domain_key)
+                return self.working_domains[domain_key]
+        return self.load_domain_async(domain_name, model_name, **domain_options).result()
+
     def add_data(self, domain_name: str, model_name: str, document: dict):
         """Add data to a specific domain."""
         domain = self.load_domain(domain_name, model_name)
         domain.add_data(document)
 
+    def add_data_batch(self, domain_name: str, model_name: str, documents: list):
+        """Add many documents to a specific domain using bulk ingestion."""
+        domain = self.load_domain(domain_name, model_name)
+        return domain.add_data_batch(documents)
+
+    def delete_document(self, domain_name: str, model_name: str, unique_id):
+        """Delete a document from a specific domain. Returns False if it does not exist."""
+        domain = self.load_domain(domain_name, model_name)
+        return domain.delete_document(unique_id)
+
+    def update_document(self, domain_name: str, model_name: str, unique_id, document: dict):
+        """Replace a document of a specific domain, keeping its unique_id. Returns False if it does not exist."""
+        domain = self.load_domain(domain_name, model_name)
+        return domain.update_document(unique_id, document)
+
     def list_domains(self):
         """Returns a list of all available domains."""
         return self.domains
 
     def load_domain(self, domain_name: str, model_name: str):
-        """Loads domain metadata into memory for faster access."""
+        """Loads domain metadata into memory for faster access, waiting for a background load if one is running."""
         domain_key = (domain_name, model_name)
-        if domain_key in self.working_domains:
-            return self.working_domains[domain_key]
-        
-        for domain in self.domains:
-            if domain["domain"] == domain_name and domain["model"] == model_name:
-                self.working_domains[domain_key] = RAGDomain(domain_name, model_name)
+        with self._lock:
+            if domain_key in self.working_domains:
+                self.working_domains.move_to_end(domain_key)
                 return self.working_domains[domain_key]
-        
-        return self.add_domain(domain_name, model_name)
+        return self.load_domain_async(domain_name, model_name).result()
+
+    async def load_domain_awaitable(self, domain_name: str, model_name: str):
+        """Async version of load_domain; a background load is awaited instead of blocking the event loop."""
+        domain_key = (domain_name, model_name)
+        with self._lock:
+            if domain_key in self.working_domains:
+                self.working_domains.move_to_end(domain_key)
+                return self.working_domains[domain_key]
+        return await asyncio.wrap_future(self.load_domain_async(domain_name, model_name))
+
+    def _maintenance_loop(self, interval):
+        """
+        Background maintenance: compacts FAISS indexes with too many deleted vectors, then
+        saves the FAISS index of every loaded domain with unsaved writes.
+        """
+        while not self._stop_maintenance.wait(interval):
+            self.compact()
+            self.flush()
+
+    def compact(self, min_ratio=None):
+        """Compacts the FAISS index of every loaded domain whose tombstone ratio exceeds min_ratio."""
+        min_ratio = self.compaction_ratio if min_ratio is None else min_ratio
+        with self._lock:
+            domains = list(self.working_domains.values())
+        for domain in domains:
+            if domain.read_only or domain.tombstone_ratio() <= min_ratio:
+                continue
+            try:
+                domain.compact()
+            except Exception as e:
+                logger.error("Failed to compact FAISS index", domain=domain.domain_name, model=domain.model_name, error=e)
+
+    def flush(self):
+        """Saves the FAISS index of every loaded domain with unsaved writes."""
+        with self._lock:
+            domains = list(self.working_domains.values())
+        for domain in domains:
+            try:
+                domain.flush()
+            except Exception as e:
+                logger.error("Failed to save FAISS index", domain=domain.domain_name, model=domain.model_name, error=e)
 
-    def generate_prompt(self, domain_name: str, model_name: str, query: str, mode: str = "hybrid"):
-        """Generate prompt using text, embedding, or hybrid search."""
+    def shutdown(self):
+        """
+        Waits for running loads, saves the FAISS index of every loaded domain with unsaved
+        writes, stops the shard processes of sharded domains and the ingestion workers, and
+        closes the document logs and docstores.
+        """
+        self._stop_maintenance.set()
+        self._executor.shutdown(wait=True)
+        self.flush()
+        with self._lock:
+            domains = list(self.working_domains.values())
+        for domain in domains:
+            domain.close()
+        shutdown_ingest_pool()
+        close_document_logs()
+        close_docstores()
+
+    def generate_prompt(self, domain_name: str, model_name: str, query: str, mode: str = "hybrid", k=5):
+        """Generate prompt using text, embedding, or hybrid search. Results are served from the query cache when possible."""
+        if mode not in ("text", "embedding", "hybrid"):
+            raise ValueError("Invalid mode. Choose from 'text', 'embedding', or 'hybrid'.")
         domain = self.load_domain(domain_name, model_name)
+        return query_cache.get_or_compute(domain_name, model_name, mode, query, k,
+                                          lambda: self.search_domain(domain, query, mode, k))
+
+    def search_domain(self, domain, query: str, mode: str, k=5):
+        """Run an uncached search on a loaded domain."""
         if mode == "text":
-            return domain.text_search(query)
+            return domain.text_search(query, k)
         elif mode == "embedding":
-            return domain.embedding_search(query_text=query)
+            return domain.embedding_search(query_text=query, k=k)
         elif mode == "hybrid":
-            return domain.hybrid_search(query)
+            return domain.hybrid_search(query, k)
         else:
-            raise ValueError("Invalid mode. Choose from 'text', 'embedding', or 'hybrid'.")
\ No newline at end of file
+            raise ValueError("Invalid mode. Choose from 'text', 'embedding', or 'hybrid'.")
+
+    def generate_prompt_batch(self, domain_name: str, model_name: str, queries: list, mode: str = "hybrid", k=5):
+        """
+        Generate prompts for many queries. Cached queries are served from the query cache;
+        the rest are searched together in one batch. Results are returned in query order.
+        """
+        if mode not in ("text", "embedding", "hybrid"):
+            raise ValueError("Invalid mode. Choose from 'text', 'embedding', or 'hybrid'.")
+        domain = self.load_domain(domain_name, model_name)
+        results = [None] * len(queries)
+        pending = []  # (position, key, generation) of queries to search
+        for position, query in enumerate(queries):
+            hit, value, key, generation = query_cache.lookup(domain_name, model_name, mode, query, k)
+            if hit:
+                results[position] = value
+            else:
+                pending.append((position, key, generation))
+        if pending:
+            searched = self.search_domain_batch(domain, [queries[position] for position, _, _ in pending], mode, k)
+            for (position, key, generation), value in zip(pending, searched):
+                query_cache.store(key, generation, value)
+                results[position] = value
+        return results
+
+    def search_domain_batch(self, domain, queries: list, mode: str, k=5):
+        """Run uncached searches for many queries on a loaded domain in one batch."""
+        if mode == "text":
+            return domain.text_search_batch(queries, k)
+        elif mode == "embedding":
+            return domain.embedding_search_batch(queries, k)
+        elif mode == "hybrid":
+            return domain.hybrid_search_batch(queries, k)
+        else:
+            raise ValueError("Invalid mode. Choose from 'text', 'embedding', or 'hybrid'.")
+
+    async def generate_prompt_async(self, domain_name: str, model_name: str, query: str, mode: str = "hybrid", k=5):
+        """Async version of generate_prompt for the ASGI server."""
+        if mode not in ("text", "embedding", "hybrid"):
+            raise ValueError("Invalid mode. Choose from 'text', 'embedding', or 'hybrid'.")
+        domain = await self.load_domain_awaitable(domain_name, model_name)
+        return await query_cache.get_or_compute_async(domain_name, model_name, mode, query, k,
+                                                      lambda: self.search_domain_async(domain, query, mode, k))
+
+    async def search_domain_async(self, domain, query: str, mode: str, k=5):
+        """Run an uncached search on a loaded domain without blocking the event loop."""
+        if mode == "text":
+            return await domain.text_search_async(query, k)
+        elif mode == "embedding":
+            return await domain.embedding_search_async(query_text=query, k=k)
+        elif mode == "hybrid":
+            return await domain.hybrid_search_async(query, k)
+        else:
+            raise ValueError("Invalid mode. Choose from 'text', 'embedding', or 'hybrid'.")
+
+    def federated_search(self, domains, query: str, mode: str = "hybrid", k=5, model_name=None,
+                         timeout=FEDERATED_DOMAIN_TIMEOUT):
+        """
+        Search every domain matching domains (names or globs) and return a global top k.
+
+        Domains that are not loaded are loaded by their embedding leg, so a domain that
+        takes longer than timeout to load is left out of this search but stays loaded
+        for the next one. See search.federated_search.federated_search for the response.
+        """
+        with self._lock:
+            known = list(self.domains)
+        domain_keys = select_domains(known, domains, model_name)
+        return federated_search(get_elasticsearch_client(), domain_keys, query, self._federated_embedding_leg,
+                                mode, k, timeout)
+
+    def _federated_embedding_leg(self, domain_key, query: str, k: int):
+        return self.load_domain(*domain_key).embedding_search(query, k)
+
+    async def federated_search_async(self, domains, query: str, mode: str = "hybrid", k=5, model_name=None,
+                                     timeout=FEDERATED_DOMAIN_TIMEOUT):
+        """Async version of federated_search for the ASGI server."""
+        with self._lock:
+            known = list(self.domains)
+        domain_keys = select_domains(known, domains, model_name)
+        return await federated_search_async(get_async_elasticsearch_client(), domain_keys, query,
+                                            self._federated_embedding_leg_async, mode, k, timeout)
+
+    async def _federated_embedding_leg_async(self, domain_key, query: str, k: int):
+        domain = await self.load_domain_awaitable(*domain_key)
+        return await domain.embedding_search_async(query, k)
+
+    def cache_stats(self):
+        """Returns the query cache hit and miss counters."""
+        return query_cache.stats()
+
+    def coalescer_stats(self):
+        """Returns the batch-size and queue-wait histograms of each loaded domain's search coalescer."""
+        with self._lock:
+            domains = list(self.working_domains.values())
+        return {f"{domain.domain_name}_{domain.model_name}": domain.coalescer.stats() for domain in domains}
+
+    def elasticsearch_stats(self):
+        """Returns the request, retry and in-flight counters of the shared Elasticsearch client."""
+        return get_pool_stats()
+
+    def collect_metrics(self):
+        """
+        Reports the gauges read when metrics are rendered: FAISS index sizes of the
+        loaded domains, query and embedding cache counters, Elasticsearch client
+        counters and the search coalescer histograms.
+        """
+        with self._lock:
+            domains = list(self.working_domains.values())
+        labels = [{"domain": domain.domain_name, "model": domain.model_name} for domain in domains]
+        query_cache_stats = query_cache.stats()
+        embedding_cache_stats = get_embedding_cache_stats()
+        pool = get_pool_stats()
+        return [
+            ("rag_domains_loaded", "gauge", "Domains loaded in memory.", [({}, len(domains))]),
+            ("rag_faiss_index_vectors", "gauge", "Vectors in the FAISS index of a loaded domain.",
+             [(label, domain.faiss_index.ntotal) for label, domain in zip(labels, domains)]),
+            ("rag_faiss_tombstoned_vectors", "gauge", "FAISS vectors of deleted documents awaiting compaction.",
+             [(label, domain.docstore.tombstoned_vectors) for label, domain in zip(labels, domains)]),
+            ("rag_faiss_index_memory_bytes", "gauge", "Approximate memory held by the FAISS index of a loaded domain.",
+             [(label, domain.memory_usage()) for label, domain in zip(labels, domains)]),
+            ("rag_query_cache_hits_total", "counter", "Query cache hits.", [({}, query_cache_stats["hits"])]),
+            ("rag_query_cache_misses_total", "counter", "Query cache misses.", [({}, query_cache_stats["misses"])]),
+            ("rag_query_cache_hit_ratio", "gauge", "Query cache hit rate.", [({}, query_cache_stats["hit_rate"])]),
+            ("rag_query_cache_bytes", "gauge", "Approximate size of the query cache.", [({}, query_cache_stats["bytes"])]),
+            ("rag_embedding_cache_hits_total", "counter", "Embedding cache hits, per embedder.",
+             [({"embedder": embedder_id}, stats["hits"]) for embedder_id, stats in embedding_cache_stats.items()]),
+            ("rag_embedding_cache_misses_total", "counter", "Embedding cache misses, per embedder.",
+             [({"embedder": embedder_id}, stats["misses"]) for embedder_id, stats in embedding_cache_stats.items()]),
+            ("rag_embedding_cache_vectors", "gauge", "Vectors stored in the embedding cache, per embedder.",
+             [({"embedder": embedder_id}, stats["vectors"]) for embedder_id, stats in embedding_cache_stats.items()]),
+            ("rag_elasticsearch_requests_total", "counter", "Requests made by the shared Elasticsearch clients.",
+             [({}, pool["requests"])]),
+            ("rag_elasticsearch_retries_total", "counter", "Elasticsearch request attempts beyond the first.",
+             [({}, pool["retries"])]),
+            ("rag_elasticsearch_failures_total", "counter", "Elasticsearch requests that failed.", [({}, pool["failures"])]),
+            ("rag_elasticsearch_in_flight", "gauge", "Elasticsearch requests in flight.", [({}, pool["in_flight"])]),
+            ("rag_coalescer_batch_size", "histogram", "Queries per coalesced FAISS search batch.",
+             [(label, domain.coalescer.batch_sizes.snapshot()) for label, domain in zip(labels, domains)]),
+            ("rag_coalescer_queue_wait_seconds", "histogram", "Time a search waited to join a coalesced batch.",
+             [(label, domain.coalescer.queue_waits.snapshot()) for label, domain in zip(labels, domains)]),
+        ]
+
+    def metrics_text(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        return metrics.render()
@@ -1,3 +1,6 @@
 from .text_search import text_search
 from .embedding_search import embedding_search
-from .hybrid_search import hybrid_search
\ No newline at end of file
+from .hybrid_search import hybrid_search
+from .federated_search import federated_search
+from .query_cache import QueryCache, query_cache
+from .coalescer import SearchCoalescer
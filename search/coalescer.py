@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from utils.config import COALESCE_MAX_WAIT, COALESCE_MAX_BATCH_SIZE
+from utils.metrics import Histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+QUEUE_WAIT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Seconds a collector thread stays alive with nothing queued; it is restarted on the next request
+IDLE_TIMEOUT = 30
+
+class SearchCoalescer:
+    """
+    Coalesces concurrent searches of one domain into batched searches.
+
+    Requests are queued and a collector thread gathers them for up to max_wait
+    seconds after the oldest one arrived, or until max_batch_size are waiting.
+    The batch is run with one call to search_batch on the executor and each
+    request's result is handed back through its Future.
+
+    search_batch(queries, n) must return, for each query in order, a best-first
+    list of at least n results; requests asking for fewer get a prefix of it.
+    """
+
+    def __init__(self, search_batch, executor, max_wait=COALESCE_MAX_WAIT, max_batch_size=COALESCE_MAX_BATCH_SIZE,
+                 name="coalescer"):
+        self.search_batch = search_batch
+        self.executor = executor
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self.name = name
+        self._pending = deque()  # (query, n, future, enqueued_at)
+        self._condition = threading.Condition()
+        self._running = False
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_waits = Histogram(QUEUE_WAIT_BUCKETS)
+
+    def submit(self, query, n):
+        """
+        Queue a search.
+
+        Args:
+            query (str): The query text.
+            n (int): The number of results wanted.
+
+        Returns:
+            Future: Resolves to the query's results.
+        """
+        future = Future()
+        with self._condition:
+            self._pending.append((query, n, future, time.monotonic()))
+            if not self._running:
+                self._running = True
+                threading.Thread(target=self._collect, name=f"{self.name}-coalescer", daemon=True).start()
+            self._condition.notify()
+        return future
+
+    def search(self, query, n):
+        """Queue a search and wait for its results."""
+        return self.submit(query, n).result()
+
+    def _collect(self):
+        """Collector loop: cut batches from the queue and hand them to the executor."""
+        while True:
+            with self._condition:
+                if not self._pending:
+                    self._condition.wait(IDLE_TIMEOUT)
+                    if not self._pending:
+                        self._running = False
+                        return
+                deadline = self._pending[0][3] + self.max_wait
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch_size))]
+            try:
+                self.executor.submit(self._run_batch, batch)
+            except RuntimeError as e:
+                # The executor is shut down (interpreter exit); fail the batch so callers such
+                # as late federated search legs do not wait forever
+                for _, _, future, _ in batch:
+                    future.set_exception(e)
+
+    def _run_batch(self, batch):
+        """Run one batched search and fan the results out to the waiting requests."""
+        started = time.monotonic()
+        for _, _, _, enqueued_at in batch:
+            self.queue_waits.observe(started - enqueued_at)
+        self.batch_sizes.observe(len(batch))
+        try:
+            results = self.search_batch([query for query, _, _, _ in batch], max(n for _, n, _, _ in batch))
+        except Exception as e:
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, n, future, _), result in zip(batch, results):
+            future.set_result(result[:n])
+
+    def stats(self):
+        """Return the batch-size and queue-wait histograms and the number of queued requests."""
+        with self._condition:
+            queued = len(self._pending)
+        return {
+            "queued": queued,
+            "max_wait": self.max_wait,
+            "max_batch_size": self.max_batch_size,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_seconds": self.queue_waits.snapshot(),
+        }
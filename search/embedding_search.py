@@ -0,0 +1,166 @@
+import faiss
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from storage.faiss_storage import fit_to_dimension
+from storage.docstore import split_chunk_faiss_id
+from storage.embedding_cache import embed_with_cache
+from utils.embedder import get_embedder
+from utils.config import FAISS_SEARCH_WORKERS
+from utils.metrics import metrics
+
+# Bounded pool that runs FAISS searches (coalesced batches and async requests) off the request threads
+faiss_executor = ThreadPoolExecutor(max_workers=FAISS_SEARCH_WORKERS, thread_name_prefix="faiss-search")
+
+metrics.describe("rag_faiss_search_seconds", "Latency of FAISS searches of a query batch.")
+metrics.describe("rag_faiss_search_queries", "Queries searched in FAISS.")
+
+def embedding_search(faiss_index, query_text, k=5, embedder=None):
+    """
+    Nearest-neighbour search over a FAISS index, deduplicated by unique_id.
+
+    Each chunk has its own FAISS ID, so the index is searched for extra
+    neighbours and only the closest chunk of each document is kept.
+
+    Args:
+        faiss_index (faiss.Index): The FAISS index to search.
+        query_text (str): The query text.
+        k (int): The number of documents to return.
+        embedder (Embedder): The embedder the index was built with.
+
+    Returns:
+        list: (unique_id, score) pairs, best first. The score is the cosine
+        similarity of the closest chunk.
+    """
+    return embedding_search_batch(faiss_index, [query_text], k, embedder)[0]
+
+def embed_queries(query_texts, dimension, embedder):
+    """Embed queries as one float32 matrix of the index dimension."""
+    with metrics.span("rag_embedding_seconds", source="queries"):
+        return fit_to_dimension(embedder.embed_batch(query_texts), dimension)
+
+def search_neighbours_batch(faiss_index, query_texts, n, embedder=None, query_embeddings=None):
+    """
+    Embed queries as one matrix and return their nearest chunks from a single FAISS search.
+
+    Args:
+        faiss_index (faiss.Index): The FAISS index to search.
+        query_texts (list): The query texts.
+        n (int): The number of neighbours to return per query.
+        embedder (Embedder): The embedder the index was built with.
+        query_embeddings (np.ndarray): The queries, already embedded by embed_queries.
+
+    Returns:
+        list: For each query, in order, up to n (chunk FAISS ID, score) pairs for the
+        nearest chunks, best first. The score is the cosine similarity.
+    """
+    if faiss_index.ntotal == 0 or n <= 0:
+        return [[] for _ in query_texts]
+    if query_embeddings is None:
+        query_embeddings = embed_queries(query_texts, faiss_index.d, embedder or get_embedder(dimension=faiss_index.d))
+    with metrics.span("rag_faiss_search_seconds"):
+        distances, indices = faiss_index.search(query_embeddings, min(n, faiss_index.ntotal))
+    metrics.increment("rag_faiss_search_queries", len(query_texts))
+
+    # Vectors are L2-normalised, so a squared L2 distance d is a cosine of 1 - d / 2
+    is_l2 = faiss_index.metric_type == faiss.METRIC_L2
+    return [
+        [(idx, 1 - distance / 2 if is_l2 else distance) for distance, idx in zip(row_distances, row_indices) if idx != -1]
+        for row_distances, row_indices in zip(distances.tolist(), indices.tolist())
+    ]
+
+def rerank_neighbours(query_embeddings, neighbour_lists, docstore, embedder, n):
+    """
+    Re-score approximate neighbours with the exact cosine similarity of their chunks.
+
+    The candidates' chunk text is read from the docstore and embedded again,
+    through the embedding cache, so a chunk ingested with the cache enabled costs
+    a lookup. This recovers the ranking lost to float16 or SQ8 storage. Chunks
+    missing from the docstore (of deleted documents) are dropped.
+
+    Args:
+        query_embeddings (np.ndarray): The embedded queries, as returned by embed_queries.
+        neighbour_lists (list): For each query, its candidate (chunk FAISS ID, score) pairs.
+        docstore (ChunkDocstore): The docstore of the searched index.
+        embedder (Embedder): The embedder the index was built with.
+        n (int): The number of neighbours to keep per query.
+
+    Returns:
+        list: For each query, in order, up to n (chunk FAISS ID, score) pairs, best first.
+    """
+    chunks = docstore.get_many([faiss_id for neighbours in neighbour_lists for faiss_id, _ in neighbours])
+    if not chunks:
+        return [[] for _ in neighbour_lists]
+    faiss_ids = list(chunks)
+    positions = {faiss_id: position for position, faiss_id in enumerate(faiss_ids)}
+    vectors = fit_to_dimension(embed_with_cache(embedder, [chunks[faiss_id]['data'] for faiss_id in faiss_ids]),
+                               query_embeddings.shape[1])
+    results = []
+    for query, neighbours in zip(query_embeddings, neighbour_lists):
+        candidates = list(dict.fromkeys(faiss_id for faiss_id, _ in neighbours if faiss_id in positions))
+        scores = vectors[[positions[faiss_id] for faiss_id in candidates]] @ query
+        best = np.argsort(-scores, kind='stable')[:n]
+        results.append([(candidates[i], float(scores[i])) for i in best.tolist()])
+    return results
+
+def dedupe_neighbours(neighbours, k):
+    """Keep the closest chunk of each document in a best-first neighbour list, as (chunk FAISS ID, score) pairs."""
+    results = []
+    seen = set()
+    for faiss_id, score in neighbours:
+        unique_id, _ = split_chunk_faiss_id(faiss_id)
+        if unique_id in seen:
+            continue
+        seen.add(unique_id)
+        results.append((faiss_id, score))
+        if len(results) == k:
+            break
+    return results
+
+def dedupe_hits(neighbours, k):
+    """Turn a best-first neighbour list into (unique_id, score) pairs, keeping the closest chunk of each document."""
+    return [(split_chunk_faiss_id(faiss_id)[0], score) for faiss_id, score in dedupe_neighbours(neighbours, k)]
+
+def embedding_search_batch(faiss_index, query_texts, k=5, embedder=None):
+    """
+    embedding_search for many queries, embedded as one matrix and searched with one FAISS call.
+
+    Args:
+        faiss_index (faiss.Index): The FAISS index to search.
+        query_texts (list): The query texts.
+        k (int): The number of documents to return per query.
+        embedder (Embedder): The embedder the index was built with.
+
+    Returns:
+        list: For each query, in order, its (unique_id, score) pairs, best first.
+    """
+    neighbours = search_neighbours_batch(faiss_index, query_texts, k * 4, embedder)
+    return [dedupe_hits(row, k) for row in neighbours]
+
+def resolve_chunks(neighbour_lists, docstore, k):
+    """
+    Turn neighbour lists into chunk documents with one docstore lookup.
+
+    Args:
+        neighbour_lists (list): For each query, its best-first (chunk FAISS ID, score) pairs.
+        docstore (ChunkDocstore): The docstore of the searched index.
+        k (int): The number of chunks to return per query.
+
+    Returns:
+        list: For each query, up to k distinct chunk documents, best first, each with
+        'score' (cosine similarity) and 'distance' (cosine distance) fields.
+    """
+    chunks = docstore.get_many([faiss_id for neighbours in neighbour_lists for faiss_id, _ in neighbours])
+    results = []
+    for neighbours in neighbour_lists:
+        query_results = []
+        seen = set()
+        for faiss_id, score in neighbours:
+            chunk = chunks.get(faiss_id)
+            if chunk is None or faiss_id in seen:
+                continue
+            seen.add(faiss_id)
+            query_results.append({**chunk, "score": score, "distance": 1 - score})
+            if len(query_results) == k:
+                break
+        results.append(query_results)
+    return results
@@ -0,0 +1,281 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait
+from fnmatch import fnmatchcase
+from search.hybrid_search import weighted_score_fusion
+from utils.config import FEDERATED_DOMAIN_TIMEOUT, FEDERATED_SEARCH_WORKERS, HYBRID_CANDIDATE_MULTIPLIER
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+# Runs the multi-index Elasticsearch search and the per-domain FAISS legs of federated searches.
+# A leg that misses its deadline keeps its worker until it finishes; its result is dropped.
+_executor = ThreadPoolExecutor(max_workers=FEDERATED_SEARCH_WORKERS, thread_name_prefix="federated-search")
+
+metrics.describe("rag_federated_timeouts", "Federated search legs left out because they missed the domain timeout, by leg.")
+
+def select_domains(known_domains, patterns, model_pattern=None):
+    """
+    Pick the domain-model pairs a federated search covers.
+
+    Args:
+        known_domains (list): {"domain": ..., "model": ...} dicts, as returned by RAGManager.list_domains.
+        patterns (str | list): Domain names or shell-style globs (e.g. "news_*").
+        model_pattern (str): Optional model name or glob; every model of a matching domain by default.
+
+    Returns:
+        list: Distinct (domain, model) pairs, sorted.
+
+    Raises:
+        ValueError: If no known domain matches.
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    selected = {
+        (entry["domain"], entry["model"]) for entry in known_domains
+        if any(fnmatchcase(entry["domain"], pattern) for pattern in patterns)
+        and (model_pattern is None or fnmatchcase(entry["model"], model_pattern))
+    }
+    if not selected:
+        raise ValueError(f"No domains match {patterns}" + (f" with model {model_pattern}." if model_pattern else "."))
+    return sorted(selected)
+
+def get_federated_query(query, index_names, k=5):
+    """
+    Return the body of the multi-index search used by multi_index_text_search.
+
+    A top-level size would return the global top hits, which one large index can
+    fill on its own, so hits are grouped per index with a terms aggregation on
+    _index and each group keeps its own top k. Elasticsearch caps top_hits at
+    100 hits per group by default (index.max_inner_result_window).
+    """
+    return {
+        "query": {
+            "match": {
+                "data": query
+            }
+        },
+        "size": 0,
+        "aggs": {
+            "indices": {
+                "terms": {"field": "_index", "size": len(index_names)},
+                "aggs": {"top": {"top_hits": {"size": k}}},
+            }
+        },
+    }
+
+def parse_federated_response(response):
+    """Return {index name: [(document, score), ...]} from a get_federated_query response."""
+    return {
+        bucket['key']: [(hit['_source'], hit['_score']) for hit in bucket['top']['hits']['hits']]
+        for bucket in response['aggregations']['indices']['buckets']
+    }
+
+@metrics.timed("rag_elasticsearch_seconds", operation="federated_search")
+def multi_index_text_search(es, query, index_names, k=5):
+    """
+    Keyword search over many indices with a single Elasticsearch request.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        query (str): The text query to search for.
+        index_names (list): The indices to search; missing indices are skipped.
+        k (int): The number of top results per index.
+
+    Returns:
+        dict: (document, score) pairs, best first, per index name. Indices
+        without matches are omitted; the dict is empty if the search failed.
+    """
+    try:
+        response = es.search(index=",".join(index_names), body=get_federated_query(query, index_names, k),
+                             ignore_unavailable=True)
+    except Exception as e:
+        logger.error("Failed to search documents", index=index_names, error=e)
+        return {}
+    return parse_federated_response(response)
+
+@metrics.timed("rag_elasticsearch_seconds", operation="federated_search")
+async def async_multi_index_text_search(es, query, index_names, k=5):
+    """Async version of multi_index_text_search for an AsyncElasticsearch client."""
+    try:
+        response = await es.search(index=",".join(index_names), body=get_federated_query(query, index_names, k),
+                                   ignore_unavailable=True)
+    except Exception as e:
+        logger.error("Failed to search documents", index=index_names, error=e)
+        return {}
+    return parse_federated_response(response)
+
+def federate_hits(text_hits, embedding_hits, k, weights=None):
+    """
+    Merge the hits of many domains into one global ranking.
+
+    Scores are not comparable as they come: BM25 depends on each index's term
+    statistics, and the text and embedding legs use different scales. Each leg
+    is min-max normalised over the hits of all domains together, so domains
+    still rank against each other within a leg, and the legs are summed with
+    weighted_score_fusion. Hits are deduplicated per document of each domain,
+    keeping the best chunk.
+
+    Args:
+        text_hits (dict): (document, score) pairs of the text leg per (domain, model).
+        embedding_hits (dict): Chunk documents with a 'score' field from the embedding leg per (domain, model).
+        k (int): The number of documents to return.
+        weights (list): Optional [text, embedding] weights for the fusion.
+
+    Returns:
+        list: Chunk documents, best first, each with 'domain', 'model' and the fused 'score'.
+    """
+    documents = {}
+    text_scored = []
+    for domain_key, hits in text_hits.items():
+        for document, score in hits:
+            item_id = (*domain_key, str(document['unique_id']))
+            if item_id not in documents:
+                documents[item_id] = document
+                text_scored.append((item_id, score))
+    embedding_scored = []
+    seen = set()
+    for domain_key, hits in embedding_hits.items():
+        for document in hits:
+            item_id = (*domain_key, str(document['unique_id']))
+            if item_id in seen:
+                continue
+            seen.add(item_id)
+            documents.setdefault(item_id, document)
+            embedding_scored.append((item_id, document['score']))
+
+    scores = weighted_score_fusion([text_scored, embedding_scored], weights)
+    results = []
+    for item_id in sorted(scores, key=scores.get, reverse=True)[:k]:
+        domain_name, model_name, _ = item_id
+        document = {key: value for key, value in documents[item_id].items() if key != 'distance'}
+        results.append({**document, "domain": domain_name, "model": model_name, "score": scores[item_id]})
+    return results
+
+def _guarded(search_embeddings, domain_key, query, candidates):
+    """Run one domain's embedding leg, logging a failure instead of raising it."""
+    try:
+        return search_embeddings(domain_key, query, candidates)
+    except Exception as e:
+        logger.error("Federated search leg failed", domain=domain_key[0], model=domain_key[1], error=e)
+        return []
+
+async def _guarded_async(search_embeddings, domain_key, query, candidates):
+    """Async version of _guarded."""
+    try:
+        return await search_embeddings(domain_key, query, candidates)
+    except Exception as e:
+        logger.error("Federated search leg failed", domain=domain_key[0], model=domain_key[1], error=e)
+        return []
+
+def _index_names(domain_keys):
+    """Map the Elasticsearch index name of each domain-model pair to the pair."""
+    return {f"{domain_name}_{model_name}".lower(): (domain_name, model_name) for domain_name, model_name in domain_keys}
+
+def _collect(domain_keys, text_result, text_done, embedding_results, mode, query, k, weights):
+    """Build the federated_search response from the legs that finished in time."""
+    index_names = _index_names(domain_keys)
+    timed_out = []
+    text_hits = {}
+    if mode != "embedding":
+        if text_done:
+            text_hits = {index_names[name]: hits for name, hits in text_result.items() if name in index_names}
+        else:
+            metrics.increment("rag_federated_timeouts", len(domain_keys), leg="text")
+            timed_out.extend({"domain": domain_name, "model": model_name, "leg": "text"}
+                             for domain_name, model_name in domain_keys)
+    embedding_hits = {}
+    for domain_key in domain_keys if mode != "text" else ():
+        if domain_key in embedding_results:
+            embedding_hits[domain_key] = embedding_results[domain_key]
+        else:
+            metrics.increment("rag_federated_timeouts", leg="embedding")
+            timed_out.append({"domain": domain_key[0], "model": domain_key[1], "leg": "embedding"})
+    if timed_out:
+        logger.warning("Federated search legs timed out", query=query, legs=len(timed_out))
+    return {
+        "results": federate_hits(text_hits, embedding_hits, k, weights),
+        "domains": [{"domain": domain_name, "model": model_name} for domain_name, model_name in domain_keys],
+        "timed_out": timed_out,
+    }
+
+def federated_search(es, domain_keys, query, search_embeddings, mode="hybrid", k=5, timeout=FEDERATED_DOMAIN_TIMEOUT,
+                     weights=None):
+    """
+    Search many domains at once and return a global top k.
+
+    The text leg is one multi-index Elasticsearch search over every domain's
+    index; the embedding legs run per domain in parallel on a shared worker
+    pool. Every leg has until timeout seconds after the start of the search:
+    a domain whose embedding leg is late (including a domain that is still
+    loading) is left out, and a late Elasticsearch search leaves out the text
+    hits of every domain, so one slow domain cannot stall the request.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        domain_keys (list): The (domain, model) pairs to search, e.g. from select_domains.
+        query (str): The query text.
+        search_embeddings (callable): Called with ((domain, model), query, candidates) on a
+            worker thread; returns the domain's chunk documents with 'score' fields, best first.
+        mode (str): 'text', 'embedding' or 'hybrid'.
+        k (int): The number of documents to return.
+        timeout (float): Seconds each domain has to answer.
+        weights (list): Optional [text, embedding] weights for the fusion.
+
+    Returns:
+        dict: 'results' (chunk documents as returned by federate_hits), 'domains' (the
+        searched domain-model pairs) and 'timed_out' (the domain, model and leg of each
+        leg that missed the timeout).
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    if mode not in ("text", "embedding", "hybrid"):
+        raise ValueError("Invalid mode. Choose from 'text', 'embedding', or 'hybrid'.")
+    candidates = k * HYBRID_CANDIDATE_MULTIPLIER
+    text_future = None
+    if mode != "embedding":
+        text_future = _executor.submit(multi_index_text_search, es, query, list(_index_names(domain_keys)), candidates)
+    embedding_futures = {}
+    if mode != "text":
+        embedding_futures = {domain_key: _executor.submit(_guarded, search_embeddings, domain_key, query, candidates)
+                             for domain_key in domain_keys}
+
+    futures = list(embedding_futures.values()) + ([text_future] if text_future is not None else [])
+    wait(futures, timeout=timeout)
+    text_done = text_future is not None and text_future.done()
+    return _collect(domain_keys, text_future.result() if text_done else {}, text_done,
+                    {domain_key: future.result() for domain_key, future in embedding_futures.items() if future.done()},
+                    mode, query, k, weights)
+
+async def federated_search_async(es, domain_keys, query, search_embeddings, mode="hybrid", k=5,
+                                 timeout=FEDERATED_DOMAIN_TIMEOUT, weights=None):
+    """
+    Async version of federated_search for the ASGI server.
+
+    Args:
+        es (AsyncElasticsearch): The async Elasticsearch client.
+        search_embeddings (callable): Coroutine function called with ((domain, model), query,
+            candidates); returns the domain's chunk documents with 'score' fields, best first.
+
+    The other arguments, the return value and the errors are those of federated_search.
+    Late legs are not cancelled, so a domain that is still loading finishes loading.
+    """
+    if mode not in ("text", "embedding", "hybrid"):
+        raise ValueError("Invalid mode. Choose from 'text', 'embedding', or 'hybrid'.")
+    candidates = k * HYBRID_CANDIDATE_MULTIPLIER
+    text_task = None
+    if mode != "embedding":
+        text_task = asyncio.ensure_future(
+            async_multi_index_text_search(es, query, list(_index_names(domain_keys)), candidates))
+    embedding_tasks = {}
+    if mode != "text":
+        embedding_tasks = {domain_key: asyncio.ensure_future(_guarded_async(search_embeddings, domain_key, query, candidates))
+                           for domain_key in domain_keys}
+
+    tasks = list(embedding_tasks.values()) + ([text_task] if text_task is not None else [])
+    await asyncio.wait(tasks, timeout=timeout)
+    text_done = text_task is not None and text_task.done()
+    return _collect(domain_keys, text_task.result() if text_done else {}, text_done,
+                    {domain_key: task.result() for domain_key, task in embedding_tasks.items() if task.done()},
+                    mode, query, k, weights)
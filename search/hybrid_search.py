@@ -0,0 +1,295 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from storage.docstore import split_chunk_faiss_id
+from storage.elastic_storage import get_documents_by_chunk_ids, async_get_documents_by_chunk_ids
+from search.text_search import text_search, text_search_batch, async_text_search
+from search.embedding_search import search_neighbours_batch, dedupe_neighbours, faiss_executor
+from utils.config import HYBRID_FUSION, HYBRID_CANDIDATE_MULTIPLIER, HYBRID_SEARCH_WORKERS, RRF_K
+
+# Shared pool that runs the Elasticsearch leg while the caller runs the FAISS leg
+_executor = ThreadPoolExecutor(max_workers=HYBRID_SEARCH_WORKERS, thread_name_prefix="hybrid-search")
+
+def reciprocal_rank_fusion(rankings, k=RRF_K, weights=None):
+    """
+    Merge ranked ID lists with reciprocal rank fusion.
+
+    Args:
+        rankings (list): Lists of IDs, each ordered best first.
+        k (int): The RRF constant; larger values flatten the rank contribution.
+        weights (list): Optional weight per ranking.
+
+    Returns:
+        dict: Fused score per ID.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] = scores.get(item_id, 0.0) + weight / (k + rank + 1)
+    return scores
+
+def weighted_score_fusion(scored_lists, weights=None):
+    """
+    Merge scored ID lists by a weighted sum of min-max normalised scores.
+
+    Args:
+        scored_lists (list): Lists of (ID, score) pairs where higher scores are better.
+        weights (list): Optional weight per list.
+
+    Returns:
+        dict: Fused score per ID.
+    """
+    weights = weights or [1.0] * len(scored_lists)
+    scores = {}
+    for scored, weight in zip(scored_lists, weights):
+        if not scored:
+            continue
+        values = [score for _, score in scored]
+        low, high = min(values), max(values)
+        for item_id, score in scored:
+            normalised = (score - low) / (high - low) if high != low else 1.0
+            scores[item_id] = scores.get(item_id, 0.0) + weight * normalised
+    return scores
+
+def fuse_hits(text_hits, embedding_hits, k, fusion=HYBRID_FUSION, weights=None):
+    """
+    Fuse the hits of the text and embedding legs into a per-document ranking.
+
+    Args:
+        text_hits (list): (document, score) pairs from text_search.
+        embedding_hits (list): (unique_id, score) pairs of the FAISS leg, one per document.
+        k (int): The number of documents to keep.
+        fusion (str): 'rrf' or 'weighted'.
+        weights (list): Optional [text, embedding] weights for the fusion.
+
+    Returns:
+        tuple: (results, documents, missing) where results are (unique_id, score,
+        text_rank, embedding_rank) tuples best first, documents maps unique_id to
+        the chunk documents returned by the text leg, and missing lists the top
+        IDs only the embedding leg returned, whose chunks the caller still has to fetch.
+
+    Raises:
+        ValueError: If the fusion method is unknown.
+    """
+    if fusion not in ("rrf", "weighted"):
+        raise ValueError("Invalid fusion. Choose from 'rrf' or 'weighted'.")
+
+    # Keep the best-scoring chunk of each document from the text leg
+    text_documents = {}
+    text_scored = []
+    for document, score in text_hits:
+        unique_id = str(document['unique_id'])
+        if unique_id not in text_documents:
+            text_documents[unique_id] = document
+            text_scored.append((unique_id, score))
+
+    if fusion == "rrf":
+        scores = reciprocal_rank_fusion(
+            [[unique_id for unique_id, _ in text_scored], [unique_id for unique_id, _ in embedding_hits]],
+            weights=weights,
+        )
+    else:
+        scores = weighted_score_fusion([text_scored, embedding_hits], weights)
+
+    top_ids = sorted(scores, key=scores.get, reverse=True)[:k]
+    text_ranks = {unique_id: rank for rank, (unique_id, _) in enumerate(text_scored)}
+    embedding_ranks = {unique_id: rank for rank, (unique_id, _) in enumerate(embedding_hits)}
+    results = [(unique_id, scores[unique_id], text_ranks.get(unique_id), embedding_ranks.get(unique_id))
+               for unique_id in top_ids]
+    missing = [unique_id for unique_id in top_ids if unique_id not in text_documents]
+    return results, text_documents, missing
+
+def split_neighbours(neighbours):
+    """
+    Split one-per-document (chunk FAISS ID, score) pairs into the (unique_id, score)
+    embedding hits of fuse_hits and the FAISS ID of each document's closest chunk.
+    """
+    hits = []
+    faiss_ids = {}
+    for faiss_id, score in neighbours:
+        unique_id, _ = split_chunk_faiss_id(faiss_id)
+        hits.append((unique_id, score))
+        faiss_ids[unique_id] = faiss_id
+    return hits, faiss_ids
+
+def chunk_id_of(faiss_id):
+    """Return the "{unique_id}_{ordinal}" chunk_id of a chunk FAISS ID."""
+    return "{}_{}".format(*split_chunk_faiss_id(faiss_id))
+
+def fetch_chunks(es, index_name, docstore, faiss_ids):
+    """
+    Fetch chunks by FAISS ID: from the docstore with one local lookup when it is
+    given, otherwise from Elasticsearch with one terms query on chunk_id.
+
+    Returns:
+        dict: The chunk document per FAISS ID; IDs that were not found are omitted.
+    """
+    if not faiss_ids:
+        return {}
+    if docstore is not None:
+        return docstore.get_many(faiss_ids)
+    found = get_documents_by_chunk_ids(es, index_name, [chunk_id_of(faiss_id) for faiss_id in faiss_ids])
+    return {faiss_id: found[chunk_id_of(faiss_id)] for faiss_id in faiss_ids if chunk_id_of(faiss_id) in found}
+
+def matched_chunks(missing, faiss_ids, chunks):
+    """Return the fetched chunk FAISS matched for each document in missing, keyed by unique_id."""
+    return {unique_id: chunks[faiss_ids[unique_id]] for unique_id in missing if faiss_ids[unique_id] in chunks}
+
+def build_results(results, documents):
+    """Attach the fused score and leg ranks to each document, skipping IDs with no document."""
+    return [
+        {**documents[unique_id], "score": score, "text_rank": text_rank, "embedding_rank": embedding_rank}
+        for unique_id, score, text_rank, embedding_rank in results
+        if unique_id in documents
+    ]
+
+def hybrid_search(es, faiss_index, query, index_name, k=5, embedder=None, fusion=HYBRID_FUSION, weights=None,
+                  search_embeddings=None, docstore=None):
+    """
+    Run keyword and embedding search concurrently and fuse the results.
+
+    The Elasticsearch leg runs on a shared worker pool while the FAISS leg runs in
+    the calling thread, so latency is close to the slower leg rather than the sum.
+    Results are deduplicated per document (unique_id). A document found only by
+    FAISS is returned as the chunk FAISS matched, read from the docstore (or, without
+    one, from Elasticsearch with one terms query).
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        faiss_index (faiss.Index): The FAISS index to search.
+        query (str): The query text.
+        index_name (str): The Elasticsearch index name.
+        k (int): The number of documents to return.
+        embedder (Embedder): The embedder the FAISS index was built with.
+        fusion (str): 'rrf' for reciprocal rank fusion or 'weighted' for weighted score fusion.
+        weights (list): Optional [text, embedding] weights for the fusion.
+        search_embeddings (callable): Optional replacement for the FAISS leg, called with
+            (query, candidates) and returning best-first (chunk FAISS ID, score) pairs, one
+            per document, e.g. through a domain's search coalescer. faiss_index and embedder
+            are unused when it is given.
+        docstore (ChunkDocstore): The docstore of the searched index.
+
+    Returns:
+        list: Chunk documents, best first, each with 'score', 'text_rank' and
+        'embedding_rank' fields (ranks are None when a leg did not return the document).
+
+    Raises:
+        ValueError: If the fusion method is unknown.
+    """
+    if fusion not in ("rrf", "weighted"):
+        raise ValueError("Invalid fusion. Choose from 'rrf' or 'weighted'.")
+
+    candidates = k * HYBRID_CANDIDATE_MULTIPLIER
+    text_future = _executor.submit(text_search, es, query, index_name, candidates)
+    if search_embeddings is not None:
+        neighbours = search_embeddings(query, candidates)
+    else:
+        neighbours = dedupe_neighbours(search_neighbours_batch(faiss_index, [query], candidates * 4, embedder)[0],
+                                       candidates)
+    embedding_hits, faiss_ids = split_neighbours(neighbours)
+    text_hits = text_future.result()
+
+    results, documents, missing = fuse_hits(text_hits, embedding_hits, k, fusion, weights)
+    chunks = fetch_chunks(es, index_name, docstore, [faiss_ids[unique_id] for unique_id in missing])
+    documents.update(matched_chunks(missing, faiss_ids, chunks))
+    return build_results(results, documents)
+
+def hybrid_search_batch(es, faiss_index, queries, index_name, k=5, embedder=None, fusion=HYBRID_FUSION, weights=None,
+                        search_embeddings_batch=None, docstore=None):
+    """
+    Run hybrid_search for many queries with one _msearch, one FAISS search and one chunk fetch.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        faiss_index (faiss.Index): The FAISS index to search.
+        queries (list): The query texts.
+        index_name (str): The Elasticsearch index name.
+        k (int): The number of documents to return per query.
+        embedder (Embedder): The embedder the FAISS index was built with.
+        fusion (str): 'rrf' or 'weighted'.
+        weights (list): Optional [text, embedding] weights for the fusion.
+        search_embeddings_batch (callable): Optional replacement for the FAISS leg, called
+            with (queries, candidates) and returning the (chunk FAISS ID, score) pairs of
+            each query, as search_embeddings does for hybrid_search. faiss_index and embedder
+            are unused when it is given.
+        docstore (ChunkDocstore): The docstore of the searched index.
+
+    Returns:
+        list: For each query, in order, its results as returned by hybrid_search.
+
+    Raises:
+        ValueError: If the fusion method is unknown.
+    """
+    if fusion not in ("rrf", "weighted"):
+        raise ValueError("Invalid fusion. Choose from 'rrf' or 'weighted'.")
+    if not queries:
+        return []
+
+    candidates = k * HYBRID_CANDIDATE_MULTIPLIER
+    text_future = _executor.submit(text_search_batch, es, queries, index_name, candidates)
+    if search_embeddings_batch is not None:
+        neighbour_lists = search_embeddings_batch(queries, candidates)
+    else:
+        neighbour_lists = [dedupe_neighbours(row, candidates)
+                           for row in search_neighbours_batch(faiss_index, queries, candidates * 4, embedder)]
+    split = [split_neighbours(neighbours) for neighbours in neighbour_lists]
+    text_hits = text_future.result()
+
+    fused = [fuse_hits(query_text_hits, embedding_hits, k, fusion, weights)
+             for query_text_hits, (embedding_hits, _) in zip(text_hits, split)]
+
+    # Fetch the chunks every query is missing in one lookup. A document can match
+    # different chunks for different queries, so each query keeps its own.
+    missing = {faiss_ids[unique_id] for (_, _, query_missing), (_, faiss_ids) in zip(fused, split)
+               for unique_id in query_missing}
+    chunks = fetch_chunks(es, index_name, docstore, sorted(missing))
+    return [build_results(results, {**query_documents, **matched_chunks(query_missing, faiss_ids, chunks)})
+            for (results, query_documents, query_missing), (_, faiss_ids) in zip(fused, split)]
+
+async def hybrid_search_async(es, search_embeddings, query, index_name, k=5, fusion=HYBRID_FUSION, weights=None,
+                              docstore=None):
+    """
+    Async hybrid search for the ASGI server.
+
+    The Elasticsearch leg runs on the event loop with the async client while the
+    FAISS leg is awaited from search_embeddings, which runs off the event loop.
+
+    Args:
+        es (AsyncElasticsearch): The async Elasticsearch client.
+        search_embeddings (callable): Coroutine function called with (query, candidates);
+            returns the (chunk FAISS ID, score) pairs of the FAISS leg, one per document.
+        query (str): The query text.
+        index_name (str): The Elasticsearch index name.
+        k (int): The number of documents to return.
+        fusion (str): 'rrf' or 'weighted'.
+        weights (list): Optional [text, embedding] weights for the fusion.
+        docstore (ChunkDocstore): The docstore of the searched index, read on the FAISS
+            worker pool.
+
+    Returns:
+        list: Chunk documents in the same shape as hybrid_search.
+
+    Raises:
+        ValueError: If the fusion method is unknown.
+    """
+    if fusion not in ("rrf", "weighted"):
+        raise ValueError("Invalid fusion. Choose from 'rrf' or 'weighted'.")
+
+    candidates = k * HYBRID_CANDIDATE_MULTIPLIER
+    text_hits, neighbours = await asyncio.gather(
+        async_text_search(es, query, index_name, candidates),
+        search_embeddings(query, candidates),
+    )
+    embedding_hits, faiss_ids = split_neighbours(neighbours)
+
+    results, documents, missing = fuse_hits(text_hits, embedding_hits, k, fusion, weights)
+    wanted = [faiss_ids[unique_id] for unique_id in missing]
+    if wanted and docstore is not None:
+        chunks = await asyncio.get_running_loop().run_in_executor(faiss_executor, docstore.get_many, wanted)
+    elif wanted:
+        found = await async_get_documents_by_chunk_ids(es, index_name, [chunk_id_of(faiss_id) for faiss_id in wanted])
+        chunks = {faiss_id: found[chunk_id_of(faiss_id)] for faiss_id in wanted if chunk_id_of(faiss_id) in found}
+    else:
+        chunks = {}
+    documents.update(matched_chunks(missing, faiss_ids, chunks))
+    return build_results(results, documents)
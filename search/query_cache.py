@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import OrderedDict
+from utils.config import QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_MAX_BYTES, QUERY_CACHE_TTL
+
+def normalize_query(query):
+    """Lower-case a query and collapse its whitespace so equivalent queries share a cache entry."""
+    return " ".join(query.lower().split())
+
+def estimate_size(value):
+    """Roughly estimate the memory held by a search result, in bytes."""
+    if isinstance(value, str):
+        return 49 + len(value)
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(estimate_size(item) for item in value)
+    return 32
+
+class QueryCache:
+    """
+    Thread-safe LRU cache of search results with a TTL and a memory budget.
+
+    Entries are keyed by (domain, model, mode, normalised query, k). Each domain has
+    a generation counter; invalidate_domain drops the domain's entries and bumps the
+    counter so a search that started before the write cannot store a stale result.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_MAX_ENTRIES, max_bytes=QUERY_CACHE_MAX_BYTES, ttl=QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._domain_keys = {}  # (domain, model) -> set of keys
+        self._generations = {}  # (domain, model) -> int
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _remove(self, key):
+        """Drop one entry. Caller holds the lock."""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        domain_keys = self._domain_keys.get(key[:2])
+        if domain_keys is not None:
+            domain_keys.discard(key)
+
+    def lookup(self, domain_name, model_name, mode, query, k):
+        """
+        Look up a cached search result.
+
+        Returns:
+            tuple: (hit, value, key, generation). On a miss, pass key and generation
+            to store once the result is computed.
+        """
+        key = (domain_name, model_name, mode, normalize_query(query), k)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[2], key, None
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return False, None, key, self._generations.get(key[:2], 0)
+
+    def store(self, key, generation, value):
+        """Cache a computed result unless its domain was invalidated since the lookup."""
+        size = estimate_size(value)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if self._generations.get(key[:2], 0) != generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._domain_keys.setdefault(key[:2], set()).add(key)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_compute(self, domain_name, model_name, mode, query, k, compute):
+        """
+        Return the cached result for a search, computing and caching it on a miss.
+
+        Args:
+            domain_name (str): The domain name.
+            model_name (str): The model name.
+            mode (str): The search mode.
+            query (str): The query text.
+            k (int): The number of results.
+            compute (callable): Runs the search when the result is not cached.
+
+        Returns:
+            The search result.
+        """
+        hit, value, key, generation = self.lookup(domain_name, model_name, mode, query, k)
+        if hit:
+            return value
+        value = compute()
+        self.store(key, generation, value)
+        return value
+
+    async def get_or_compute_async(self, domain_name, model_name, mode, query, k, compute):
+        """Async version of get_or_compute; compute is a coroutine function."""
+        hit, value, key, generation = self.lookup(domain_name, model_name, mode, query, k)
+        if hit:
+            return value
+        value = await compute()
+        self.store(key, generation, value)
+        return value
+
+    def invalidate_domain(self, domain_name, model_name):
+        """Drop every cached result of a domain-model pair."""
+        domain_key = (domain_name, model_name)
+        with self._lock:
+            self._generations[domain_key] = self._generations.get(domain_key, 0) + 1
+            for key in list(self._domain_keys.pop(domain_key, ())):
+                if key in self._entries:
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        """Drop every cached result."""
+        with self._lock:
+            for domain_key in self._domain_keys:
+                self._generations[domain_key] = self._generations.get(domain_key, 0) + 1
+            self._entries.clear()
+            self._domain_keys.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return the hit and miss counters and the current footprint."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+# Process-wide cache shared by RAGManager and RAGDomain
+query_cache = QueryCache()
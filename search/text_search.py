@@ -0,0 +1,67 @@
+from storage.elastic_storage import multi_search
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+def get_relevance_query(query, k=5):
+    """Return the match query used by text_search."""
+    return {
+        "query": {
+            "match": {
+                "data": query
+            }
+        },
+        "size": k
+    }
+
+def scored_documents(hits):
+    """Turn (document, score) pairs into documents with a 'score' field, as the domain search methods return them."""
+    return [{**document, "score": score} for document, score in hits]
+
+@metrics.timed("rag_elasticsearch_seconds", operation="search")
+def text_search(es, query, index_name, k=5):
+    """
+    Keyword search over chunk documents, ranked by Elasticsearch relevance.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        query (str): The text query to search for.
+        index_name (str): The name of the index to search.
+        k (int): The number of top results to return.
+
+    Returns:
+        list: (document, score) pairs, best first. Each document is the chunk's _source.
+    """
+    try:
+        response = es.search(index=index_name, body=get_relevance_query(query, k))
+    except Exception as e:
+        logger.error("Failed to search documents", index=index_name, error=e)
+        return []
+    return [(hit['_source'], hit['_score']) for hit in response['hits']['hits']]
+
+@metrics.timed("rag_elasticsearch_seconds", operation="search")
+async def async_text_search(es, query, index_name, k=5):
+    """Async version of text_search for an AsyncElasticsearch client."""
+    try:
+        response = await es.search(index=index_name, body=get_relevance_query(query, k))
+    except Exception as e:
+        logger.error("Failed to search documents", index=index_name, error=e)
+        return []
+    return [(hit['_source'], hit['_score']) for hit in response['hits']['hits']]
+
+def text_search_batch(es, queries, index_name, k=5):
+    """
+    Run text_search for many queries with a single _msearch request.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        queries (list): The text queries.
+        index_name (str): The name of the index to search.
+        k (int): The number of top results per query.
+
+    Returns:
+        list: For each query, in order, its (document, score) pairs, best first.
+    """
+    bodies = [get_relevance_query(query, k) for query in queries]
+    return [[(hit['_source'], hit['_score']) for hit in hits] for hits in multi_search(es, index_name, bodies)]
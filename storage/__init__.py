@@ -1,5 +1,7 @@
 # This file makes the storage directory a package.
 
-from .json_storage import save_to_json
+from .json_storage import save_to_json, save_batch_to_json, iter_json_documents, get_document_log
 from .faiss_storage import *
 from .elastic_storage import *
+from .embedding_cache import embed_with_cache, get_embedding_cache
+from .docstore import ChunkDocstore, get_docstore, chunk_faiss_id, split_chunk_faiss_id
@@ -0,0 +1,191 @@
+import json
+import os
+import sqlite3
+import threading
+from utils.config import DOCSTORE_PATH, CHUNK_ID_BITS
+
+CHUNK_ORDINAL_MASK = (1 << CHUNK_ID_BITS) - 1
+
+def chunk_faiss_id(unique_id, ordinal):
+    """
+    Return the FAISS ID of a chunk: the document's unique_id in the high bits and the chunk ordinal in the low bits.
+
+    Raises:
+        ValueError: If the ordinal does not fit in CHUNK_ID_BITS.
+    """
+    if ordinal > CHUNK_ORDINAL_MASK:
+        raise ValueError(f"Document {unique_id} has more than {CHUNK_ORDINAL_MASK + 1} chunks")
+    return (int(unique_id) << CHUNK_ID_BITS) | ordinal
+
+def split_chunk_faiss_id(faiss_id):
+    """Return the (unique_id, ordinal) pair encoded in a chunk's FAISS ID."""
+    return str(faiss_id >> CHUNK_ID_BITS), faiss_id & CHUNK_ORDINAL_MASK
+
+def get_chunk_faiss_id(chunk_document):
+    """Return the FAISS ID of a chunk document from its "{unique_id}_{ordinal}" chunk_id."""
+    unique_id, ordinal = chunk_document['chunk_id'].rsplit('_', 1)
+    return chunk_faiss_id(unique_id, int(ordinal))
+
+class ChunkDocstore:
+    """
+    Local SQLite store of the chunks of one domain-model pair.
+
+    Each row is keyed by the chunk's FAISS ID and holds the document's unique_id,
+    the chunk ordinal, the chunk text and the rest of the chunk document as JSON
+    metadata, so FAISS hits can be turned into chunk text with one local lookup
+    instead of an Elasticsearch round trip. Writes are idempotent, so replaying
+    the document log into the store is safe.
+
+    The store also keeps the tombstones of deleted documents whose vectors are
+    still in the FAISS index, with the number of such vectors, until the index
+    is compacted. They are mirrored in memory for filtering search results.
+    """
+
+    def __init__(self, domain_name, model_name, directory=DOCSTORE_PATH):
+        os.makedirs(directory, exist_ok=True)
+        self.file_path = os.path.join(directory, f"{domain_name}_{model_name}.sqlite")
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.file_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "chunk_id INTEGER PRIMARY KEY, unique_id TEXT NOT NULL, ordinal INTEGER NOT NULL, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS chunks_unique_id ON chunks (unique_id)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS tombstones (unique_id TEXT PRIMARY KEY, vectors INTEGER NOT NULL)"
+        )
+        self._connection.commit()
+        self.tombstones = dict(self._connection.execute("SELECT unique_id, vectors FROM tombstones"))
+        self.tombstoned_vectors = sum(self.tombstones.values())
+
+    def put_many(self, chunk_documents):
+        """
+        Store chunk documents.
+
+        Args:
+            chunk_documents (list): Chunk documents with 'unique_id', 'chunk_id' and 'data' fields.
+        """
+        rows = []
+        for chunk in chunk_documents:
+            faiss_id = get_chunk_faiss_id(chunk)
+            metadata = {key: value for key, value in chunk.items() if key not in ('data', 'unique_id', 'chunk_id')}
+            rows.append((faiss_id, str(chunk['unique_id']), faiss_id & CHUNK_ORDINAL_MASK, chunk['data'],
+                         json.dumps(metadata, separators=(',', ':'))))
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+            self._connection.commit()
+
+    def get_many(self, faiss_ids):
+        """
+        Look up chunks by FAISS ID.
+
+        Args:
+            faiss_ids (list): The chunk FAISS IDs.
+
+        Returns:
+            dict: The chunk document per FAISS ID, with 'unique_id', 'chunk_id',
+            'ordinal' and 'data' fields plus the stored metadata. Unknown IDs are omitted.
+        """
+        faiss_ids = list(set(faiss_ids))
+        found = {}
+        with self._lock:
+            # Stay below SQLite's host parameter limit
+            for start in range(0, len(faiss_ids), 500):
+                part = faiss_ids[start:start + 500]
+                cursor = self._connection.execute(
+                    f"SELECT chunk_id, unique_id, ordinal, text, metadata FROM chunks WHERE chunk_id IN ({','.join('?' * len(part))})",
+                    part,
+                )
+                for faiss_id, unique_id, ordinal, text, metadata in cursor:
+                    found[faiss_id] = {
+                        **json.loads(metadata),
+                        "unique_id": unique_id,
+                        "chunk_id": f"{unique_id}_{ordinal}",
+                        "ordinal": ordinal,
+                        "data": text,
+                    }
+        return found
+
+    def iter_texts(self, batch_size=10000):
+        """
+        Yield the stored chunks in FAISS ID order, in batches.
+
+        Yields:
+            tuple: A list of chunk FAISS IDs and a list of their texts.
+        """
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT chunk_id, text FROM chunks WHERE chunk_id > ? ORDER BY chunk_id LIMIT ?", (last, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield [row[0] for row in rows], [row[1] for row in rows]
+
+    def has_document(self, unique_id):
+        """Return True if any chunk of the document is stored."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT 1 FROM chunks WHERE unique_id = ? LIMIT 1", (str(unique_id),)
+            ).fetchone() is not None
+
+    def delete_document(self, unique_id):
+        """
+        Delete a document's chunks and record a tombstone for their FAISS vectors.
+
+        Returns:
+            int: The number of chunks deleted.
+        """
+        unique_id = str(unique_id)
+        with self._lock:
+            deleted = self._connection.execute("DELETE FROM chunks WHERE unique_id = ?", (unique_id,)).rowcount
+            vectors = self.tombstones.get(unique_id, 0) + deleted
+            self._connection.execute("INSERT OR REPLACE INTO tombstones VALUES (?, ?)", (unique_id, vectors))
+            self._connection.commit()
+            self.tombstoned_vectors += vectors - self.tombstones.get(unique_id, 0)
+            self.tombstones[unique_id] = vectors
+        return deleted
+
+    def clear_tombstones(self, unique_ids):
+        """Drop the tombstones of documents whose vectors were removed from FAISS."""
+        unique_ids = [str(unique_id) for unique_id in unique_ids]
+        with self._lock:
+            self._connection.executemany("DELETE FROM tombstones WHERE unique_id = ?", [(unique_id,) for unique_id in unique_ids])
+            self._connection.commit()
+            for unique_id in unique_ids:
+                self.tombstoned_vectors -= self.tombstones.pop(unique_id, 0)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+_docstores = {}
+_docstores_lock = threading.Lock()
+
+def get_docstore(domain_name, model_name):
+    """Return the process-wide ChunkDocstore of a domain-model pair, opening it on first use."""
+    key = (domain_name, model_name)
+    with _docstores_lock:
+        docstore = _docstores.get(key)
+        if docstore is None:
+            docstore = ChunkDocstore(domain_name, model_name)
+            _docstores[key] = docstore
+        return docstore
+
+def close_docstores():
+    """Close every open docstore; the next get_docstore call reopens it."""
+    with _docstores_lock:
+        docstores = list(_docstores.values())
+        _docstores.clear()
+    for docstore in docstores:
+        docstore.close()
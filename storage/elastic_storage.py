@@ -1,43 +1,267 @@
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+from elastic_transport import Transport, Urllib3HttpNode, AsyncTransport, AiohttpHttpNode
 from datetime import datetime
+import asyncio
+import contextvars
 import sys
 import os
+import threading
+import time
 import warnings
 
 # Add the root directory of your project to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.config import ELASTICSEARCH_HOSTS, ELASTICSEARCH_CLOUD_ID, ELASTICSEARCH_API_KEY, ELASTICSEARCH_USERNAME, ELASTICSEARCH_PASSWORD
+from utils.config import (ELASTICSEARCH_CONNECTIONS_PER_NODE, ELASTICSEARCH_REQUEST_TIMEOUT, ELASTICSEARCH_MAX_RETRIES,
+                          ELASTICSEARCH_RETRY_ON_STATUS, ELASTICSEARCH_RETRY_BACKOFF, ELASTICSEARCH_MAX_RETRY_BACKOFF)
+from utils.config import LOG_SAMPLE_EVERY
 from utils.id_generator import generate_unique_id
+from utils.logger import get_logger
+from utils.metrics import metrics
 
 # Suppress warnings for unverified HTTPS requests
 warnings.filterwarnings("ignore", category=UserWarning, module='urllib3')
 
+logger = get_logger(__name__)
+metrics.describe("rag_elasticsearch_seconds", "Latency of Elasticsearch calls, by operation.")
+
+INDEX_MAPPINGS = {
+    "mappings": {
+        "properties": {
+            "unique_id": {"type": "keyword"},
+            "chunk_id": {"type": "keyword"},
+            "timestamp": {"type": "date"},
+            "data": {"type": "text"},
+            "model": {"type": "keyword"},
+            "domain": {"type": "keyword"}
+        }
+    }
+}
+
+class PoolStats:
+    """Thread-safe counters for the shared Elasticsearch client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.attempts = 0
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failures = 0
+
+    def start_request(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def end_request(self, failed):
+        with self._lock:
+            self.in_flight -= 1
+            self.failures += failed
+
+    def add_attempt(self):
+        with self._lock:
+            self.attempts += 1
+
+    def add_retry(self, delay):
+        with self._lock:
+            self.retries += 1
+            self.backoff_seconds += delay
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "backoff_seconds": round(self.backoff_seconds, 3),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "failures": self.failures,
+                "connections_per_node": ELASTICSEARCH_CONNECTIONS_PER_NODE,
+            }
+
+pool_stats = PoolStats()
+
+# Attempts made so far by the request the current thread or task is performing; None outside a request
+_attempts = contextvars.ContextVar("elasticsearch_attempts", default=None)
+
+def get_retry_delay(retry):
+    """Return the seconds to wait before a request's retry-th retry: a capped exponential backoff."""
+    return min(ELASTICSEARCH_RETRY_BACKOFF * 2 ** (retry - 1), ELASTICSEARCH_MAX_RETRY_BACKOFF)
+
+def start_attempt():
+    """
+    Count an attempt of the current request and return the delay to wait before sending it.
+
+    The transport calls its node once per attempt and retries without waiting, so
+    the delay of each retry is applied by the node. The first attempt is not delayed.
+    """
+    pool_stats.add_attempt()
+    attempts = _attempts.get()
+    if attempts is None:
+        return 0
+    _attempts.set(attempts + 1)
+    if not attempts:
+        return 0
+    delay = get_retry_delay(attempts)
+    pool_stats.add_retry(delay)
+    return delay
+
+class InstrumentedTransport(Transport):
+    """Transport that counts logical requests, failed requests and the requests currently in flight."""
+
+    def perform_request(self, *args, **kwargs):
+        pool_stats.start_request()
+        token = _attempts.set(0)
+        failed = True
+        try:
+            response = super().perform_request(*args, **kwargs)
+            # A retryable status still returned after the last retry is a failure too
+            failed = response.meta.status in ELASTICSEARCH_RETRY_ON_STATUS
+            return response
+        finally:
+            _attempts.reset(token)
+            pool_stats.end_request(failed)
+
+class InstrumentedNode(Urllib3HttpNode):
+    """HTTP node that counts every attempt and waits out the retry backoff before a retry."""
+
+    def perform_request(self, *args, **kwargs):
+        delay = start_attempt()
+        if delay:
+            time.sleep(delay)
+        return super().perform_request(*args, **kwargs)
+
+class InstrumentedAsyncTransport(AsyncTransport):
+    """Async counterpart of InstrumentedTransport, used by the async client."""
+
+    async def perform_request(self, *args, **kwargs):
+        pool_stats.start_request()
+        token = _attempts.set(0)
+        failed = True
+        try:
+            response = await super().perform_request(*args, **kwargs)
+            failed = response.meta.status in ELASTICSEARCH_RETRY_ON_STATUS
+            return response
+        finally:
+            _attempts.reset(token)
+            pool_stats.end_request(failed)
+
+class InstrumentedAiohttpNode(AiohttpHttpNode):
+    """Async counterpart of InstrumentedNode, used by the async client."""
+
+    async def perform_request(self, *args, **kwargs):
+        delay = start_attempt()
+        if delay:
+            await asyncio.sleep(delay)
+        return await super().perform_request(*args, **kwargs)
+
+def get_pool_options(transport_class=InstrumentedTransport, node_class=InstrumentedNode):
+    """Return the connection pool and retry options shared by the sync and async clients."""
+    return {
+        "connections_per_node": ELASTICSEARCH_CONNECTIONS_PER_NODE,
+        "request_timeout": ELASTICSEARCH_REQUEST_TIMEOUT,
+        "max_retries": ELASTICSEARCH_MAX_RETRIES,
+        "retry_on_timeout": True,
+        "retry_on_status": ELASTICSEARCH_RETRY_ON_STATUS,
+        "dead_node_backoff_factor": ELASTICSEARCH_RETRY_BACKOFF,
+        "max_dead_node_backoff": ELASTICSEARCH_MAX_RETRY_BACKOFF,
+        "transport_class": transport_class,
+        "node_class": node_class,
+    }
+
+def get_connection_options():
+    """Return the host and authentication options from the configuration."""
+    if ELASTICSEARCH_CLOUD_ID:
+        return {"cloud_id": ELASTICSEARCH_CLOUD_ID, "api_key": ELASTICSEARCH_API_KEY}
+    return {
+        "hosts": ELASTICSEARCH_HOSTS,
+        "http_auth": (ELASTICSEARCH_USERNAME, ELASTICSEARCH_PASSWORD),
+        "verify_certs": False,
+    }
+
 def initialize_elasticsearch():
     """
-    Initialize the Elasticsearch client.
+    Initialize a new Elasticsearch client with a pooled, retrying transport.
+
+    Most callers should use get_elasticsearch_client, which shares one client
+    (and its connection pool) across every domain in the process.
 
     Returns:
         Elasticsearch: The initialized Elasticsearch client.
     """
-    if ELASTICSEARCH_CLOUD_ID:
-        es = Elasticsearch(cloud_id=ELASTICSEARCH_CLOUD_ID, api_key=ELASTICSEARCH_API_KEY)
-    else:
-        es = Elasticsearch(
-            hosts=ELASTICSEARCH_HOSTS,
-            http_auth=(ELASTICSEARCH_USERNAME, ELASTICSEARCH_PASSWORD),
-            verify_certs=False  
-        )
+    es = Elasticsearch(**get_connection_options(), **get_pool_options())
 
     # Test connection
     try:
-        es.ping()
-        print("Connected to Elasticsearch")
+        if es.ping():
+            logger.info("Connected to Elasticsearch")
+        else:
+            logger.error("Failed to connect to Elasticsearch")
     except Exception as e:
-        print(f"Failed to connect to Elasticsearch: {e}")
+        logger.error("Failed to connect to Elasticsearch", error=e)
     
     return es
 
+_client = None
+_client_lock = threading.Lock()
+
+def get_elasticsearch_client():
+    """
+    Return the process-wide Elasticsearch client, creating it on first use.
+
+    The client's connection pool is shared by all domains; connections are kept
+    alive between requests, so only the first call pays for connecting and pinging.
+
+    Returns:
+        Elasticsearch: The shared Elasticsearch client.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = initialize_elasticsearch()
+        return _client
+
+_async_client = None
+
+def get_async_elasticsearch_client():
+    """
+    Return the process-wide async Elasticsearch client, creating it on first use.
+
+    The async client has its own aiohttp connection pool with the same size and
+    retry policy as the sync client, and reports to the same pool counters. It
+    must be used from the event loop of the server that created it.
+
+    Returns:
+        AsyncElasticsearch: The shared async Elasticsearch client.
+    """
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            _async_client = AsyncElasticsearch(
+                **get_connection_options(),
+                **get_pool_options(InstrumentedAsyncTransport, InstrumentedAiohttpNode)
+            )
+        return _async_client
+
+async def close_async_elasticsearch_client():
+    """Close the async client's connections, if it was created."""
+    global _async_client
+    with _client_lock:
+        client, _async_client = _async_client, None
+    if client is not None:
+        await client.close()
+
+def get_pool_stats():
+    """Return request, retry and in-flight counters of the shared Elasticsearch client."""
+    return pool_stats.snapshot()
+
+@metrics.timed("rag_elasticsearch_seconds", operation="index")
 def save_to_elasticsearch(es, document, model, unique_id=None):
     """
     Save a document to Elasticsearch with additional fields.
@@ -77,81 +301,317 @@ def save_to_elasticsearch(es, document, model, unique_id=None):
                 }
             }
         })
-        print(f"Created new index: {index_name}")
+        logger.info("Created new index", index=index_name)
 
     # Save the document to Elasticsearch
     es.index(index=index_name, id=document['unique_id'], body=document)
-    print(f"Document saved to Elasticsearch index: {index_name}")
+    logger.debug("Document saved to Elasticsearch", index=index_name, unique_id=document['unique_id'], every=LOG_SAMPLE_EVERY)
+
+@metrics.timed("rag_elasticsearch_seconds", operation="ensure_index")
+def ensure_index(es, index_name):
+    """
+    Create the Elasticsearch index with the domain mappings if it does not exist.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        index_name (str): The name of the index to create.
+
+    Returns:
+        bool: True if the index was created, False if it already existed.
+    """
+    if es.indices.exists(index=index_name):
+        return False
+    es.indices.create(index=index_name, body=INDEX_MAPPINGS)
+    logger.info("Created new index", index=index_name)
+    return True
+
+class BulkIndexError(Exception):
+    """Raised when Elasticsearch rejects documents of a _bulk request, after the retryable rejections were retried."""
+
+    def __init__(self, index_name, errors):
+        """
+        Args:
+            index_name (str): The index written to.
+            errors (dict): The error Elasticsearch returned for each rejected chunk_id.
+        """
+        self.index_name = index_name
+        self.errors = errors
+        super().__init__(f"Elasticsearch rejected {len(errors)} documents of index {index_name}: "
+                         f"{next(iter(errors.values()))}")
+
+@metrics.timed("rag_elasticsearch_seconds", operation="bulk")
+def bulk_save_to_elasticsearch(es, documents, model, index_name, refresh=False):
+    """
+    Save a batch of chunk documents to Elasticsearch with a single _bulk request.
+
+    The index is expected to exist already (see ensure_index), so no per-document
+    existence check is made. A _bulk request succeeds as a whole even when some
+    of its documents are rejected; documents rejected with a status in
+    ELASTICSEARCH_RETRY_ON_STATUS (e.g. 429 when the write queue is full) are
+    sent again, up to ELASTICSEARCH_MAX_RETRIES times with the same backoff as
+    the client's retries. Any other rejection, or one that outlasts the retries,
+    raises, so callers never checkpoint past a document missing from Elasticsearch.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        documents (list): The chunk documents to save. Each must contain 'domain',
+            'unique_id' and 'chunk_id' fields.
+        model (str): The model name to be stored with each document.
+        index_name (str): The name of the index to write to.
+        refresh (bool): Whether to refresh the index after the request.
+
+    Returns:
+        int: The number of documents indexed.
+
+    Raises:
+        ValueError: If a document does not contain a 'domain' field.
+        BulkIndexError: If documents are still rejected after the retries.
+    """
+    if not documents:
+        return 0
+
+    timestamp = datetime.utcnow().isoformat()
+    for document in documents:
+        if not document.get('domain'):
+            raise ValueError("Document must contain a 'domain' field")
+        document.setdefault('timestamp', timestamp)
+        document['model'] = model
 
-def get_all_documents(es, index_name):
+    pending = documents
+    retry = 0
+    while True:
+        operations = []
+        for document in pending:
+            operations.append({"index": {"_index": index_name, "_id": document['chunk_id']}})
+            operations.append(document)
+        response = es.bulk(operations=operations, refresh=refresh)
+        if not response.get('errors'):
+            return len(documents)
+
+        # Items are returned in request order
+        rejected = [(document, item['index']) for document, item in zip(pending, response['items'])
+                    if item['index'].get('error')]
+        retryable = all(result.get('status') in ELASTICSEARCH_RETRY_ON_STATUS for _, result in rejected)
+        if not retryable or retry >= ELASTICSEARCH_MAX_RETRIES:
+            logger.error("Failed to index documents", index=index_name, failed=len(rejected), documents=len(documents),
+                         error=rejected[0][1]['error'])
+            raise BulkIndexError(index_name, {document['chunk_id']: result['error'] for document, result in rejected})
+        retry += 1
+        delay = get_retry_delay(retry)
+        logger.warning("Retrying rejected documents", index=index_name, rejected=len(rejected), retry=retry, delay=delay)
+        time.sleep(delay)
+        pending = [document for document, _ in rejected]
+
+@metrics.timed("rag_elasticsearch_seconds", operation="max_timestamp")
+def get_max_timestamp(es, index_name):
+    """
+    Get the latest document timestamp in an index with a single max aggregation.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        index_name (str): The name of the index.
+
+    Returns:
+        float: The latest timestamp in epoch milliseconds, or None if the index is empty or missing.
+    """
     try:
+        if not es.indices.exists(index=index_name):
+            return None
         response = es.search(
             index=index_name,
             body={
-                "query": {
-                    "match_all": {}
-                },
-                "sort": [
-                    {"unique_id": {"order": "desc"}}
-                ],
-                "size": 10000
+                "size": 0,
+                "aggs": {
+                    "max_timestamp": {
+                        "max": {"field": "timestamp"}
+                    }
+                }
             }
         )
-        documents = response['hits']['hits']
-        for doc in documents:
-            print(doc['_source'])
+        return response['aggregations']['max_timestamp']['value']
     except Exception as e:
-        print(f"Failed to retrieve documents: {e}")
-        # Fallback to retrieve documents without sorting
-        try:
-            response = es.search(
-                index=index_name,
-                body={
-                    "query": {
-                        "match_all": {}
-                    },
-                    "size": 10000
-                }
-            )
-            documents = response['hits']['hits']
-            for doc in documents:
-                print(doc['_source'])
-        except Exception as e:
-            print(f"Failed to retrieve documents without sorting: {e}")
+        logger.warning("Failed to retrieve the latest timestamp", index=index_name, error=e)
+        return None
 
-def text_search(es, query, index_name, k=5):
+@metrics.timed("rag_elasticsearch_seconds", operation="latest_document")
+def get_latest_document_key(es, index_name):
     """
-    Search for documents in Elasticsearch based on text query.
+    Get the (timestamp, unique_id) key of the latest document in an index.
+
+    Documents added in one batch share a timestamp, so the timestamp alone cannot
+    tell which of them an interrupted batch wrote. Their IDs increase in log
+    order, so the largest ID at the latest timestamp can: a document was written
+    if its key is not greater than this one.
 
     Args:
         es (Elasticsearch): The Elasticsearch client.
-        query (str): The text query to search for.
-        index_name (str): The name of the index to search.
-        k (int): The number of top results to return.
+        index_name (str): The name of the index.
 
     Returns:
-        list: The top k search results sorted by timestamp descending.
+        tuple: The latest timestamp in epoch milliseconds and the largest unique ID
+            at that timestamp, or None if the index is empty or missing.
     """
+    max_timestamp = get_max_timestamp(es, index_name)
+    if max_timestamp is None:
+        return None
     try:
         response = es.search(
             index=index_name,
             body={
-                "query": {
-                    "match": {
-                        "data": query
+                "size": 0,
+                "query": {"range": {"timestamp": {"gte": max_timestamp, "format": "epoch_millis"}}},
+                "aggs": {
+                    "max_unique_id": {
+                        "max": {
+                            "script": {"source": "Long.parseLong(doc['unique_id'].value)"}
+                        }
                     }
-                },
-                "sort": [
-                    {"unique_id": {"order": "desc"}}
-                ],
-                "size": k
+                }
             }
         )
-        hits = response['hits']['hits']
-        return [hit['_source'] for hit in hits]
+        value = response['aggregations']['max_unique_id']['value']
     except Exception as e:
-        print(f"Failed to search documents: {e}")
+        logger.warning("Failed to retrieve the latest document", index=index_name, error=e)
+        return None
+    return max_timestamp, int(value) if value is not None else 0
+
+@metrics.timed("rag_elasticsearch_seconds", operation="get_all")
+def get_all_documents(es, index_name, size=10000):
+    """
+    Fetch up to size documents of an index, newest unique_id first, for debugging.
+
+    Each document is also logged at debug level. This reads the whole index, so
+    it is never called on a write path.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        index_name (str): The name of the index.
+        size (int): The maximum number of documents.
+
+    Returns:
+        list: The document sources, or an empty list if the search failed.
+    """
+    try:
+        response = es.search(index=index_name, body={"query": {"match_all": {}},
+                                                     "sort": [{"unique_id": {"order": "desc"}}], "size": size})
+    except Exception as e:
+        logger.warning("Failed to retrieve sorted documents, retrying without sorting", index=index_name, error=e)
+        try:
+            response = es.search(index=index_name, body={"query": {"match_all": {}}, "size": size})
+        except Exception as e:
+            logger.error("Failed to retrieve documents", index=index_name, error=e)
+            return []
+    documents = [hit['_source'] for hit in response['hits']['hits']]
+    for document in documents:
+        logger.debug("Document", index=index_name, document=document)
+    return documents
+
+@metrics.timed("rag_elasticsearch_seconds", operation="delete_by_query")
+def delete_documents_by_unique_ids(es, index_name, unique_ids):
+    """
+    Delete every chunk of the given documents with one _delete_by_query request.
+
+    The index is refreshed so the deletion is visible to the next search.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        index_name (str): The name of the index.
+        unique_ids (list): The document IDs to delete.
+
+    Returns:
+        int: The number of chunk documents deleted.
+    """
+    if not unique_ids:
+        return 0
+    try:
+        response = es.delete_by_query(
+            index=index_name,
+            body={"query": {"terms": {"unique_id": [str(unique_id) for unique_id in unique_ids]}}},
+            refresh=True,
+            conflicts="proceed",
+        )
+    except Exception as e:
+        logger.error("Failed to delete documents", index=index_name, error=e)
+        return 0
+    return response.get('deleted', 0)
+
+def get_chunk_ids_query(chunk_ids):
+    """Return the terms query that fetches chunk documents by chunk_id."""
+    return {
+        "query": {
+            "terms": {
+                "chunk_id": list(chunk_ids)
+            }
+        },
+        "size": len(chunk_ids)
+    }
+
+@metrics.timed("rag_elasticsearch_seconds", operation="get_chunks")
+def get_documents_by_chunk_ids(es, index_name, chunk_ids):
+    """
+    Fetch chunk documents by their "{unique_id}_{ordinal}" chunk_id with a single terms query.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        index_name (str): The name of the index to search.
+        chunk_ids (list): The chunk IDs to fetch.
+
+    Returns:
+        dict: The chunk document per chunk_id; IDs that were not found are omitted.
+    """
+    if not chunk_ids:
+        return {}
+    try:
+        response = es.search(index=index_name, body=get_chunk_ids_query(chunk_ids))
+    except Exception as e:
+        logger.error("Failed to fetch chunks", index=index_name, error=e)
+        return {}
+    return {hit['_source']['chunk_id']: hit['_source'] for hit in response['hits']['hits']}
+
+@metrics.timed("rag_elasticsearch_seconds", operation="get_chunks")
+async def async_get_documents_by_chunk_ids(es, index_name, chunk_ids):
+    """Async version of get_documents_by_chunk_ids for an AsyncElasticsearch client."""
+    if not chunk_ids:
+        return {}
+    try:
+        response = await es.search(index=index_name, body=get_chunk_ids_query(chunk_ids))
+    except Exception as e:
+        logger.error("Failed to fetch chunks", index=index_name, error=e)
+        return {}
+    return {hit['_source']['chunk_id']: hit['_source'] for hit in response['hits']['hits']}
+
+@metrics.timed("rag_elasticsearch_seconds", operation="msearch")
+def multi_search(es, index_name, bodies):
+    """
+    Run many search bodies against one index with a single _msearch request.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        index_name (str): The name of the index to search.
+        bodies (list): The search bodies.
+
+    Returns:
+        list: For each body, in order, its list of hits. A body that failed gets no hits.
+    """
+    if not bodies:
         return []
+    searches = []
+    for body in bodies:
+        searches.append({"index": index_name})
+        searches.append(body)
+    try:
+        response = es.msearch(searches=searches)
+    except Exception as e:
+        logger.error("Failed to search documents", index=index_name, error=e)
+        return [[] for _ in bodies]
+    results = []
+    for item in response['responses']:
+        if 'error' in item:
+            logger.error("Failed to search documents", error=item['error'])
+            results.append([])
+        else:
+            results.append(item['hits']['hits'])
+    return results
 
 def load_specific_index(es, index_name):
     """
@@ -167,18 +627,18 @@ def load_specific_index(es, index_name):
     try:
         # Check if the index exists
         if not es.indices.exists(index=index_name):
-            print(f"Index '{index_name}' does not exist.")
+            logger.warning("Index does not exist", index=index_name)
             return False
 
         # Open the index
         es.indices.open(index=index_name)
-        print(f"Index '{index_name}' has been opened.")
+        logger.info("Index opened", index=index_name)
         return True
     except Exception as e:
         if 'index_closed_exception' in str(e):
-            print(f"Index '{index_name}' is already closed.")
+            logger.info("Index is already closed", index=index_name)
         else:
-            print(f"Failed to open index '{index_name}': {e}")
+            logger.error("Failed to open index", index=index_name, error=e)
         return False
 
 def close_specific_index(es, index_name):
@@ -195,13 +655,13 @@ def close_specific_index(es, index_name):
     try:
         # Check if the index exists
         if not es.indices.exists(index=index_name):
-            print(f"Index '{index_name}' does not exist.")
+            logger.warning("Index does not exist", index=index_name)
             return False
 
         # Close the index
         es.indices.close(index=index_name)
-        print(f"Index '{index_name}' has been closed and saved to disk.")
+        logger.info("Index closed and saved to disk", index=index_name)
         return True
     except Exception as e:
-        print(f"Failed to close index '{index_name}': {e}")
+        logger.error("Failed to close index", index=index_name, error=e)
         return False
\ No newline at end of file
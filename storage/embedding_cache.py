@@ -0,0 +1,235 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from utils.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_LRU_SIZE, EMBEDDING_CACHE_ENABLED
+from utils.metrics import metrics
+
+metrics.describe("rag_embedding_seconds", "Latency of embedder calls, by source (documents or queries).")
+metrics.describe("rag_embedded_texts", "Texts passed to the embedder, by source.")
+
+def hash_text(text):
+    """Return the SHA-1 hex digest of a chunk text."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    """
+    Content-addressed store of embeddings for one embedder.
+
+    Vectors are appended to a float32 file ({embedder}.f32) that is read through a
+    memory map, and the SHA-1 digest of each row's text is appended to a key file
+    ({embedder}.keys). An in-memory LRU holds recently used vectors in front of
+    the memory map. Vectors are written before keys, so a crash can only leave
+    an unreferenced trailing row.
+
+    A read-only cache (as opened by ingestion worker processes) never writes or
+    truncates the files, and picks up rows appended by the writing process on
+    refresh().
+    """
+
+    def __init__(self, embedder_id, dimension, directory=EMBEDDING_CACHE_PATH, lru_size=EMBEDDING_CACHE_LRU_SIZE,
+                 read_only=False):
+        self.embedder_id = embedder_id
+        self.dimension = dimension
+        self.directory = directory
+        self.lru_size = lru_size
+        self.read_only = read_only
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+        file_stem = os.path.join(directory, embedder_id.replace(os.sep, "_").replace(":", "_"))
+        self.vectors_path = f"{file_stem}.f32"
+        self.keys_path = f"{file_stem}.keys"
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._rows = {}
+        self._row_count = 0  # Rows of the key file read so far
+        self._keys_position = 0
+        self._mmap = None
+        self._read_new_keys()
+        stored_rows = self._stored_rows()
+        # Drop any trailing row whose key was never written
+        if not read_only and stored_rows > self._row_count:
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(self._row_count * 4 * self.dimension)
+        self.hits = 0
+        self.misses = 0
+
+    def _stored_rows(self):
+        """Return the number of complete rows in the vector file."""
+        if not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dimension)
+
+    def _read_new_keys(self):
+        """Read the keys appended since the last read, stopping at the first row not backed by the vector file."""
+        if not os.path.exists(self.keys_path):
+            return
+        stored_rows = self._stored_rows()
+        with open(self.keys_path, 'rb') as f:
+            f.seek(self._keys_position)
+            for line in f:
+                # A key still being written by another process is read next time
+                if self._row_count >= stored_rows or not line.endswith(b"\n"):
+                    break
+                self._rows[line.decode('ascii').strip()] = self._row_count
+                self._row_count += 1
+                self._keys_position += len(line)
+
+    def refresh(self):
+        """Pick up rows appended to the files by another process since they were last read."""
+        with self._lock:
+            self._read_new_keys()
+
+    def _read_row(self, row):
+        """Read one vector through the memory map, remapping if the file has grown. Caller holds the lock."""
+        if self._mmap is None or row >= self._mmap.shape[0]:
+            self._mmap = np.memmap(self.vectors_path, dtype='float32', mode='r', shape=(self._row_count, self.dimension))
+        return np.array(self._mmap[row])
+
+    def _remember(self, digest, vector):
+        """Put a vector in the LRU. Caller holds the lock."""
+        self._lru[digest] = vector
+        self._lru.move_to_end(digest)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, digests):
+        """
+        Look up vectors by text digest.
+
+        Args:
+            digests (list): The text digests.
+
+        Returns:
+            dict: The vector per digest found in the cache.
+        """
+        found = {}
+        with self._lock:
+            for digest in digests:
+                vector = self._lru.get(digest)
+                if vector is None and digest in self._rows:
+                    vector = self._read_row(self._rows[digest])
+                if vector is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                self._remember(digest, vector)
+                found[digest] = vector
+        return found
+
+    def put_many(self, digests, vectors):
+        """
+        Append new vectors to the cache.
+
+        Args:
+            digests (list): The text digests.
+            vectors (np.ndarray): A float32 matrix with one row per digest.
+
+        Raises:
+            ValueError: If the cache is read-only.
+        """
+        if self.read_only:
+            raise ValueError(f"Embedding cache {self.embedder_id} is read-only")
+        with self._lock:
+            new_rows = OrderedDict()
+            for row, digest in enumerate(digests):
+                if digest not in self._rows and digest not in new_rows:
+                    new_rows[digest] = row
+            if not new_rows:
+                return
+            new_digests = list(new_rows)
+            matrix = np.ascontiguousarray(np.asarray(vectors)[list(new_rows.values())], dtype='float32')
+            with open(self.vectors_path, 'ab') as f:
+                f.write(matrix.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, 'a') as f:
+                f.write("".join(f"{digest}\n" for digest in new_digests))
+            self._keys_position = os.path.getsize(self.keys_path)
+            for digest, vector in zip(new_digests, matrix):
+                self._rows[digest] = self._row_count
+                self._row_count += 1
+                self._remember(digest, vector)
+
+    def stats(self):
+        """Return the hit and miss counters and the number of stored vectors."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "vectors": len(self._rows), "lru_entries": len(self._lru)}
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(embedder):
+    """Return the process-wide EmbeddingCache for an embedder, creating it on first use."""
+    with _caches_lock:
+        cache = _caches.get(embedder.embedder_id)
+        if cache is None:
+            cache = EmbeddingCache(embedder.embedder_id, embedder.dimension)
+            _caches[embedder.embedder_id] = cache
+        return cache
+
+def get_embedding_cache_stats():
+    """Return the stats of every embedding cache opened in this process, per embedder ID."""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.embedder_id: cache.stats() for cache in caches}
+
+def embed_missing(embedder, texts, cache):
+    """
+    Embed texts, reusing cached vectors, without storing the new vectors.
+
+    Only texts whose digest is not cached are passed to the embedder, in one batch.
+    This lets a process that cannot write the cache (an ingestion worker) hand the
+    new vectors to the one that does.
+
+    Args:
+        embedder (Embedder): The embedder.
+        texts (list): The texts to embed.
+        cache (EmbeddingCache): The cache to look vectors up in.
+
+    Returns:
+        tuple: A float32 matrix of shape (len(texts), dimension), and the digests
+        and float32 matrix of the vectors that were not cached.
+    """
+    digests = [hash_text(text) for text in texts]
+    found = cache.get_many(set(digests))
+
+    missing = {}
+    for text, digest in zip(texts, digests):
+        if digest not in found and digest not in missing:
+            missing[digest] = text
+    vectors = np.empty((0, embedder.dimension), dtype='float32')
+    if missing:
+        with metrics.span("rag_embedding_seconds", source="documents"):
+            vectors = embedder.embed_batch(list(missing.values()))
+        metrics.increment("rag_embedded_texts", len(missing), source="documents")
+        found.update(zip(missing, vectors))
+
+    embeddings = np.stack([found[digest] for digest in digests]).astype('float32', copy=False)
+    return embeddings, list(missing), vectors
+
+def embed_with_cache(embedder, texts):
+    """
+    Embed texts, reusing vectors already computed for identical texts.
+
+    Only texts whose digest is not cached are passed to the embedder, in one batch.
+
+    Args:
+        embedder (Embedder): The embedder.
+        texts (list): The texts to embed.
+
+    Returns:
+        np.ndarray: A float32 matrix of shape (len(texts), dimension).
+    """
+    if not EMBEDDING_CACHE_ENABLED or not texts:
+        with metrics.span("rag_embedding_seconds", source="documents"):
+            embeddings = embedder.embed_batch(texts)
+        metrics.increment("rag_embedded_texts", len(texts), source="documents")
+        return embeddings
+
+    cache = get_embedding_cache(embedder)
+    embeddings, digests, vectors = embed_missing(embedder, texts, cache)
+    if digests:
+        cache.put_many(digests, vectors)
+    return embeddings
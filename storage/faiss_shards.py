@@ -0,0 +1,230 @@
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import faiss
+import numpy as np
+from utils.config import FAISS_SHARD_PATH
+from utils.logger import get_logger
+from storage.faiss_storage import (create_faiss_index, upgrade_index_if_needed, apply_search_params, get_inner_index,
+                                   get_index_file_path, file_checksum, write_file_atomically)
+
+# Shard processes are spawned, not forked: forking a process with running FAISS/OpenMP threads can deadlock
+_context = multiprocessing.get_context("spawn")
+
+logger = get_logger(__name__)
+
+def get_shard_directory(domain, model):
+    """Return the directory holding a domain's shard files and manifest."""
+    return os.path.join(FAISS_SHARD_PATH, f"{domain}_{model}")
+
+def get_shard_paths(domain, model, shards):
+    """Return the paths of a domain's shard files."""
+    directory = get_shard_directory(domain, model)
+    return [os.path.join(directory, f"shard{shard}.index") for shard in range(shards)]
+
+def get_saved_index_checksum(domain, model):
+    """Return the SHA-256 of a domain's saved index, read from its .sha256 sidecar when there is one."""
+    file_path = get_index_file_path(domain, model)
+    checksum_path = f"{file_path}.sha256"
+    if os.path.exists(checksum_path):
+        with open(checksum_path, 'r') as f:
+            return f.read().strip()
+    return file_checksum(file_path)
+
+def read_index(file_path):
+    """Read an index file through a read-only memory map, or into memory if it cannot be mapped."""
+    try:
+        index = faiss.read_index(file_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        index = faiss.read_index(file_path)
+    if not isinstance(index, faiss.IndexIDMap):
+        index = faiss.IndexIDMap(index)
+    return index
+
+def shards_are_current(domain, model, shards):
+    """Return True if the domain's shard files were built from its saved index with the given shard count."""
+    manifest_path = os.path.join(get_shard_directory(domain, model), "manifest.json")
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    return (manifest.get("shards") == shards
+            and manifest.get("source_checksum") == get_saved_index_checksum(domain, model)
+            and all(os.path.exists(path) for path in get_shard_paths(domain, model, shards)))
+
+def _build_shard(index_path, start, stop, index_type, params, shard_path):
+    """Build one shard from rows [start, stop) of a saved index. Runs in a builder process."""
+    faiss.omp_set_num_threads(1)
+    index = read_index(index_path)
+    ids = faiss.vector_to_array(index.id_map)[start:stop]
+    vectors = get_inner_index(index).reconstruct_n(start, stop - start)
+    shard = create_faiss_index(index.d, index_type, params)
+    shard.add_with_ids(vectors, ids)
+    shard = upgrade_index_if_needed(shard, index_type, params)
+    write_file_atomically(shard_path, lambda temp_path: faiss.write_index(shard, temp_path))
+    return shard.ntotal
+
+def build_shards(domain, model, ntotal, shards, index_type, params=None):
+    """
+    Split a domain's saved FAISS index into shard files, building the shards in parallel processes.
+
+    Each builder process memory-maps the saved index, reconstructs its contiguous
+    range of vectors and builds a shard of the domain's index type (IVF shards are
+    trained on their own vectors). A manifest records the checksum of the source
+    index so stale shards are rebuilt after the index is saved again.
+
+    Args:
+        domain (str): The domain name.
+        model (str): The model name.
+        ntotal (int): The number of vectors in the saved index.
+        shards (int): The number of shards.
+        index_type (str): The configured index type of the domain.
+        params (dict): The index parameters of the domain.
+
+    Returns:
+        list: The paths of the shard files.
+    """
+    directory = get_shard_directory(domain, model)
+    os.makedirs(directory, exist_ok=True)
+    index_path = get_index_file_path(domain, model)
+    checksum = get_saved_index_checksum(domain, model)
+    paths = get_shard_paths(domain, model, shards)
+    bounds = np.linspace(0, ntotal, shards + 1).astype('int64').tolist()
+
+    with ProcessPoolExecutor(max_workers=shards, mp_context=_context) as pool:
+        futures = [pool.submit(_build_shard, index_path, start, stop, index_type, params, path)
+                   for start, stop, path in zip(bounds[:-1], bounds[1:], paths)]
+        sizes = [future.result() for future in futures]
+
+    manifest = {"source_checksum": checksum, "shards": shards, "vectors": sizes}
+
+    def write_manifest(temp_path):
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+    write_file_atomically(os.path.join(directory, "manifest.json"), write_manifest)
+    logger.info("FAISS index split into shards", domain=domain, model=model, shards=shards, vectors=sizes)
+    return paths
+
+def _serve_shard(connection, shard_path, params, threads):
+    """Search one shard for the main process until told to stop. Runs in a shard process."""
+    faiss.omp_set_num_threads(threads)
+    index = read_index(shard_path)
+    apply_search_params(index, params)
+    connection.send(index.ntotal)
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        queries, k = request
+        connection.send(index.search(queries, k))
+    connection.close()
+
+def merge_shard_results(results, k, higher_is_better):
+    """
+    Merge the per-shard results of a search into one top-k result.
+
+    Args:
+        results (list): (distances, labels) per shard, as returned by faiss.Index.search.
+        k (int): The number of neighbours to keep per query.
+        higher_is_better (bool): True for inner-product scores, False for L2 distances.
+
+    Returns:
+        tuple: The merged distances and labels, each of shape (queries, k).
+    """
+    distances = np.hstack([shard_distances for shard_distances, _ in results])
+    labels = np.hstack([shard_labels for _, shard_labels in results])
+    # Empty slots (label -1) sort last
+    keys = np.where(labels == -1, np.inf, -distances if higher_is_better else distances)
+    order = np.argsort(keys, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(labels, order, axis=1)
+
+class ShardedIndex:
+    """
+    A read-only FAISS index split into shards, each searched by its own process.
+
+    It stands in for a faiss index where searches use one (search, ntotal, d,
+    metric_type): a query batch is sent to every shard process over a Unix socket
+    pair, the shards search in parallel and their top-k lists are merged. Shard
+    processes memory-map their shard files, so the index does not have to fit in
+    the main process.
+    """
+
+    def __init__(self, shard_paths, d, metric_type, params=None, threads_per_shard=None):
+        self.d = d
+        self.metric_type = metric_type
+        threads = threads_per_shard or max(1, (os.cpu_count() or 1) // len(shard_paths))
+        self._lock = threading.Lock()
+        self._shards = []
+        for shard, shard_path in enumerate(shard_paths):
+            connection, child_connection = _context.Pipe()
+            process = _context.Process(target=_serve_shard, args=(child_connection, shard_path, params, threads),
+                                       name=f"faiss-shard-{shard}", daemon=True)
+            process.start()
+            child_connection.close()
+            self._shards.append((process, connection))
+        self.shard_sizes = [connection.recv() for _, connection in self._shards]
+        self.ntotal = sum(self.shard_sizes)
+
+    def search(self, queries, k):
+        """
+        Search every shard and merge the results.
+
+        Args:
+            queries (np.ndarray): A float32 matrix of query vectors.
+            k (int): The number of neighbours per query.
+
+        Returns:
+            tuple: Distances and labels, as returned by faiss.Index.search.
+
+        Raises:
+            RuntimeError: If the index has been closed.
+        """
+        queries = np.ascontiguousarray(queries, dtype='float32')
+        with self._lock:
+            if not self._shards:
+                raise RuntimeError("Sharded FAISS index is closed")
+            for _, connection in self._shards:
+                connection.send((queries, k))
+            results = [connection.recv() for _, connection in self._shards]
+        return merge_shard_results(results, k, self.metric_type == faiss.METRIC_INNER_PRODUCT)
+
+    def close(self):
+        """Stop the shard processes, waiting for a running search to finish."""
+        with self._lock:
+            shards, self._shards = self._shards, []
+        for process, connection in shards:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process, _ in shards:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+def open_sharded_index(domain, model, index, shards, index_type, params=None):
+    """
+    Serve a domain's saved FAISS index from shard processes, rebuilding stale shard files first.
+
+    Args:
+        domain (str): The domain name.
+        model (str): The model name.
+        index (faiss.Index): The domain's saved index, as loaded.
+        shards (int): The number of shards.
+        index_type (str): The configured index type of the domain.
+        params (dict): The index parameters of the domain.
+
+    Returns:
+        ShardedIndex: The sharded index.
+    """
+    if shards_are_current(domain, model, shards):
+        paths = get_shard_paths(domain, model, shards)
+    else:
+        paths = build_shards(domain, model, index.ntotal, shards, index_type, params)
+    return ShardedIndex(paths, index.d, index.metric_type, params)
@@ -1,22 +1,316 @@
 import faiss
+import hashlib
 import numpy as np
 import uuid
 from datetime import datetime
-from utils.config import FAISS_STORAGE_PATH
+from utils.config import (FAISS_STORAGE_PATH, FAISS_VERIFY_CHECKSUM, FAISS_TRAIN_SIZE, IVF_UPGRADE_THRESHOLD, IVF_NPROBE,
+                          HNSW_M, HNSW_EF_SEARCH, PQ_NBITS, DEFAULT_PRECISION, CHUNK_ID_BITS, LOG_SAMPLE_EVERY)
+from utils.embedder import get_embedder
+from storage.docstore import split_chunk_faiss_id
+from utils.logger import get_logger
+from utils.metrics import metrics
 import os
 
-def generate_fake_embeddings(text):
+logger = get_logger(__name__)
+metrics.describe("rag_faiss_add_seconds", "Latency of FAISS add_with_ids calls.")
+metrics.describe("rag_faiss_persist_seconds", "Latency of writing and reading FAISS index files, by operation.")
+
+# Index types that can be configured per domain. IVF types start as a flat index
+# and are trained and rebuilt once the domain reaches its upgrade threshold.
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "auto")
+TRAINED_INDEX_TYPES = ("ivf_flat", "ivf_pq", "auto")
+
+# Storage precisions of the vectors of flat, HNSW and IVF-Flat indexes: float16
+# halves their memory and sq8 (one byte per dimension) quarters it. Once
+# trained, ivf_pq compresses the vectors itself and ignores the precision.
+PRECISIONS = ("float32", "float16", "sq8")
+VECTOR_CODECS = {"float32": "Flat", "float16": "SQfp16", "sq8": "SQ8"}
+
+def get_inner_index(index):
+    """Return the index wrapped by an IndexIDMap, downcast to its concrete type."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+def choose_nlist(ntotal):
+    """Pick the number of IVF lists for a domain of ntotal vectors (about 4 * sqrt(n), at least 39 vectors per list)."""
+    return max(1, min(int(4 * np.sqrt(ntotal)), ntotal // 39))
+
+def get_vector_codec(params=None):
+    """
+    Return the index_factory suffix that stores vectors at a domain's precision.
+
+    Args:
+        params (dict): The index parameters; "precision" defaults to DEFAULT_PRECISION.
+
+    Returns:
+        str: 'Flat', 'SQfp16' or 'SQ8'.
+
+    Raises:
+        ValueError: If the precision is unknown.
+    """
+    precision = (params or {}).get("precision", DEFAULT_PRECISION)
+    if precision not in PRECISIONS:
+        raise ValueError(f"Invalid precision '{precision}'. Choose from {PRECISIONS}.")
+    return VECTOR_CODECS[precision]
+
+def get_index_factory_string(index_type, embedding_size, ntotal=0, params=None):
+    """
+    Build the faiss.index_factory description for an index type.
+
+    Args:
+        index_type (str): One of INDEX_TYPES.
+        embedding_size (int): The dimension of the vectors.
+        ntotal (int): The number of vectors the index will hold, used to size IVF lists.
+        params (dict): Optional overrides: nlist, pq_m, pq_nbits, hnsw_m, precision.
+
+    Returns:
+        str: The factory string.
+
+    Raises:
+        ValueError: If the index type or precision is unknown.
+    """
+    params = params or {}
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Invalid index type '{index_type}'. Choose from {INDEX_TYPES}.")
+    codec = get_vector_codec(params)
+    if index_type == "flat":
+        return codec
+    if index_type == "hnsw":
+        return f"HNSW{params.get('hnsw_m', HNSW_M)},{codec}"
+    nlist = params.get("nlist") or choose_nlist(ntotal)
+    if index_type == "ivf_pq":
+        pq_m = params.get("pq_m", max(1, embedding_size // 8))
+        return f"IVF{nlist},PQ{pq_m}x{params.get('pq_nbits', PQ_NBITS)}"
+    return f"IVF{nlist},{codec}"
+
+def apply_search_params(index, params=None):
+    """
+    Apply the query-time parameters (nprobe for IVF, efSearch for HNSW) to an index.
+
+    Args:
+        index (faiss.Index): The FAISS index.
+        params (dict): Optional overrides: nprobe, ef_search.
+    """
+    params = params or {}
+    inner = get_inner_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(params.get("nprobe", IVF_NPROBE), inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = params.get("ef_search", HNSW_EF_SEARCH)
+
+def create_faiss_index(embedding_size, index_type="flat", params=None):
+    """
+    Create an empty FAISS index with ID mapping and inner-product metric.
+
+    Vectors are L2-normalised, so inner product ranks by cosine similarity.
+    Types that need training start as a flat index (see upgrade_index_if_needed).
+    An SQ8 flat or HNSW index is trained on the range [-1, 1] that every
+    component of a normalised vector lies in, so it can be added to right away.
+
+    Args:
+        embedding_size (int): The dimension of the vectors.
+        index_type (str): One of INDEX_TYPES.
+        params (dict): Optional index parameters.
+
+    Returns:
+        faiss.IndexIDMap: The new index.
+    """
+    initial_type = "flat" if index_type in TRAINED_INDEX_TYPES else index_type
+    factory = get_index_factory_string(initial_type, embedding_size, params=params)
+    inner = faiss.index_factory(embedding_size, factory, faiss.METRIC_INNER_PRODUCT)
+    if not inner.is_trained:
+        inner.train(np.stack([np.full(embedding_size, -1, dtype='float32'), np.ones(embedding_size, dtype='float32')]))
+    index = faiss.IndexIDMap(inner)
+    apply_search_params(index, params)
+    return index
+
+def upgrade_index_if_needed(index, index_type, params=None):
+    """
+    Rebuild a flat index as an IVF index once it grows past the upgrade threshold.
+
+    The stored vectors (decoded, for float16 and SQ8 storage) are reconstructed
+    from the flat index, the IVF index is
+    trained on the first FAISS_TRAIN_SIZE of them and all vectors are re-added
+    with their IDs.
+
+    Args:
+        index (faiss.IndexIDMap): The current index.
+        index_type (str): The configured index type of the domain.
+        params (dict): Optional overrides: upgrade_threshold, train_size and the
+            parameters accepted by get_index_factory_string.
+
+    Returns:
+        faiss.Index: The upgraded index, or the given index if no upgrade was needed.
+    """
+    params = params or {}
+    inner = get_inner_index(index)
+    if index_type not in TRAINED_INDEX_TYPES or not isinstance(inner, (faiss.IndexFlat, faiss.IndexScalarQuantizer)):
+        return index
+    if index.ntotal < params.get("upgrade_threshold", IVF_UPGRADE_THRESHOLD):
+        return index
+
+    vectors = inner.reconstruct_n(0, index.ntotal)
+    ids = faiss.vector_to_array(index.id_map)
+    factory = get_index_factory_string(index_type, index.d, index.ntotal, params)
+    upgraded = faiss.index_factory(index.d, factory, faiss.METRIC_INNER_PRODUCT)
+    upgraded.train(vectors[:params.get("train_size", FAISS_TRAIN_SIZE)])
+    upgraded = faiss.IndexIDMap(upgraded)
+    upgraded.add_with_ids(vectors, ids)
+    apply_search_params(upgraded, params)
+    logger.info("FAISS index upgraded", factory=factory, vectors=upgraded.ntotal)
+    return upgraded
+
+def supports_remove(index):
+    """Return True if vectors can be removed from the index in place (every type but HNSW)."""
+    return not isinstance(get_inner_index(index), faiss.IndexHNSW)
+
+def remove_documents(index, unique_ids):
+    """
+    Remove every chunk vector of the given documents from an index, in place.
+
+    IndexIDMap compacts its ID map on removal but an IVF index keeps the
+    positions it stored, so the positions in the inverted lists are renumbered
+    to match the compacted map.
+
+    Args:
+        index (faiss.IndexIDMap): The index.
+        unique_ids (iterable): The document IDs.
+
+    Returns:
+        int: The number of vectors removed.
+
+    Raises:
+        RuntimeError: If the index type cannot remove vectors (HNSW).
+    """
+    ids = faiss.vector_to_array(index.id_map)
+    doomed = np.isin(ids >> CHUNK_ID_BITS, np.asarray([int(unique_id) for unique_id in unique_ids], dtype='int64'))
+    if not doomed.any():
+        return 0
+    removed = index.remove_ids(ids[doomed])
+    inner = get_inner_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        positions = np.full(len(ids), -1, dtype='int64')
+        positions[~doomed] = np.arange(len(ids) - removed, dtype='int64')
+        for list_no in range(inner.nlist):
+            list_size = inner.invlists.list_size(list_no)
+            if list_size:
+                list_ids = faiss.rev_swig_ptr(inner.invlists.get_ids(list_no), list_size)
+                list_ids[:] = positions[list_ids]
+    return removed
+
+def clear_readded_document(index, docstore, unique_id):
+    """
+    Prepare for a deleted document to be added again under its unique_id.
+
+    Its old vectors are removed from the index, so the reused chunk IDs are not
+    shadowed by them, and its tombstone is cleared. Does nothing for a document
+    that was not deleted.
+
+    Args:
+        index (faiss.IndexIDMap): The index.
+        docstore (ChunkDocstore): The chunk docstore holding the tombstones.
+        unique_id: The document ID.
+    """
+    if str(unique_id) not in docstore.tombstones:
+        return
+    if supports_remove(index):
+        remove_documents(index, [unique_id])
+    else:
+        logger.warning("Old vectors of a re-added document cannot be removed from an HNSW index until it is compacted",
+                       unique_id=unique_id)
+    docstore.clear_tombstones([unique_id])
+
+def discard_documents(index, unique_ids):
+    """
+    Remove the vectors of documents whose ingestion failed before it was checkpointed.
+
+    The documents are ingested again from the last checkpoint, so vectors they
+    already added would otherwise be in the index twice. An HNSW index cannot
+    remove vectors; its duplicates stay until the next rebuild.
+
+    Args:
+        index (faiss.IndexIDMap): The index.
+        unique_ids (list): The IDs of the documents ingested since the last checkpoint.
+    """
+    if not unique_ids:
+        return
+    if supports_remove(index):
+        remove_documents(index, unique_ids)
+    else:
+        logger.warning("Vectors of documents whose ingestion failed cannot be removed from an HNSW index",
+                       documents=len(unique_ids))
+
+def compact_index(index, unique_ids, index_type, params=None):
+    """
+    Remove the vectors of deleted documents from an index.
+
+    Indexes that support remove_ids are compacted in place. Others are rebuilt
+    from the vectors that are kept, with their IDs.
+
+    Args:
+        index (faiss.IndexIDMap): The index.
+        unique_ids (iterable): The deleted document IDs.
+        index_type (str): The configured index type of the domain.
+        params (dict): The index parameters of the domain.
+
+    Returns:
+        tuple: The compacted index (the same object when compacted in place) and the number of vectors removed.
+    """
+    if supports_remove(index):
+        return index, remove_documents(index, unique_ids)
+
+    ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(ids >> CHUNK_ID_BITS, np.asarray([int(unique_id) for unique_id in unique_ids], dtype='int64'))
+    vectors = get_inner_index(index).reconstruct_n(0, index.ntotal)
+    rebuilt = create_faiss_index(index.d, index_type, params)
+    rebuilt.add_with_ids(vectors[keep], ids[keep])
+    rebuilt = upgrade_index_if_needed(rebuilt, index_type, params)
+    logger.info("FAISS index rebuilt", vectors=rebuilt.ntotal, previous_vectors=index.ntotal)
+    return rebuilt, int((~keep).sum())
+
+def estimate_index_memory(index):
     """
-    Generate fake embeddings for the given text.
+    Estimate the memory held by a FAISS index, in bytes.
 
     Args:
-        text (str): The text to generate embeddings for.
+        index (faiss.Index): The FAISS index.
 
     Returns:
-        list: A list of fake embeddings.
+        int: The approximate size of the stored codes, IDs and graph links.
+    """
+    inner = get_inner_index(index)
+    try:
+        # An HNSW index keeps its vectors in a flat storage index
+        code_size = (faiss.downcast_index(inner.storage) if isinstance(inner, faiss.IndexHNSW) else inner).sa_code_size()
+    except RuntimeError:
+        code_size = index.d * 4
+    size = index.ntotal * (code_size + 8)
+    if isinstance(inner, faiss.IndexHNSW):
+        size += index.ntotal * inner.hnsw.nb_neighbors(0) * 4
+    return size
+
+def fit_to_dimension(embeddings, dimension):
     """
-    return [ord(char) for char in text]
+    Pad or truncate an embedding matrix to the dimension of a FAISS index.
 
+    Args:
+        embeddings (np.ndarray): A float32 matrix of shape (n, d).
+        dimension (int): The dimension of the FAISS index.
+
+    Returns:
+        np.ndarray: A C-contiguous float32 matrix of shape (n, dimension).
+    """
+    embeddings = np.asarray(embeddings, dtype='float32')
+    if embeddings.shape[1] == dimension:
+        return np.ascontiguousarray(embeddings)
+    fitted = np.zeros((embeddings.shape[0], dimension), dtype='float32')
+    width = min(dimension, embeddings.shape[1])
+    fitted[:, :width] = embeddings[:, :width]
+    faiss.normalize_L2(fitted)
+    return fitted
+
+@metrics.timed("rag_faiss_add_seconds")
 def save_to_faiss(document, model, index, unique_id, embeddings):
     """
     Save a document to FAISS with additional fields.
@@ -26,7 +320,7 @@ def save_to_faiss(document, model, index, unique_id, embeddings):
         model (str): The model name to be included in the index name.
         index (faiss.Index): The FAISS index to save the embeddings to.
         unique_id (str): The unique ID to be used for the document.
-        embeddings (list): The embeddings to be saved.
+        embeddings (np.ndarray): The embedding vector to be saved.
 
     Raises:
         ValueError: If the document does not contain a 'domain' field.
@@ -40,53 +334,130 @@ def save_to_faiss(document, model, index, unique_id, embeddings):
     document['model'] = model
     document['unique_id'] = unique_id
     
-    # Ensure the embeddings match the dimension of the FAISS index
-    dimension = index.d
-    if len(embeddings) < dimension:
-        embeddings.extend([0] * (dimension - len(embeddings)))
-    elif len(embeddings) > dimension:
-        embeddings = embeddings[:dimension]
-    embeddings = np.array(embeddings).astype('float32').reshape(1, -1)
-    
-    # Normalize embeddings for cosine similarity
-    faiss.normalize_L2(embeddings)
+    embeddings = fit_to_dimension(np.asarray(embeddings, dtype='float32').reshape(1, -1), index.d)
     
     # Add the embeddings to the FAISS index with unique_id as metadata
     index.add_with_ids(embeddings, np.array([int(unique_id)]))
-    print(f"Document saved to FAISS index with ID: {document['unique_id']}")
+    logger.debug("Document saved to FAISS", unique_id=unique_id, every=LOG_SAMPLE_EVERY)
+
+@metrics.timed("rag_faiss_add_seconds")
+def save_batch_to_faiss(index, ids, embeddings):
+    """
+    Save a batch of embeddings to FAISS with a single vectorized add_with_ids call.
 
+    Args:
+        index (faiss.Index): The FAISS index to save the embeddings to.
+        ids (list): The FAISS IDs, one per embedding (chunk IDs, see storage.docstore.chunk_faiss_id).
+        embeddings (np.ndarray): A float32 matrix of shape (n, d), one row per chunk,
+            as returned by Embedder.embed_batch.
+
+    Returns:
+        int: The number of vectors added to the index.
+    """
+    if len(embeddings) == 0:
+        return 0
+
+    matrix = fit_to_dimension(embeddings, index.d)
+    index.add_with_ids(matrix, np.asarray([int(faiss_id) for faiss_id in ids], dtype='int64'))
+    return len(matrix)
+
+class CorruptIndexError(Exception):
+    """Raised when an index file does not match its recorded checksum."""
+
+def get_index_file_path(domain, model):
+    """Return the path of a domain's FAISS index file."""
+    return os.path.join(FAISS_STORAGE_PATH, f"{domain}_{model}.index")
+
+def file_checksum(file_path):
+    """Return the SHA-256 hex digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_file_atomically(file_path, write):
+    """Write a file through a temporary file that is fsynced and renamed over it."""
+    temp_path = f"{file_path}.tmp"
+    write(temp_path)
+    with open(temp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+
+@metrics.timed("rag_faiss_persist_seconds", operation="save")
 def save_index_to_disk(index, domain, model):
     """
     Save the FAISS index to disk.
 
+    The index is written to a temporary file, fsynced and renamed over the old
+    file, so a crash leaves either the old or the new index. Its SHA-256 is then
+    written to a .sha256 sidecar the same way.
+
     Args:
         index (faiss.Index): The FAISS index to save.
         domain (str): The domain name.
         model (str): The model name.
     """
-    file_path = os.path.join(FAISS_STORAGE_PATH, f"{domain}_{model}.index")
-    faiss.write_index(index, file_path)
-    print(f"FAISS index saved to {file_path}")
+    file_path = get_index_file_path(domain, model)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    write_file_atomically(file_path, lambda temp_path: faiss.write_index(index, temp_path))
+    checksum = file_checksum(file_path)
 
-def load_index_from_disk(domain, model):
+    def write_checksum(temp_path):
+        with open(temp_path, 'w') as f:
+            f.write(checksum)
+    write_file_atomically(f"{file_path}.sha256", write_checksum)
+
+    # Make both renames durable
+    directory = os.open(os.path.dirname(file_path), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+    logger.info("FAISS index saved", path=file_path, vectors=index.ntotal)
+
+@metrics.timed("rag_faiss_persist_seconds", operation="load")
+def load_index_from_disk(domain, model, params=None, mmap=False):
     """
     Load the FAISS index from disk.
 
     Args:
         domain (str): The domain name.
         model (str): The model name.
+        params (dict): Optional query-time parameters (nprobe, ef_search) to apply.
+        mmap (bool): Memory-map the file read-only instead of copying it into RAM.
+            The pages are shared with every process that maps the same file, but
+            the index cannot be written to.
 
     Returns:
         faiss.Index: The loaded FAISS index.
+
+    Raises:
+        CorruptIndexError: If the file does not match its .sha256 sidecar.
     """
-    file_path = os.path.join(FAISS_STORAGE_PATH, f"{domain}_{model}.index")
-    index = faiss.read_index(file_path)
+    file_path = get_index_file_path(domain, model)
+    checksum_path = f"{file_path}.sha256"
+    if FAISS_VERIFY_CHECKSUM and os.path.exists(checksum_path):
+        with open(checksum_path, 'r') as f:
+            expected = f.read().strip()
+        if file_checksum(file_path) != expected:
+            raise CorruptIndexError(f"FAISS index {file_path} does not match its checksum")
+
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(file_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.warning("Could not memory-map FAISS index, reading it into memory instead", path=file_path, error=e)
+    if index is None:
+        index = faiss.read_index(file_path)
     if not isinstance(index, faiss.IndexIDMap):
         index = faiss.IndexIDMap(index)
-    print(f"FAISS index loaded from {file_path}")
+    apply_search_params(index, params)
+    logger.info("FAISS index loaded", path=file_path, vectors=index.ntotal, mmap=mmap)
     return index
 
-def get_top_k_from_faiss(query_text, index, k=5):
+def get_top_k_from_faiss(query_text, index, k=5, embedder=None):
     """
     Retrieve the top k nearest neighbors from the FAISS index.
 
@@ -94,27 +465,38 @@ def get_top_k_from_faiss(query_text, index, k=5):
         query_text (str): The query text to search for.
         index (faiss.Index): The FAISS index to search.
         k (int): The number of nearest neighbors to retrieve.
+        embedder (Embedder): The embedder the index was built with. Defaults to
+            the default embedder at the index dimension.
 
     Returns:
         list: The unique IDs of the top k nearest neighbors.
     """
-    # Generate fake embeddings for the query text
-    query_embeddings = generate_fake_embeddings(query_text)
-    # Ensure the embeddings match the dimension of the FAISS index
-    dimension = index.d
-    if len(query_embeddings) < dimension:
-        query_embeddings.extend([0] * (dimension - len(query_embeddings)))
-    elif len(query_embeddings) > dimension:
-        query_embeddings = query_embeddings[:dimension]
-    query_embeddings = np.array(query_embeddings).astype('float32').reshape(1, -1)
-    
-    # Normalize embeddings for cosine similarity
-    faiss.normalize_L2(query_embeddings)
-    
-    # Search the FAISS index
-    distances, indices = index.search(query_embeddings, k)
-    return [str(idx) for idx in indices[0].tolist() if idx != -1]
+    return get_top_k_from_faiss_batch([query_text], index, k, embedder)[0]
+
+def get_top_k_from_faiss_batch(query_texts, index, k=5, embedder=None):
+    """
+    Retrieve the top k nearest neighbors of many queries with one FAISS search.
 
+    The queries are embedded as one matrix and searched together, which lets FAISS
+    share each pass over the index between the queries.
 
+    Args:
+        query_texts (list): The query texts to search for.
+        index (faiss.Index): The FAISS index to search.
+        k (int): The number of nearest neighbors to retrieve per query.
+        embedder (Embedder): The embedder the index was built with. Defaults to
+            the default embedder at the index dimension.
 
+    Returns:
+        list: For each query, in order, the unique IDs of the documents of its top k
+        nearest chunks (a document appears once per matching chunk).
+    """
+    if not query_texts:
+        return []
+    if embedder is None:
+        embedder = get_embedder(dimension=index.d)
+    query_embeddings = fit_to_dimension(embedder.embed_batch(query_texts), index.d)
 
+    # Search the FAISS index
+    distances, indices = index.search(query_embeddings, k)
+    return [[split_chunk_faiss_id(idx)[0] for idx in row if idx != -1] for row in indices.tolist()]
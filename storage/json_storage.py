@@ -1,31 +1,313 @@
+import atexit
 import json
 import os
-from utils.config import JSON_STORAGE_PATH
+import struct
+import threading
+import time
+from utils.config import JSON_STORAGE_PATH, JSON_FSYNC_EVERY, JSON_FSYNC_INTERVAL
+from utils.logger import get_logger
+from utils.metrics import metrics
 
-def save_to_json(document,domain):
+logger = get_logger(__name__)
+metrics.describe("rag_json_write_seconds", "Latency of document log appends, including fsync when due.")
+metrics.describe("rag_documents_logged", "Documents appended to document logs.")
+
+OFFSET_FORMAT = "<q"
+OFFSET_SIZE = struct.calcsize(OFFSET_FORMAT)
+TAIL_SCAN_BLOCK = 64 * 1024  # Bytes read at a time when scanning back for the end of the last complete line
+
+def find_line_end(f, size):
     """
-    Save a document to a JSON file. If a file with the same domain name exists,
-    append the new document to the existing file. Otherwise, create a new file.
+    Return the offset just past the last newline of a file, reading backwards from EOF in fixed-size blocks.
 
     Args:
-        document (dict): The document to be saved. Must contain a 'domain' field.
+        f (file): The file, opened in binary mode.
+        size (int): The size of the file.
+
+    Returns:
+        int: The length of the file's complete lines (0 if it has no newline).
+    """
+    end = size
+    while end > 0:
+        start = max(0, end - TAIL_SCAN_BLOCK)
+        f.seek(start)
+        found = f.read(end - start).rfind(b'\n')
+        if found != -1:
+            return start + found + 1
+        end = start
+    return 0
 
-    Raises:
-        ValueError: If the document does not contain a 'domain' field.
+class DocumentLog:
     """
-    print(f"Saving document to JSON: {document}")
-    
-    file_path = os.path.join(JSON_STORAGE_PATH, f"{domain}.json")
-    
-    if os.path.exists(file_path):
-        with open(file_path, 'r+') as f:
+    Append-only JSONL document log for one domain.
+
+    Each document is one line of {domain}.jsonl. The byte offset of every line is
+    appended to {domain}.jsonl.idx as a little-endian int64, so the log can be
+    counted and read from any record without scanning. The index is not held in
+    memory: its length is the document count, and opening a log only repairs its
+    tail. Writes are flushed to the OS immediately and fsynced every
+    JSON_FSYNC_EVERY documents or JSON_FSYNC_INTERVAL seconds, whichever comes first.
+    """
+
+    def __init__(self, domain, directory=JSON_STORAGE_PATH):
+        self.domain = domain
+        os.makedirs(directory, exist_ok=True)
+        self.file_path = os.path.join(directory, f"{domain}.jsonl")
+        self.index_path = f"{self.file_path}.idx"
+        self._lock = threading.Lock()
+        self._migrate_legacy_file(os.path.join(directory, f"{domain}.json"))
+        self._count = self._repair()
+        self._file = open(self.file_path, 'ab')
+        self._index_file = open(self.index_path, 'ab')
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _migrate_legacy_file(self, legacy_path):
+        """Convert a {domain}.json array written by earlier versions into the JSONL log, once."""
+        if os.path.exists(self.file_path) or not os.path.exists(legacy_path):
+            return
+        with open(legacy_path, 'r') as f:
             data = json.load(f)
-            if isinstance(data, list):
-                data.append(document)
-            else:
-                data = [data, document]
-            f.seek(0)
-            json.dump(data, f, indent=4)
-    else:
-        with open(file_path, 'w') as f:
-            json.dump([document], f, indent=4)
+        if not isinstance(data, list):
+            data = [data]
+        temp_path = f"{self.file_path}.tmp"
+        with open(temp_path, 'wb') as f:
+            for document in data:
+                f.write(self._encode(document))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.file_path)
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+        logger.info("Migrated legacy JSON documents to the document log", documents=len(data), source=legacy_path,
+                    path=self.file_path)
+
+    def _repair(self):
+        """
+        Repair a torn last line and bring the offset index up to date with the log.
+
+        Only the ends of the files are read: index entries past the end of the log
+        are dropped and entries for lines written after the last indexed one are
+        appended, so opening a log costs the same however many documents it holds.
+
+        Returns:
+            int: The number of documents in the log.
+        """
+        if not os.path.exists(self.file_path):
+            open(self.file_path, 'wb').close()
+        size = os.path.getsize(self.file_path)
+
+        # Drop a trailing partial line left by a crash mid-write
+        if size:
+            with open(self.file_path, 'rb+') as f:
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    end = find_line_end(f, size)
+                    f.truncate(end)
+                    size = end
+
+        with open(self.index_path, 'ab+') as index_file:
+            index_size = index_file.seek(0, os.SEEK_END)
+            count = index_size // OFFSET_SIZE
+
+            def offset_at(number):
+                index_file.seek(number * OFFSET_SIZE)
+                return struct.unpack(OFFSET_FORMAT, index_file.read(OFFSET_SIZE))[0]
+
+            # Offsets increase, so the entries past the end of the log (written before a
+            # crash that lost the log's tail) are found by binary search
+            low, high = 0, count
+            while low < high:
+                middle = (low + high) // 2
+                if offset_at(middle) < size:
+                    low = middle + 1
+                else:
+                    high = middle
+            count = low
+            if count * OFFSET_SIZE != index_size:
+                index_file.truncate(count * OFFSET_SIZE)
+
+            # Index any lines written after the last indexed one
+            with open(self.file_path, 'rb') as f:
+                position = 0
+                if count:
+                    position = offset_at(count - 1)
+                    f.seek(position)
+                    position += len(f.readline())
+                f.seek(position)
+                missing = []
+                for line in iter(f.readline, b''):
+                    missing.append(struct.pack(OFFSET_FORMAT, position))
+                    position += len(line)
+                    if len(missing) >= 65536:
+                        index_file.write(b''.join(missing))
+                        count += len(missing)
+                        missing = []
+                if missing:
+                    index_file.write(b''.join(missing))
+                    count += len(missing)
+        return count
+
+    @staticmethod
+    def _encode(document):
+        return (json.dumps(document, separators=(',', ':')) + "\n").encode('utf-8')
+
+    @metrics.timed("rag_json_write_seconds")
+    def append_many(self, documents):
+        """
+        Append documents to the log.
+
+        Args:
+            documents (list): The documents to append.
+
+        Returns:
+            list: The byte offset of each appended document.
+        """
+        with self._lock:
+            position = self._file.tell()
+            offsets = []
+            lines = []
+            for document in documents:
+                line = self._encode(document)
+                offsets.append(position)
+                lines.append(line)
+                position += len(line)
+            self._file.write(b''.join(lines))
+            self._file.flush()
+            self._index_file.write(b''.join(struct.pack(OFFSET_FORMAT, offset) for offset in offsets))
+            self._index_file.flush()
+            self._count += len(offsets)
+            self._unsynced += len(documents)
+            if self._unsynced >= JSON_FSYNC_EVERY or time.monotonic() - self._last_sync >= JSON_FSYNC_INTERVAL:
+                self._sync()
+        metrics.increment("rag_documents_logged", len(documents))
+        return offsets
+
+    def append(self, document):
+        """Append one document and return its byte offset."""
+        return self.append_many([document])[0]
+
+    def _sync(self):
+        """fsync the log and its index. Caller holds the lock."""
+        os.fsync(self._file.fileno())
+        os.fsync(self._index_file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def flush(self):
+        """Force pending writes to disk."""
+        with self._lock:
+            if self._unsynced and not self._file.closed:
+                self._sync()
+
+    def close(self):
+        """Flush and close the log."""
+        self.flush()
+        with self._lock:
+            self._file.close()
+            self._index_file.close()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def end_offset(self):
+        """The byte offset just past the last document."""
+        with self._lock:
+            return self._file.tell()
+
+    def read_at(self, offset):
+        """Read the document stored at a byte offset."""
+        with open(self.file_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def iter_documents(self, start_offset=0):
+        """
+        Stream documents from a byte offset without loading the log into memory.
+
+        Args:
+            start_offset (int): The byte offset to start reading from.
+
+        Yields:
+            tuple: (offset, next_offset, document) for every document from start_offset.
+        """
+        end_offset = self.end_offset
+        with open(self.file_path, 'rb') as f:
+            f.seek(start_offset)
+            position = start_offset
+            while position < end_offset:
+                line = f.readline()
+                if not line:
+                    break
+                next_position = position + len(line)
+                yield position, next_position, json.loads(line)
+                position = next_position
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+def get_document_log(domain):
+    """Return the process-wide DocumentLog for a domain, opening it on first use."""
+    with _logs_lock:
+        log = _logs.get(domain)
+        if log is None:
+            log = DocumentLog(domain)
+            _logs[domain] = log
+        return log
+
+@atexit.register
+def flush_all_document_logs():
+    """Flush every open document log."""
+    with _logs_lock:
+        logs = list(_logs.values())
+    for log in logs:
+        log.flush()
+
+def close_document_logs():
+    """Flush and close every open document log; the next get_document_log call reopens it."""
+    with _logs_lock:
+        logs = list(_logs.values())
+        _logs.clear()
+    for log in logs:
+        log.close()
+
+def save_to_json(document, domain):
+    """
+    Append a document to the domain's JSONL document log.
+
+    Args:
+        document (dict): The document to be saved.
+        domain (str): The domain name used for the file name.
+
+    Returns:
+        int: The byte offset of the document in the log.
+    """
+    return get_document_log(domain).append(document)
+
+def save_batch_to_json(documents, domain):
+    """
+    Append a batch of documents to the domain's JSONL document log with a single write.
+
+    Args:
+        documents (list): The documents to be saved.
+        domain (str): The domain name used for the file name.
+
+    Returns:
+        list: The byte offset of each document in the log.
+    """
+    if not documents:
+        return []
+    return get_document_log(domain).append_many(documents)
+
+def iter_json_documents(domain, start_offset=0):
+    """
+    Stream the documents of a domain from its JSONL document log.
+
+    Args:
+        domain (str): The domain name.
+        start_offset (int): The byte offset to start reading from.
+
+    Yields:
+        tuple: (offset, next_offset, document) for every document from start_offset.
+    """
+    return get_document_log(domain).iter_documents(start_offset)
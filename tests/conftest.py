@@ -0,0 +1,69 @@
+import itertools
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Storage paths are read from utils.config when the project modules are imported,
+# so they point into a temporary directory before any other project import.
+import utils.config as config
+
+STORAGE_DIRECTORY = tempfile.mkdtemp(prefix="rag-tests-")
+for name in ("JSON_STORAGE_PATH", "FAISS_STORAGE_PATH", "FAISS_SHARD_PATH", "DOCSTORE_PATH", "DOMAIN_METADATA_PATH",
+             "EMBEDDING_CACHE_PATH"):
+    setattr(config, name, os.path.join(STORAGE_DIRECTORY, name.lower()))
+    os.makedirs(getattr(config, name))
+
+import rag_manager.domain
+import rag_manager.manager
+from benchmarks.fake_elasticsearch import FakeElasticsearch, AsyncFakeElasticsearch
+from rag_manager.manager import RAGManager
+from utils.logger import configure_logging
+
+configure_logging("WARNING")
+
+VOCABULARY = ("apple banana cherry delta echo falcon garnet harbor island jungle kernel lantern meadow nectar orbit "
+              "pepper quartz river saddle timber umbra violet walnut xenon yarrow zephyr anchor bramble cobalt "
+              "dune ember fjord glacier hollow ivory jasper kelp lagoon marble nimbus onyx prairie quiver").split()
+
+_domain_numbers = itertools.count()
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(STORAGE_DIRECTORY, ignore_errors=True)
+
+def make_documents(count, words=40, seed=0):
+    """Return count documents of random vocabulary words, one chunk each with the default chunk size."""
+    generator = random.Random(seed)
+    return [{"data": " ".join(generator.choice(VOCABULARY) for _ in range(words))} for _ in range(count)]
+
+def indexed_unique_ids(es, index_name):
+    """Return the unique_ids of the chunk documents in an Elasticsearch index."""
+    response = es.search(index=index_name, body={"query": {"match_all": {}}, "size": 10000})
+    return {str(hit['_source']['unique_id']) for hit in response['hits']['hits']}
+
+@pytest.fixture
+def es(monkeypatch):
+    """A FakeElasticsearch that domains and federated searches use instead of a cluster."""
+    client = FakeElasticsearch()
+    async_client = AsyncFakeElasticsearch(client)
+    for module in (rag_manager.domain, rag_manager.manager):
+        monkeypatch.setattr(module, "get_elasticsearch_client", lambda: client)
+        monkeypatch.setattr(module, "get_async_elasticsearch_client", lambda: async_client)
+    return client
+
+@pytest.fixture
+def domain_name():
+    """A domain name no other test uses (domain names cannot contain '_')."""
+    return f"test{next(_domain_numbers)}"
+
+@pytest.fixture
+def manager(es):
+    """A RAGManager on the fake Elasticsearch, without background maintenance during the test."""
+    manager = RAGManager(flush_interval=3600)
+    yield manager
+    manager.shutdown()
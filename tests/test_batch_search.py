@@ -0,0 +1,40 @@
+import pytest
+
+from conftest import make_documents
+
+QUERIES = ["apple banana cherry", "river saddle timber", "glacier hollow ivory", "apple banana cherry"]
+
+@pytest.fixture
+def domain(manager, domain_name):
+    manager.add_domain(domain_name, "m")
+    manager.add_data_batch(domain_name, "m", make_documents(40))
+    return manager.load_domain(domain_name, "m")
+
+@pytest.mark.parametrize("mode", ["text", "embedding", "hybrid"])
+def test_batch_matches_single_queries(manager, domain, mode):
+    singles = [manager.search_domain(domain, query, mode, 5) for query in QUERIES]
+    assert manager.search_domain_batch(domain, QUERIES, mode, 5) == singles
+
+def test_text_batch_is_one_request(manager, es, domain):
+    before = es.requests
+    manager.search_domain_batch(domain, QUERIES, "text", 5)
+    assert es.requests - before == 1
+
+def test_batch_mixes_cached_and_searched_queries(manager, domain, monkeypatch):
+    cached = manager.generate_prompt(domain.domain_name, "m", QUERIES[1], "text", 3)
+    searched = []
+    search_domain_batch = manager.search_domain_batch
+
+    def record(domain, queries, mode, k):
+        searched.extend(queries)
+        return search_domain_batch(domain, queries, mode, k)
+
+    monkeypatch.setattr(manager, "search_domain_batch", record)
+    results = manager.generate_prompt_batch(domain.domain_name, "m", QUERIES, "text", 3)
+    assert searched == [QUERIES[0], QUERIES[2], QUERIES[3]]
+    assert results[1] == cached
+    assert results[0] == results[3]
+
+def test_batch_rejects_an_unknown_mode(manager, domain):
+    with pytest.raises(ValueError):
+        manager.generate_prompt_batch(domain.domain_name, "m", QUERIES, "fuzzy")
@@ -0,0 +1,48 @@
+import pytest
+
+from conftest import make_documents, indexed_unique_ids
+from storage import elastic_storage
+from storage.elastic_storage import BulkIndexError
+from utils.helpers import get_sync_checkpoint
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(elastic_storage, "ELASTICSEARCH_RETRY_BACKOFF", 0)
+
+def test_batch_is_written_to_elasticsearch_and_faiss(manager, es, domain_name):
+    manager.add_domain(domain_name, "m")
+    documents = make_documents(30)
+    assert manager.add_data_batch(domain_name, "m", documents) == 30
+    domain = manager.load_domain(domain_name, "m")
+    assert domain.faiss_index.ntotal == 30
+    assert indexed_unique_ids(es, domain.index_name) == {document['unique_id'] for document in documents}
+
+def test_rejected_item_is_retried(manager, es, domain_name):
+    domain = manager.add_domain(domain_name, "m")
+    es.reject("1_0", status=429, times=2)
+    documents = make_documents(5)
+    manager.add_data_batch(domain_name, "m", documents)
+    assert indexed_unique_ids(es, domain.index_name) == {document['unique_id'] for document in documents}
+    assert not es.rejections
+
+def test_rejected_item_stops_the_checkpoint(manager, es, domain_name):
+    domain = manager.add_domain(domain_name, "m")
+    manager.add_data_batch(domain_name, "m", make_documents(5, seed=1))
+    checkpoint = get_sync_checkpoint(domain_name, "m")[0]
+
+    documents = make_documents(5, seed=2)
+    es.reject("8_0", status=400, times=None)
+    with pytest.raises(BulkIndexError) as raised:
+        manager.add_data_batch(domain_name, "m", documents)
+    assert list(raised.value.errors) == ["8_0"]
+    assert get_sync_checkpoint(domain_name, "m")[0] == checkpoint
+    assert domain.faiss_index.ntotal == 5
+
+    # Once Elasticsearch accepts the document, the next write ingests the failed group again, without duplicates
+    es.rejections.clear()
+    manager.add_data(domain_name, "m", {"data": "a later document"})
+    assert get_sync_checkpoint(domain_name, "m")[0] > checkpoint
+    assert domain.faiss_index.ntotal == 11
+    assert "8" in indexed_unique_ids(es, domain.index_name)
+    assert len(indexed_unique_ids(es, domain.index_name)) == 11
+    assert [hit['unique_id'] for hit in domain.embedding_search(documents[2]['data'], 2)][0] == "8"
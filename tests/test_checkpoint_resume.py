@@ -0,0 +1,77 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from conftest import make_documents, indexed_unique_ids
+from rag_manager.manager import RAGManager
+from storage import elastic_storage
+from storage.elastic_storage import BulkIndexError
+from storage.json_storage import get_document_log
+from utils.config import JSON_STORAGE_PATH
+from utils.helpers import get_sync_checkpoint
+from utils.id_generator import get_id_allocator
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(elastic_storage, "ELASTICSEARCH_RETRY_BACKOFF", 0)
+
+def test_resume_from_checkpoint_after_torn_log_line(es, domain_name):
+    documents = make_documents(24)
+    ingested, logged = documents[:20], documents[20:22]
+    first = RAGManager(flush_interval=3600)
+    first.add_domain(domain_name, "m")
+    first.add_data_batch(domain_name, "m", ingested)
+
+    # Two documents reach the log but not the index, then the process dies mid-write
+    timestamp = datetime.utcnow().isoformat()
+    unique_ids = get_id_allocator(domain_name).allocate(len(logged))
+    for document, unique_id in zip(logged, unique_ids):
+        document.update(domain=domain_name, timestamp=timestamp, unique_id=unique_id)
+    get_document_log(domain_name).append_many(logged)
+    first.shutdown()
+    log_path = os.path.join(JSON_STORAGE_PATH, f"{domain_name}.jsonl")
+    with open(log_path, 'ab') as f:
+        f.write(b'{"data":"torn docu')
+
+    manager = RAGManager(flush_interval=3600)
+    try:
+        domain = manager.load_domain(domain_name, "m")
+        with open(log_path, 'rb') as f:
+            assert f.read().endswith(b'\n')
+        assert len(get_document_log(domain_name)) == 22
+        assert domain.faiss_index.ntotal == 22
+        assert indexed_unique_ids(es, domain.index_name) == {document['unique_id'] for document in documents[:22]}
+        for document in logged:
+            assert domain.embedding_search(document['data'], 1)[0]['unique_id'] == document['unique_id']
+
+        # New documents get IDs above every ID handed out before the crash
+        manager.add_data(domain_name, "m", documents[22])
+        assert int(documents[22]['unique_id']) > max(int(unique_id) for unique_id in unique_ids)
+        assert domain.faiss_index.ntotal == 23
+    finally:
+        manager.shutdown()
+
+def test_recovery_without_checkpoint_resumes_inside_a_batch(es, domain_name):
+    first = RAGManager(flush_interval=3600)
+    first.add_domain(domain_name, "m")
+    assert get_sync_checkpoint(domain_name, "m")[0] is None
+
+    # Elasticsearch takes the first half of a batch, whose documents share one timestamp
+    documents = make_documents(10)
+    for unique_id in range(6, 11):
+        es.reject(f"{unique_id}_0", status=400)
+    with pytest.raises(BulkIndexError):
+        first.add_data_batch(domain_name, "m", documents)
+    first.shutdown()
+    assert get_sync_checkpoint(domain_name, "m")[0] is None
+    assert len({document['timestamp'] for document in documents}) == 1
+
+    manager = RAGManager(flush_interval=3600)
+    try:
+        domain = manager.load_domain(domain_name, "m")
+        assert indexed_unique_ids(es, domain.index_name) == {document['unique_id'] for document in documents}
+        for document in documents[5:]:
+            assert domain.embedding_search(document['data'], 1)[0]['unique_id'] == document['unique_id']
+    finally:
+        manager.shutdown()
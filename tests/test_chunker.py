@@ -0,0 +1,111 @@
+import io
+import random
+import re
+
+import pytest
+
+from utils import chunker
+from utils.chunker import iter_chunks, iter_chunk_documents, CHUNK_STRATEGIES
+from utils.helpers import split_text_into_chunks
+
+UNIT_PATTERNS = {"word": r"\S+", "token": r"\w+|[^\w\s]"}
+
+def make_text(seed=0, sentences=200, endings=(".", "!", "?", ",", "")):
+    rng = random.Random(seed)
+    vocabulary = ["alpha", "beta", "gamma", "délta", "naïve", "x_1", "42", "don't", "e-mail", "日本語", "😀"]
+    parts = []
+    for _ in range(sentences):
+        sentence = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 14)))
+        parts.append(sentence + rng.choice(endings) + rng.choice([" ", "  ", "\n", "\n\n\t"]))
+    return "".join(parts)
+
+def expected_windows(text, strategy, chunk_size, overlap):
+    """Chunks of the list-based splitter: slide over the unit list, stopping at the window that reaches the end."""
+    units = [(match.start(), match.end()) for match in re.finditer(UNIT_PATTERNS[strategy], text)]
+    windows = []
+    for start in range(0, len(units), chunk_size - overlap):
+        window = units[start:start + chunk_size]
+        windows.append((window[0][0], window[-1][1] - window[0][0]))
+        if start + chunk_size >= len(units):
+            break
+    return windows
+
+def read_blocks(text, block_size):
+    stream = io.StringIO(text)
+    return iter(lambda: stream.read(block_size), '')
+
+@pytest.mark.parametrize("strategy", ["word", "token"])
+@pytest.mark.parametrize("chunk_size,overlap", [(1, 0), (7, 3), (50, 10), (5000, 50)])
+def test_counted_chunks_match_the_unit_list(strategy, chunk_size, overlap):
+    text = make_text()
+    chunks = list(iter_chunks(text, chunk_size, overlap, strategy))
+    assert [(offset, length) for offset, length, _ in chunks] == expected_windows(text, strategy, chunk_size, overlap)
+    for offset, length, chunk in chunks:
+        assert chunk == text[offset:offset + length]
+
+def test_word_chunks_join_the_same_words_as_the_legacy_splitter():
+    text = make_text(seed=1)
+    words = text.split()
+    for chunk, start in zip(split_text_into_chunks(text, 20, 5, "word"), range(0, len(words), 15)):
+        assert chunk.split() == words[start:start + 20]
+
+@pytest.mark.parametrize("strategy", CHUNK_STRATEGIES)
+@pytest.mark.parametrize("block_size", [1, 7, 64, 1000])
+def test_streamed_blocks_give_the_same_chunks(strategy, block_size, monkeypatch):
+    text = make_text(seed=2)
+    whole = list(iter_chunks(text, 30, 8, strategy))
+    assert list(iter_chunks(read_blocks(text, block_size), 30, 8, strategy)) == whole
+    # In-memory strings are scanned in blocks of SCAN_BLOCK_SIZE characters too
+    monkeypatch.setattr(chunker, "SCAN_BLOCK_SIZE", block_size)
+    assert list(iter_chunks(text, 30, 8, strategy)) == whole
+
+def sentences_of(text):
+    return [match.group() for match in re.finditer(r"\S(?:.*?[.!?](?=\s|$)|.*\S|)", text, re.DOTALL)]
+
+def test_sentence_chunks_hold_whole_sentences():
+    # Every sentence ends in a terminal, so none is longer than a chunk
+    text = make_text(seed=3, endings=(".", "!", "?"))
+    sentences = sentences_of(text)
+    chunks = [chunk for _, _, chunk in iter_chunks(text, 40, 10, "sentence")]
+    covered = []
+    for chunk in chunks:
+        assert len(chunk.split()) <= 40
+        chunk_sentences = sentences_of(chunk)
+        assert all(sentence in sentences for sentence in chunk_sentences)
+        # Repeated sentences come from the end of the previous chunk and fit in the overlap
+        repeated = [sentence for sentence in chunk_sentences if sentence in covered[-len(chunk_sentences):]]
+        assert sum(len(sentence.split()) for sentence in repeated) <= 10
+        covered.extend(sentence for sentence in chunk_sentences if sentence not in repeated)
+    assert covered == sentences
+
+def test_long_sentences_are_split_into_word_windows():
+    words = [f"w{number}" for number in range(25)]
+    text = "Short one. " + " ".join(words) + ". Tail."
+    chunks = [chunk for _, _, chunk in iter_chunks(text, 10, 2, "sentence")]
+    assert chunks[0] == "Short one."
+    assert chunks[1].split() == words[:10]
+    assert chunks[2].split() == words[8:18]
+    assert chunks[-1] == "Tail."
+
+def test_empty_and_blank_text_has_no_chunks():
+    for strategy in CHUNK_STRATEGIES:
+        assert list(iter_chunks("", 10, 2, strategy)) == []
+        assert list(iter_chunks(" \n\t ", 10, 2, strategy)) == []
+
+def test_invalid_arguments_raise():
+    with pytest.raises(ValueError):
+        list(iter_chunks("some text", 10, 2, "paragraph"))
+    with pytest.raises(ValueError):
+        list(iter_chunks("some text", 10, 10))
+    with pytest.raises(ValueError):
+        list(iter_chunks("some text", 10, -1))
+
+def test_chunk_documents_carry_ids_and_offsets():
+    document = {"unique_id": "7", "data": make_text(seed=4, sentences=20), "source": "test"}
+    chunk_documents = list(iter_chunk_documents(document, 12, 2, "word"))
+    assert len(chunk_documents) > 1
+    for ordinal, chunk_document in enumerate(chunk_documents):
+        assert chunk_document["chunk_id"] == f"7_{ordinal}"
+        assert chunk_document["source"] == "test"
+        offset, length = chunk_document["chunk_offset"], chunk_document["chunk_length"]
+        assert document["data"][offset:offset + length] == chunk_document["data"]
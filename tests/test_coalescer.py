@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from search.coalescer import SearchCoalescer
+
+class RecordingSearch:
+    """A search_batch returning n numbered results per query and recording each batch."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, queries, n):
+        self.batches.append((list(queries), n))
+        return [[f"{query}:{rank}" for rank in range(n)] for query in queries]
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=2)
+    yield executor
+    executor.shutdown()
+
+def test_queued_searches_share_one_batch(executor):
+    search = RecordingSearch()
+    coalescer = SearchCoalescer(search, executor, max_wait=0.2, max_batch_size=3)
+    futures = [coalescer.submit("a", 2), coalescer.submit("b", 4), coalescer.submit("c", 1)]
+    assert [future.result(5) for future in futures] == [["a:0", "a:1"], ["b:0", "b:1", "b:2", "b:3"], ["c:0"]]
+    assert search.batches == [(["a", "b", "c"], 4)]
+    stats = coalescer.stats()
+    assert stats["batch_size"]["count"] == 1
+    assert stats["queued"] == 0
+
+def test_batches_are_cut_at_the_maximum_size(executor):
+    search = RecordingSearch()
+    coalescer = SearchCoalescer(search, executor, max_wait=0.2, max_batch_size=2)
+    futures = [coalescer.submit(query, 1) for query in "abcde"]
+    assert [future.result(5)[0] for future in futures] == ["a:0", "b:0", "c:0", "d:0", "e:0"]
+    assert [queries for queries, _ in search.batches] == [["a", "b"], ["c", "d"], ["e"]]
+
+def test_a_failed_batch_fails_every_request(executor):
+    def fail(queries, n):
+        raise RuntimeError("index gone")
+
+    coalescer = SearchCoalescer(fail, executor, max_wait=0.05)
+    futures = [coalescer.submit(query, 1) for query in "ab"]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="index gone"):
+            future.result(5)
+
+def test_requests_fail_once_the_executor_is_shut_down():
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.shutdown()
+    coalescer = SearchCoalescer(RecordingSearch(), executor, max_wait=0)
+    with pytest.raises(RuntimeError):
+        coalescer.search("a", 1)
@@ -0,0 +1,102 @@
+import faiss
+import pytest
+
+from conftest import make_documents, indexed_unique_ids
+from rag_manager.manager import RAGManager
+from storage.faiss_storage import get_inner_index
+
+def top_unique_id(domain, text):
+    return domain.embedding_search(text, 1)[0]['unique_id']
+
+def add_documents(manager, domain_name, documents, **domain_options):
+    manager.add_domain(domain_name, "m", **domain_options)
+    manager.add_data_batch(domain_name, "m", documents)
+    return manager.load_domain(domain_name, "m")
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_deleted_document_is_not_returned(manager, es, domain_name, index_type):
+    documents = make_documents(30)
+    domain = add_documents(manager, domain_name, documents, index_type=index_type)
+    target = documents[3]
+    unique_id = target['unique_id']
+    assert top_unique_id(domain, target['data']) == unique_id
+
+    assert manager.delete_document(domain_name, "m", unique_id)
+    assert not manager.delete_document(domain_name, "m", unique_id)
+
+    query = target['data']
+    assert all(hit['unique_id'] != unique_id for hit in domain.embedding_search(query, 10))
+    assert all(str(hit['unique_id']) != unique_id for hit in domain.hybrid_search(query, 10))
+    assert all(str(hit['unique_id']) != unique_id for hit in domain.text_search(query, 10))
+    assert all(str(hit['unique_id']) != unique_id for hit in domain.hybrid_search_batch([query], 10)[0])
+    assert unique_id not in indexed_unique_ids(es, domain.index_name)
+    assert len(domain.embedding_search(query, 10)) == 10
+
+def test_search_widens_past_many_tombstones(manager, domain_name):
+    documents = make_documents(40)
+    domain = add_documents(manager, domain_name, documents)
+    survivors = sorted(document['unique_id'] for document in documents[38:])
+    for document in documents[:38]:
+        assert manager.delete_document(domain_name, "m", document['unique_id'])
+    assert domain.docstore.tombstoned_vectors == 38
+
+    for document in documents[:5]:
+        assert sorted(hit['unique_id'] for hit in domain.embedding_search(document['data'], 2)) == survivors
+    assert [len(row) for row in domain.embedding_search_batch([documents[1]['data'], "apple"], 3)] == [2, 2]
+
+def test_updated_document_is_found_by_its_new_text(manager, es, domain_name):
+    documents = make_documents(30)
+    replacement = make_documents(1, seed=99)[0]['data']
+    domain = add_documents(manager, domain_name, documents)
+    unique_id = documents[5]['unique_id']
+
+    assert manager.update_document(domain_name, "m", unique_id, {"data": replacement})
+    assert not manager.update_document(domain_name, "m", "999999", {"data": replacement})
+
+    best = domain.embedding_search(replacement, 1)[0]
+    assert best['unique_id'] == unique_id
+    assert replacement.startswith(best['data'])
+    assert all(hit['data'] != documents[5]['data'] for hit in domain.embedding_search(documents[5]['data'], 10))
+    assert str(domain.text_search(replacement, 1)[0]['unique_id']) == unique_id
+    assert unique_id in indexed_unique_ids(es, domain.index_name)
+
+def test_delete_finds_a_document_logged_through_another_model(manager, domain_name):
+    manager.add_domain(domain_name, "m")
+    other = manager.add_domain(domain_name, "n")
+    document = make_documents(1)[0]
+    manager.add_data(domain_name, "m", document)
+    # Model "n" has not ingested the document yet
+    assert manager.delete_document(domain_name, "n", document['unique_id'])
+    assert all(hit['unique_id'] != document['unique_id'] for hit in other.embedding_search(document['data'], 5))
+
+def test_ivf_compaction_keeps_chunk_ids(es, domain_name):
+    documents = make_documents(80)
+    manager = RAGManager(flush_interval=3600)
+    try:
+        domain = add_documents(manager, domain_name, documents, index_type="ivf_flat",
+                               index_params={"upgrade_threshold": 40, "nlist": 4})
+        assert isinstance(get_inner_index(domain.faiss_index), faiss.IndexIVF)
+        deleted = {document['unique_id'] for document in documents[::3]}
+        for unique_id in deleted:
+            assert manager.delete_document(domain_name, "m", unique_id)
+
+        ntotal = domain.faiss_index.ntotal
+        assert domain.compact() == len(deleted)
+        assert domain.faiss_index.ntotal == ntotal - len(deleted)
+        assert not domain.docstore.tombstones
+
+        # IndexIVF keeps the positions it stored; each remaining document must still map to its own chunk
+        for document in documents:
+            if document['unique_id'] not in deleted:
+                assert top_unique_id(domain, document['data']) == document['unique_id']
+    finally:
+        manager.shutdown()
+
+    # The compacted index is saved and reloads with the same IDs
+    manager = RAGManager(flush_interval=3600)
+    try:
+        reloaded = manager.load_domain(domain_name, "m")
+        assert reloaded.faiss_index.ntotal == ntotal - len(deleted)
+        assert top_unique_id(reloaded, documents[1]['data']) == documents[1]['unique_id']
+    finally:
+        manager.shutdown()
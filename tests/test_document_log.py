@@ -0,0 +1,61 @@
+import os
+import struct
+
+from storage.json_storage import OFFSET_FORMAT, OFFSET_SIZE, DocumentLog
+
+def index_offsets(log):
+    with open(log.index_path, 'rb') as f:
+        data = f.read()
+    return [offset for offset, in struct.iter_unpack(OFFSET_FORMAT, data)]
+
+def line_offsets(log):
+    return [offset for offset, _, _ in log.iter_documents()]
+
+def test_count_survives_a_reopen(tmp_path):
+    log = DocumentLog("docs", str(tmp_path))
+    offsets = log.append_many([{"n": n} for n in range(5)])
+    log.close()
+    reopened = DocumentLog("docs", str(tmp_path))
+    assert len(reopened) == 5
+    assert index_offsets(reopened) == offsets
+    assert reopened.read_at(offsets[3]) == {"n": 3}
+
+def test_torn_line_is_dropped(tmp_path):
+    log = DocumentLog("docs", str(tmp_path))
+    log.append_many([{"n": n} for n in range(3)])
+    log.close()
+    with open(log.file_path, 'ab') as f:
+        f.write(b'{"n":')
+    reopened = DocumentLog("docs", str(tmp_path))
+    assert len(reopened) == 3
+    assert reopened.append({"n": 3}) == index_offsets(reopened)[-1]
+    assert [document for _, _, document in reopened.iter_documents()] == [{"n": n} for n in range(4)]
+
+def test_missing_entries_are_appended(tmp_path):
+    log = DocumentLog("docs", str(tmp_path))
+    log.append_many([{"n": n} for n in range(6)])
+    log.close()
+    with open(log.index_path, 'rb+') as f:
+        f.truncate(2 * OFFSET_SIZE + 3)  # a crash between the log and index writes, mid-entry
+    reopened = DocumentLog("docs", str(tmp_path))
+    assert len(reopened) == 6
+    assert index_offsets(reopened) == line_offsets(reopened)
+
+def test_entries_past_the_log_are_dropped(tmp_path):
+    log = DocumentLog("docs", str(tmp_path))
+    offsets = log.append_many([{"n": n} for n in range(6)])
+    log.close()
+    with open(log.file_path, 'rb+') as f:
+        f.truncate(offsets[4])  # the log's tail was lost but its index entries were not
+    reopened = DocumentLog("docs", str(tmp_path))
+    assert len(reopened) == 4
+    assert index_offsets(reopened) == offsets[:4]
+
+def test_index_is_not_rewritten_on_open(tmp_path):
+    log = DocumentLog("docs", str(tmp_path))
+    log.append_many([{"n": n} for n in range(4)])
+    log.close()
+    before = os.stat(log.index_path)
+    DocumentLog("docs", str(tmp_path)).close()
+    after = os.stat(log.index_path)
+    assert (after.st_ino, after.st_size, after.st_mtime_ns) == (before.st_ino, before.st_size, before.st_mtime_ns)
@@ -0,0 +1,62 @@
+import functools
+import threading
+
+import pytest
+
+import rag_manager.manager
+from conftest import make_documents
+from rag_manager.domain import RAGDomain
+from rag_manager.manager import RAGManager
+
+@pytest.fixture
+def gate(monkeypatch):
+    """Holds domain loads until set."""
+    event = threading.Event()
+
+    class GatedDomain(RAGDomain):
+        @functools.wraps(RAGDomain.__init__)
+        def __init__(self, *args, **kwargs):
+            event.wait(10)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(rag_manager.manager, "RAGDomain", GatedDomain)
+    return event
+
+def test_concurrent_loads_share_the_first_options(manager, domain_name, gate):
+    future = manager.load_domain_async(domain_name, "m", chunk_size=200)
+    assert manager.load_domain_async(domain_name, "m") is future
+    assert manager.load_domain_async(domain_name, "m", chunk_size=200, overlap=50) is future
+    with pytest.raises(ValueError, match="chunk_size"):
+        manager.load_domain_async(domain_name, "m", chunk_size=100)
+    gate.set()
+    domain = future.result()
+    assert domain.chunk_size == 200
+    assert manager.add_domain(domain_name, "m", chunk_size=200) is domain
+    with pytest.raises(ValueError, match="chunk_size"):
+        manager.add_domain(domain_name, "m")
+
+def test_least_recently_used_domain_is_evicted(es, domain_name):
+    manager = RAGManager(max_loaded=1, flush_interval=3600)
+    try:
+        first = manager.add_domain(domain_name, "m")
+        manager.add_data_batch(domain_name, "m", make_documents(3))
+        manager.add_domain(f"{domain_name}x", "m", chunk_size=100)
+        assert list(manager.working_domains) == [(f"{domain_name}x", "m")]
+        # The evicted domain was saved, and loads again with any options
+        reloaded = manager.add_domain(domain_name, "m", chunk_size=100)
+        assert reloaded is not first
+        assert reloaded.faiss_index.ntotal == 3
+    finally:
+        manager.shutdown()
+
+def test_warm_up_loads_in_the_background(es, domain_name):
+    first = RAGManager(flush_interval=3600)
+    first.add_domain(domain_name, "m")
+    first.shutdown()
+    manager = RAGManager(flush_interval=3600)
+    try:
+        assert {"domain": domain_name, "model": "m"} in manager.list_domains()
+        future, = manager.warm_up([(domain_name, "m")])
+        assert manager.load_domain(domain_name, "m") is future.result()
+    finally:
+        manager.shutdown()
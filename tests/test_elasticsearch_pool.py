@@ -0,0 +1,77 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from elasticsearch import Elasticsearch
+
+from storage import elastic_storage
+from storage.elastic_storage import get_pool_options, get_pool_stats, get_retry_delay
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers the first `failures` requests with 429 and the rest with an empty search result."""
+
+    failures = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            failing = server.requests <= server.failures
+        body = json.dumps({"error": "too many requests"} if failing else
+                          {"took": 1, "timed_out": False, "hits": {"total": {"value": 0, "relation": "eq"},
+                                                                   "hits": []}}).encode()
+        self.send_response(429 if failing else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def flaky_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.failures = 2
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_retry_delay_doubles_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(elastic_storage, "ELASTICSEARCH_RETRY_BACKOFF", 0.5)
+    monkeypatch.setattr(elastic_storage, "ELASTICSEARCH_MAX_RETRY_BACKOFF", 3)
+    assert [get_retry_delay(retry) for retry in range(1, 6)] == [0.5, 1, 2, 3, 3]
+
+def test_retries_are_counted_and_backed_off(monkeypatch, flaky_server):
+    monkeypatch.setattr(elastic_storage, "ELASTICSEARCH_RETRY_BACKOFF", 0.01)
+    es = Elasticsearch(f"http://127.0.0.1:{flaky_server.server_port}", **get_pool_options())
+    before = get_pool_stats()
+    es.search(index="pool", body={"query": {"match_all": {}}})
+    after = get_pool_stats()
+    assert flaky_server.requests == 3
+    assert after["requests"] - before["requests"] == 1
+    assert after["attempts"] - before["attempts"] == 3
+    assert after["retries"] - before["retries"] == 2
+    assert after["backoff_seconds"] - before["backoff_seconds"] == pytest.approx(0.03, abs=0.002)
+    assert after["failures"] == before["failures"]
+    assert after["in_flight"] == 0
+    es.close()
+
+def test_request_that_outlasts_the_retries_fails(monkeypatch, flaky_server):
+    monkeypatch.setattr(elastic_storage, "ELASTICSEARCH_RETRY_BACKOFF", 0.001)
+    flaky_server.failures = 100
+    es = Elasticsearch(f"http://127.0.0.1:{flaky_server.server_port}", **get_pool_options())
+    before = get_pool_stats()
+    with pytest.raises(Exception):
+        es.search(index="pool", body={"query": {"match_all": {}}})
+    after = get_pool_stats()
+    assert flaky_server.requests == elastic_storage.ELASTICSEARCH_MAX_RETRIES + 1
+    assert after["failures"] - before["failures"] == 1
+    es.close()
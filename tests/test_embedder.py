@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from conftest import make_documents
+from utils.embedder import HashingEmbedder, CharCodeEmbedder, get_embedder, get_domain_embedder
+from utils.metadata import get_metadata_file_path, update_domain_metadata
+
+TEXTS = [document['data'] for document in make_documents(20, seed=3)] + ["", "é ü 中文", "a"]
+
+@pytest.mark.parametrize("embedder", [HashingEmbedder(64), CharCodeEmbedder(64)])
+def test_batch_matches_single_texts(embedder):
+    batch = embedder.embed_batch(TEXTS)
+    assert batch.shape == (len(TEXTS), 64) and batch.dtype == np.float32
+    np.testing.assert_allclose(batch, np.stack([embedder.embed(text) for text in TEXTS]), atol=1e-6)
+
+def test_rows_are_normalised():
+    batch = HashingEmbedder(64).embed_batch(TEXTS)
+    norms = np.linalg.norm(batch, axis=1)
+    np.testing.assert_allclose(norms[[i for i, text in enumerate(TEXTS) if len(text) > 1]], 1, atol=1e-5)
+
+def test_deterministic_and_similar_texts_are_closer():
+    first, second = HashingEmbedder(128), HashingEmbedder(128)
+    np.testing.assert_array_equal(first.embed_batch(TEXTS), second.embed_batch(TEXTS))
+    query, near, far = first.embed_batch(["the quick brown fox", "the quick brown foxes", "lorem ipsum dolor"])
+    assert query @ near > query @ far
+
+def test_unknown_embedder_is_rejected():
+    with pytest.raises(ValueError):
+        get_embedder("no-such-embedder")
+
+def test_domain_embedder_is_recorded(domain_name):
+    assert get_domain_embedder(domain_name, "m", 32).embedder_id == "hashing-ngram:32"
+    # The recorded choice wins over later arguments
+    assert get_domain_embedder(domain_name, "m", 64).embedder_id == "hashing-ngram:32"
+
+def test_domains_without_a_recorded_embedder_keep_char_codes(domain_name):
+    update_domain_metadata(get_metadata_file_path(domain_name, "m"), f"{domain_name}_m", embedding_size=16)
+    assert get_domain_embedder(domain_name, "m").embedder_id == "char-code:16"
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from storage.embedding_cache import EmbeddingCache, embed_missing, hash_text
+from utils.embedder import HashingEmbedder
+
+class CountingEmbedder(HashingEmbedder):
+    name = "counting"
+
+    def __init__(self, dimension=16):
+        super().__init__(dimension)
+        self.embedded = []
+
+    def embed_batch(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_batch(texts)
+
+def test_only_new_texts_are_embedded(tmp_path):
+    embedder = CountingEmbedder()
+    cache = EmbeddingCache(embedder.embedder_id, 16, str(tmp_path))
+    embeddings, digests, vectors = embed_missing(embedder, ["a b", "c d", "a b"], cache)
+    assert embedder.embedded == ["a b", "c d"]
+    cache.put_many(digests, vectors)
+
+    again, digests, _ = embed_missing(embedder, ["c d", "e f", "a b"], cache)
+    assert embedder.embedded == ["a b", "c d", "e f"]
+    assert digests == [hash_text("e f")]
+    np.testing.assert_array_equal(again[[0, 2]], embeddings[[1, 0]])
+    np.testing.assert_allclose(again, embedder.embed_batch(["c d", "e f", "a b"]), atol=1e-6)
+
+def test_vectors_survive_a_reopen(tmp_path):
+    vectors = np.random.default_rng(0).standard_normal((3, 8)).astype('float32')
+    EmbeddingCache("e:8", 8, str(tmp_path), lru_size=1).put_many(["x", "y", "z"], vectors)
+    reopened = EmbeddingCache("e:8", 8, str(tmp_path), lru_size=1)
+    found = reopened.get_many(["x", "y", "z", "w"])
+    assert sorted(found) == ["x", "y", "z"]
+    np.testing.assert_array_equal(found["y"], vectors[1])
+    assert reopened.stats()["misses"] == 1
+
+def test_row_without_a_key_is_dropped(tmp_path):
+    cache = EmbeddingCache("e:4", 4, str(tmp_path))
+    cache.put_many(["x"], np.ones((1, 4), dtype='float32'))
+    with open(cache.vectors_path, 'ab') as f:
+        f.write(np.zeros(4, dtype='float32').tobytes())  # a crash between the vector and key writes
+    reopened = EmbeddingCache("e:4", 4, str(tmp_path))
+    assert reopened.stats()["vectors"] == 1
+    reopened.put_many(["y"], np.full((1, 4), 2, dtype='float32'))
+    np.testing.assert_array_equal(EmbeddingCache("e:4", 4, str(tmp_path)).get_many(["y"])["y"], [2, 2, 2, 2])
+
+def test_read_only_view_picks_up_new_rows(tmp_path):
+    writer = EmbeddingCache("e:4", 4, str(tmp_path))
+    reader = EmbeddingCache("e:4", 4, str(tmp_path), read_only=True)
+    writer.put_many(["x"], np.ones((1, 4), dtype='float32'))
+    assert reader.get_many(["x"]) == {}
+    reader.refresh()
+    assert list(reader.get_many(["x"])) == ["x"]
+    with pytest.raises(ValueError):
+        reader.put_many(["y"], np.ones((1, 4), dtype='float32'))
@@ -0,0 +1,60 @@
+import faiss
+import numpy as np
+
+from conftest import make_documents
+from rag_manager.manager import RAGManager
+from storage.faiss_shards import ShardedIndex, merge_shard_results, shards_are_current
+from storage.faiss_storage import create_faiss_index, save_index_to_disk
+from utils import helpers
+
+def test_merge_keeps_the_best_of_every_shard():
+    distances = [np.array([[0.1, 0.5]], dtype='float32'), np.array([[0.2, 0.3]], dtype='float32')]
+    labels = [np.array([[1, 2]]), np.array([[3, -1]])]
+    merged_distances, merged_labels = merge_shard_results(list(zip(distances, labels)), 3, higher_is_better=False)
+    assert merged_labels.tolist() == [[1, 3, 2]]
+    _, merged_labels = merge_shard_results(list(zip(distances, labels)), 3, higher_is_better=True)
+    # An empty slot (-1) sorts last even though its score is the best
+    assert merged_labels.tolist() == [[2, 3, 1]]
+
+def test_sharded_search_matches_the_whole_index(domain_name):
+    vectors = np.random.default_rng(0).standard_normal((300, 16)).astype('float32')
+    faiss.normalize_L2(vectors)
+    index = create_faiss_index(16)
+    index.add_with_ids(vectors, np.arange(1000, 1300, dtype='int64'))
+    save_index_to_disk(index, domain_name, "m")
+    queries = vectors[:5]
+    expected_distances, expected_labels = index.search(queries, 10)
+
+    sharded = helpers.open_sharded_index(domain_name, "m", index, 3, "flat")
+    try:
+        assert sharded.ntotal == 300
+        assert sum(sharded.shard_sizes) == 300
+        distances, labels = sharded.search(queries, 10)
+        assert labels.tolist() == expected_labels.tolist()
+        np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+    finally:
+        sharded.close()
+    assert shards_are_current(domain_name, "m", 3)
+    assert not shards_are_current(domain_name, "m", 2)
+
+    # Saving the index again makes its shards stale
+    index.add_with_ids(vectors[:1], np.array([2000], dtype='int64'))
+    save_index_to_disk(index, domain_name, "m")
+    assert not shards_are_current(domain_name, "m", 3)
+
+def test_large_read_only_domain_is_served_by_shards(es, domain_name, monkeypatch):
+    documents = make_documents(20)
+    first = RAGManager(flush_interval=3600)
+    first.add_domain(domain_name, "m", index_params={"shards": 2})
+    first.add_data_batch(domain_name, "m", documents)
+    first.shutdown()
+
+    monkeypatch.setattr(helpers, "FAISS_SHARD_MIN_VECTORS", 10)
+    manager = RAGManager(read_only=[(domain_name, "m")], flush_interval=3600)
+    try:
+        domain = manager.load_domain(domain_name, "m")
+        assert isinstance(domain.faiss_index, ShardedIndex)
+        for document in documents[:3]:
+            assert domain.embedding_search(document['data'], 1)[0]['unique_id'] == document['unique_id']
+    finally:
+        manager.shutdown()
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from benchmarks.fake_elasticsearch import AsyncFakeElasticsearch
+from conftest import make_documents
+from search.federated_search import federated_search, federated_search_async, select_domains
+
+def test_select_domains_expands_globs():
+    known = [{"domain": "newsa", "model": "m"}, {"domain": "newsb", "model": "m"}, {"domain": "newsb", "model": "x"},
+             {"domain": "docs", "model": "m"}]
+    assert select_domains(known, "news*") == [("newsa", "m"), ("newsb", "m"), ("newsb", "x")]
+    assert select_domains(known, ["docs", "newsb"], "m") == [("docs", "m"), ("newsb", "m")]
+    with pytest.raises(ValueError):
+        select_domains(known, "sports*")
+
+def test_federated_search_merges_domains(es, manager, domain_name):
+    other = f"{domain_name}other"
+    documents = make_documents(6)
+    for name, batch in ((domain_name, documents[:3]), (other, documents[3:])):
+        manager.add_domain(name, "m")
+        manager.add_data_batch(name, "m", batch)
+
+    response = manager.federated_search([domain_name, other], documents[4]['data'], "hybrid", 4)
+    assert response["timed_out"] == []
+    assert response["domains"] == [{"domain": domain_name, "model": "m"}, {"domain": other, "model": "m"}]
+    assert len(response["results"]) == 4
+    assert (response["results"][0]["domain"], response["results"][0]["unique_id"]) == (other, documents[4]['unique_id'])
+    assert {result["domain"] for result in response["results"]} == {domain_name, other}
+
+def test_slow_domain_leg_is_left_out(es):
+    release = threading.Event()
+
+    def search_embeddings(domain_key, query, candidates):
+        if domain_key == ("slow", "m"):
+            release.wait(5)
+            return []
+        return [{"unique_id": "1", "chunk_id": "1_0", "data": "fast hit", "score": 0.9}]
+
+    start = time.perf_counter()
+    try:
+        response = federated_search(es, [("fast", "m"), ("slow", "m")], "query", search_embeddings, "embedding", 3,
+                                    timeout=0.2)
+    finally:
+        release.set()
+    assert time.perf_counter() - start < 2
+    assert response["timed_out"] == [{"domain": "slow", "model": "m", "leg": "embedding"}]
+    assert [(result["domain"], result["unique_id"]) for result in response["results"]] == [("fast", "1")]
+
+def test_slow_domain_leg_is_left_out_async(es):
+    async def search_embeddings(domain_key, query, candidates):
+        if domain_key == ("slow", "m"):
+            await asyncio.sleep(5)
+        return [{"unique_id": "1", "chunk_id": "1_0", "data": "hit", "score": 0.9}]
+
+    async def run():
+        return await federated_search_async(AsyncFakeElasticsearch(es), [("fast", "m"), ("slow", "m")], "query",
+                                            search_embeddings, "embedding", 3, timeout=0.2)
+
+    response = asyncio.run(run())
+    assert response["timed_out"] == [{"domain": "slow", "model": "m", "leg": "embedding"}]
+    assert [(result["domain"], result["unique_id"]) for result in response["results"]] == [("fast", "1")]
@@ -0,0 +1,42 @@
+import pytest
+
+from search.hybrid_search import reciprocal_rank_fusion, weighted_score_fusion, fuse_hits
+
+def chunk(unique_id, ordinal=0):
+    return {"unique_id": unique_id, "chunk_id": f"{unique_id}_{ordinal}", "data": f"text of {unique_id}"}
+
+def test_rrf_scores():
+    scores = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert scores["a"] == pytest.approx(1 / 61 + 1 / 62)
+    assert scores["b"] == pytest.approx(1 / 62)
+    assert scores["c"] == pytest.approx(1 / 63 + 1 / 61)
+    assert sorted(scores, key=scores.get, reverse=True) == ["a", "c", "b"]
+
+def test_rrf_weights():
+    scores = reciprocal_rank_fusion([["a"], ["b"]], k=60, weights=[1.0, 2.0])
+    assert scores["b"] == pytest.approx(2 * scores["a"])
+
+def test_weighted_fusion_normalises_each_list():
+    scores = weighted_score_fusion([[("a", 10.0), ("b", 5.0), ("c", 0.0)], [("c", 0.9), ("a", 0.1)]])
+    assert scores == pytest.approx({"a": 1.0, "b": 0.5, "c": 1.0})
+    # A list whose scores are all equal counts fully for each of its items
+    assert weighted_score_fusion([[("a", 3.0), ("b", 3.0)]]) == {"a": 1.0, "b": 1.0}
+
+def test_fuse_hits_ranks_documents_found_by_both_legs_first():
+    text_hits = [(chunk("1"), 9.0), (chunk("1", 1), 8.0), (chunk("2"), 5.0), (chunk("3"), 1.0)]
+    embedding_hits = [("4", 0.9), ("3", 0.8), ("1", 0.7)]
+    results, documents, missing = fuse_hits(text_hits, embedding_hits, k=4)
+    assert [unique_id for unique_id, _, _, _ in results] == ["1", "3", "4", "2"]
+    # Ranks are per document: the second chunk of document 1 does not take a text rank
+    assert [result[2:] for result in results] == [(0, 2), (2, 1), (None, 0), (1, None)]
+    assert documents["1"]["chunk_id"] == "1_0"
+    # Documents only FAISS found have to be resolved by the caller
+    assert missing == ["4"]
+
+    results, _, missing = fuse_hits(text_hits, embedding_hits, k=2)
+    assert [unique_id for unique_id, _, _, _ in results] == ["1", "3"]
+    assert missing == []
+
+def test_unknown_fusion_is_rejected():
+    with pytest.raises(ValueError):
+        fuse_hits([], [], 5, fusion="borda")
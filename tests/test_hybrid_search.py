@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from conftest import make_documents
+
+QUERY = "xylophonequartzes"  # No text match, but close to the second chunk of the document below
+
+@pytest.fixture
+def domain(manager, domain_name):
+    manager.add_domain(domain_name, "m", chunk_size=8, overlap=0)
+    manager.add_data_batch(domain_name, "m", make_documents(10, words=8) + [
+        {"data": " ".join(["apple"] * 8 + ["xylophonequartz"] * 8)}])
+    return manager.load_domain(domain_name, "m")
+
+def check_faiss_only_hit(results):
+    hit = next(result for result in results if result["unique_id"] == "11")
+    assert hit["text_rank"] is None
+    assert hit["embedding_rank"] == 0
+    assert hit["chunk_id"] == "11_1"
+    assert "xylophonequartz" in hit["data"]
+
+def test_faiss_only_hit_is_the_matched_chunk(domain):
+    check_faiss_only_hit(domain.hybrid_search(QUERY, 3))
+
+def test_batch_resolves_the_matched_chunk_per_query(domain):
+    matched, other = domain.hybrid_search_batch([QUERY, "apple apple apple"], 3)
+    check_faiss_only_hit(matched)
+    assert next(result for result in other if result["unique_id"] == "11")["chunk_id"] == "11_0"
+
+def test_async_resolves_the_matched_chunk(domain):
+    check_faiss_only_hit(asyncio.run(domain.hybrid_search_async(QUERY, 3)))
@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.id_generator import IDAllocator, get_id_allocator
+from utils.metadata import get_metadata_file_path, update_domain_metadata
+
+def test_concurrent_allocations_are_unique_and_increasing(domain_name):
+    allocator = IDAllocator(domain_name, block_size=10)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        ranges = list(executor.map(allocator.allocate, [3] * 40))
+    ids = [int(unique_id) for allocated in ranges for unique_id in allocated]
+    assert len(set(ids)) == 120
+    assert all(int(b) == int(a) + 1 for allocated in ranges for a, b in zip(allocated, allocated[1:]))
+
+def test_restart_resumes_above_every_handed_out_id(domain_name):
+    first = IDAllocator(domain_name, block_size=10)
+    handed_out = first.allocate(3) + [first.next_id()]
+    restarted = IDAllocator(domain_name, block_size=10)
+    assert int(restarted.next_id()) > max(int(unique_id) for unique_id in handed_out)
+
+def test_block_larger_than_the_block_size(domain_name):
+    allocator = IDAllocator(domain_name, block_size=4)
+    assert allocator.allocate(10) == [str(unique_id) for unique_id in range(1, 11)]
+    assert IDAllocator(domain_name, block_size=4).next_id() == "13"
+
+def test_recovers_from_elasticsearch_without_a_checkpoint(es, domain_name):
+    es.index(index=f"{domain_name}_m", id="41_0", document={"unique_id": "41", "data": "x"})
+    es.index(index=f"{domain_name}_m", id="9_0", document={"unique_id": "9", "data": "y"})
+    assert get_id_allocator(domain_name, es).next_id() == "42"
+
+def test_high_water_mark_is_shared_by_models(domain_name):
+    update_domain_metadata(get_metadata_file_path(domain_name), domain_name, id_high_water_mark=500)
+    assert IDAllocator(domain_name).next_id() == "501"
@@ -0,0 +1,72 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from conftest import make_documents
+from rag_manager.manager import RAGManager
+from storage.faiss_storage import (CorruptIndexError, create_faiss_index, file_checksum, get_index_file_path,
+                                   load_index_from_disk, save_index_to_disk)
+
+def test_saved_index_round_trips_with_its_checksum(domain_name):
+    index = create_faiss_index(8)
+    vectors = np.random.default_rng(0).standard_normal((5, 8)).astype('float32')
+    index.add_with_ids(vectors, np.arange(10, 15, dtype='int64'))
+    save_index_to_disk(index, domain_name, "m")
+    path = get_index_file_path(domain_name, "m")
+    with open(f"{path}.sha256") as f:
+        assert f.read() == file_checksum(path)
+    assert not os.path.exists(f"{path}.tmp")
+
+    for mmap in (False, True):
+        loaded = load_index_from_disk(domain_name, "m", mmap=mmap)
+        assert loaded.ntotal == 5
+        assert faiss.vector_to_array(loaded.id_map).tolist() == list(range(10, 15))
+
+def test_corrupt_index_is_rejected(domain_name):
+    save_index_to_disk(create_faiss_index(8), domain_name, "m")
+    with open(get_index_file_path(domain_name, "m"), 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+    with pytest.raises(CorruptIndexError):
+        load_index_from_disk(domain_name, "m")
+
+def test_corrupt_index_is_rebuilt_from_the_log(es, domain_name):
+    documents = make_documents(12)
+    first = RAGManager(flush_interval=3600)
+    first.add_domain(domain_name, "m")
+    first.add_data_batch(domain_name, "m", documents)
+    first.shutdown()
+    with open(get_index_file_path(domain_name, "m"), 'r+b') as f:
+        f.truncate(os.path.getsize(get_index_file_path(domain_name, "m")) // 2)
+
+    manager = RAGManager(flush_interval=3600)
+    try:
+        domain = manager.load_domain(domain_name, "m")
+        assert domain.faiss_index.ntotal == 12
+        assert domain.embedding_search(documents[4]['data'], 1)[0]['unique_id'] == documents[4]['unique_id']
+        # The rebuilt index was saved with a matching checksum
+        assert load_index_from_disk(domain_name, "m").ntotal == 12
+    finally:
+        manager.shutdown()
+
+def test_read_only_domain_serves_the_saved_index(es, domain_name):
+    documents = make_documents(6)
+    first = RAGManager(flush_interval=3600)
+    first.add_domain(domain_name, "m")
+    first.add_data_batch(domain_name, "m", documents)
+    first.shutdown()
+
+    manager = RAGManager(read_only=[(domain_name, "m")], flush_interval=3600)
+    try:
+        domain = manager.load_domain(domain_name, "m")
+        assert domain.read_only
+        assert domain.memory_usage() == 0
+        assert domain.embedding_search(documents[2]['data'], 1)[0]['unique_id'] == documents[2]['unique_id']
+        with pytest.raises(ValueError):
+            manager.add_data(domain_name, "m", {"data": "more text"})
+    finally:
+        manager.shutdown()
@@ -0,0 +1,57 @@
+import faiss
+import numpy as np
+import pytest
+
+from conftest import make_documents
+from storage.faiss_storage import (create_faiss_index, upgrade_index_if_needed, get_index_factory_string,
+                                   get_inner_index, save_batch_to_faiss)
+
+def random_vectors(count, dimension=32, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dimension)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def test_factory_strings():
+    assert get_index_factory_string("flat", 32) == "Flat"
+    assert get_index_factory_string("hnsw", 32, params={"hnsw_m": 16}) == "HNSW16,Flat"
+    assert get_index_factory_string("ivf_flat", 32, params={"nlist": 8}) == "IVF8,Flat"
+    assert get_index_factory_string("ivf_pq", 32, params={"nlist": 8}) == "IVF8,PQ4x8"
+    with pytest.raises(ValueError):
+        get_index_factory_string("annoy", 32)
+
+@pytest.mark.parametrize("index_type, inner_type", [("flat", faiss.IndexFlat), ("hnsw", faiss.IndexHNSW),
+                                                    ("ivf_flat", faiss.IndexFlat), ("auto", faiss.IndexFlat)])
+def test_trained_types_start_flat(index_type, inner_type):
+    assert isinstance(get_inner_index(create_faiss_index(32, index_type)), inner_type)
+
+@pytest.mark.parametrize("index_type, inner_type", [("ivf_flat", faiss.IndexIVFFlat), ("ivf_pq", faiss.IndexIVFPQ),
+                                                    ("auto", faiss.IndexIVFFlat)])
+def test_upgrade_past_the_threshold_keeps_ids(index_type, inner_type):
+    params = {"upgrade_threshold": 400, "nlist": 4, "nprobe": 4, "pq_nbits": 4}
+    index = create_faiss_index(32, index_type, params)
+    vectors = random_vectors(500)
+    ids = np.arange(500, dtype='int64') * 7 + 3
+    save_batch_to_faiss(index, ids[:300], vectors[:300])
+    assert upgrade_index_if_needed(index, index_type, params) is index
+    save_batch_to_faiss(index, ids[300:], vectors[300:])
+
+    upgraded = upgrade_index_if_needed(index, index_type, params)
+    assert isinstance(get_inner_index(upgraded), inner_type)
+    assert upgraded.ntotal == 500
+    # PQ codes are lossy, so its vectors are only expected among the ten nearest
+    _, found = upgraded.search(vectors[:50], 10 if index_type == "ivf_pq" else 1)
+    assert np.mean([unique_id in row for unique_id, row in zip(ids[:50], found)]) >= 0.9
+
+def test_flat_type_is_never_upgraded():
+    index = create_faiss_index(32, "flat", {"upgrade_threshold": 10})
+    save_batch_to_faiss(index, np.arange(20, dtype='int64'), random_vectors(20))
+    assert upgrade_index_if_needed(index, "flat", {"upgrade_threshold": 10}) is index
+
+def test_domain_keeps_its_recorded_index_type(manager, domain_name):
+    domain = manager.add_domain(domain_name, "m", index_type="hnsw")
+    manager.add_data_batch(domain_name, "m", make_documents(10))
+    assert isinstance(get_inner_index(domain.faiss_index), faiss.IndexHNSW)
+    assert domain.index_type == "hnsw"
+
+def test_unknown_index_type_is_rejected(manager, domain_name):
+    with pytest.raises(ValueError):
+        manager.add_domain(domain_name, "m", index_type="annoy")
@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import faiss
+import numpy as np
+import pytest
+
+from conftest import make_documents, indexed_unique_ids
+from storage import elastic_storage
+from storage.docstore import get_docstore
+from storage.elastic_storage import BulkIndexError
+from storage.faiss_storage import create_faiss_index
+from storage.json_storage import get_document_log
+from utils.embedder import get_domain_embedder
+from utils.helpers import sync_log_range, get_sync_checkpoint
+from utils.ingest_pipeline import can_embed_in_workers
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(elastic_storage, "ELASTICSEARCH_RETRY_BACKOFF", 0)
+
+def log_documents(domain_name, count, deleted=()):
+    """Append count documents to the domain's log, each deleted one followed later by a delete record."""
+    timestamp = datetime.utcnow().isoformat()
+    records = []
+    for number, document in enumerate(make_documents(count, words=30), start=1):
+        document.update(domain=domain_name, timestamp=timestamp, unique_id=str(number))
+        records.append(document)
+    records.extend({"op": "delete", "unique_id": str(unique_id)} for unique_id in deleted)
+    get_document_log(domain_name).append_many(records)
+
+def faiss_ids(index):
+    return sorted(faiss.vector_to_array(index.id_map).tolist())
+
+def vectors_by_id(index):
+    vectors = index.index.reconstruct_n(0, index.ntotal)
+    return dict(zip(faiss.vector_to_array(index.id_map).tolist(), vectors))
+
+def ingest(es, domain_name, parallel):
+    embedder = get_domain_embedder(domain_name, "m", 32)
+    index = create_faiss_index(embedder.dimension)
+    chunks, offset = sync_log_range(es, index, domain_name, "m", 0, chunk_size=8, overlap=2, batch_size=5,
+                                    embedder=embedder, parallel=parallel)
+    return index, chunks, offset
+
+def test_pipeline_ingests_the_same_chunks_as_the_inline_path(es, domain_name):
+    inline_domain, pipeline_domain = domain_name, f"{domain_name}pipeline"
+    for name in (inline_domain, pipeline_domain):
+        log_documents(name, 23, deleted=(4, 17))
+    assert can_embed_in_workers(get_domain_embedder(pipeline_domain, "m", 32))
+
+    inline_index, inline_chunks, inline_offset = ingest(es, inline_domain, parallel=False)
+    pipeline_index, pipeline_chunks, pipeline_offset = ingest(es, pipeline_domain, parallel=True)
+
+    assert pipeline_chunks == inline_chunks > 23
+    assert inline_offset == get_document_log(inline_domain).end_offset
+    assert pipeline_offset == get_document_log(pipeline_domain).end_offset
+    assert get_sync_checkpoint(pipeline_domain, "m")[0] == pipeline_offset
+    assert faiss_ids(pipeline_index) == faiss_ids(inline_index)
+    assert pipeline_index.ntotal == pipeline_chunks
+    expected = {str(number) for number in range(1, 24)} - {"4", "17"}
+    assert indexed_unique_ids(es, f"{pipeline_domain}_m") == indexed_unique_ids(es, f"{inline_domain}_m") == expected
+    assert len(get_docstore(pipeline_domain, "m")) == len(get_docstore(inline_domain, "m"))
+    assert set(get_docstore(pipeline_domain, "m").tombstones) == {"4", "17"}
+
+    # The workers embed exactly as the main process does
+    inline_vectors = vectors_by_id(inline_index)
+    for faiss_id, vector in vectors_by_id(pipeline_index).items():
+        np.testing.assert_allclose(vector, inline_vectors[faiss_id], rtol=1e-5, atol=1e-6)
+
+def test_pipeline_failure_keeps_only_checkpointed_groups(es, domain_name):
+    log_documents(domain_name, 20)
+    # Document 13 is in the third group of five; Elasticsearch rejects its first chunk for good
+    es.reject("13_0", status=400, times=None)
+
+    with pytest.raises(BulkIndexError):
+        ingest(es, domain_name, parallel=True)
+
+    offset, _ = get_sync_checkpoint(domain_name, "m")
+    assert 0 < offset < get_document_log(domain_name).end_offset
+    checkpointed = {document['unique_id'] for _, end, document in get_document_log(domain_name).iter_documents()
+                    if end <= offset}
+    assert checkpointed
+    assert "13" not in checkpointed
+
+    # The next sync resumes from the checkpoint once Elasticsearch accepts the chunk
+    es.rejections.clear()
+    embedder = get_domain_embedder(domain_name, "m", 32)
+    index = create_faiss_index(embedder.dimension)
+    sync_log_range(es, index, domain_name, "m", offset, chunk_size=8, overlap=2, batch_size=5, embedder=embedder,
+                   parallel=True)
+    assert indexed_unique_ids(es, f"{domain_name}_m") == {str(number) for number in range(1, 21)}
@@ -0,0 +1,68 @@
+import io
+import json
+import logging
+
+import pytest
+
+from utils.logger import configure_logging, get_logger
+
+@pytest.fixture
+def output():
+    stream = io.StringIO()
+    configure_logging("DEBUG", "text", stream)
+    yield stream
+    configure_logging("WARNING")
+
+def lines(stream):
+    return stream.getvalue().splitlines()
+
+def test_text_records_carry_key_value_fields(output):
+    get_logger("tests.text").info("Indexed %d documents", 3, index="a_m", reason="two words", empty="")
+    [line] = lines(output)
+    assert line.endswith(' INFO rag.tests.text Indexed 3 documents index=a_m reason="two words" empty=""')
+
+def test_json_records_are_one_object_per_line():
+    stream = io.StringIO()
+    configure_logging("INFO", "json", stream)
+    try:
+        logger = get_logger("tests.json")
+        logger.warning("Slow search", seconds=1.5, domain="d")
+        try:
+            raise RuntimeError("boom")
+        except RuntimeError:
+            logger.error("Search failed", exc_info=True)
+    finally:
+        configure_logging("WARNING")
+    # Tracebacks are escaped, so every record stays on one line
+    first, second = [json.loads(line) for line in lines(stream)]
+    assert {key: first[key] for key in ("level", "logger", "message", "seconds", "domain")} == {
+        "level": "WARNING", "logger": "rag.tests.json", "message": "Slow search", "seconds": 1.5, "domain": "d"}
+    assert "RuntimeError: boom" in second["exception"]
+
+def test_disabled_levels_format_nothing(output):
+    configure_logging("INFO", "text", output)
+    logger = get_logger("tests.levels")
+    calls = []
+
+    class Unformattable:
+        def __str__(self):
+            calls.append("str")
+            return "value"
+
+    logger.debug("Hidden %s", Unformattable(), field=lambda: calls.append("field"))
+    assert calls == [] and lines(output) == []
+    assert not logger.is_enabled_for(logging.DEBUG) and logger.is_enabled_for(logging.INFO)
+    logger.info("Shown", field=lambda: "computed")
+    assert lines(output)[0].endswith("Shown field=computed")
+
+def test_sampling_emits_one_record_in_every(output):
+    logger = get_logger("tests.sampling")
+    for number in range(7):
+        logger.debug("Hot path", number=number, every=3)
+    assert [line.partition(" Hot path ")[2] for line in lines(output)] == [
+        f"number={number} sampled=3" for number in (0, 3, 6)]
+
+def test_reconfiguring_replaces_the_handler(output):
+    configure_logging("DEBUG", "text", output)
+    get_logger("tests.handlers").info("Once")
+    assert len(lines(output)) == 1
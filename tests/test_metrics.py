@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from conftest import make_documents
+from utils.metrics import MetricsRegistry, Histogram
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == [(0.1, 2), (1.0, 3), ("+Inf", 4)]
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == pytest.approx(2.65)
+
+def test_render_uses_the_prometheus_text_format():
+    registry = MetricsRegistry(enabled=True)
+    registry.describe("rag_test_seconds", "Test latency.")
+    registry.observe("rag_test_seconds", 0.003, route='/a"b')
+    registry.increment("rag_test_documents", 5)
+    registry.increment("rag_test_documents", 2)
+    lines = registry.render().splitlines()
+    assert "# HELP rag_test_seconds Test latency." in lines
+    assert "# TYPE rag_test_seconds histogram" in lines
+    assert 'rag_test_seconds_bucket{route="/a\\"b",le="0.0025"} 0' in lines
+    assert 'rag_test_seconds_bucket{route="/a\\"b",le="0.005"} 1' in lines
+    assert 'rag_test_seconds_bucket{route="/a\\"b",le="+Inf"} 1' in lines
+    assert 'rag_test_seconds_count{route="/a\\"b"} 1' in lines
+    assert "# TYPE rag_test_documents_total counter" in lines
+    assert "rag_test_documents_total 7" in lines
+
+def test_spans_and_timed_functions_record_latency_and_errors():
+    registry = MetricsRegistry(enabled=True)
+
+    @registry.timed("rag_test_call_seconds")
+    def call(fail):
+        if fail:
+            raise RuntimeError("failed")
+        return "done"
+
+    @registry.timed("rag_test_async_seconds")
+    async def async_call():
+        return "async done"
+
+    assert call(False) == "done"
+    with pytest.raises(RuntimeError):
+        call(True)
+    assert asyncio.run(async_call()) == "async done"
+    lines = registry.render().splitlines()
+    assert "rag_test_call_seconds_count 2" in lines
+    assert "rag_test_call_seconds_errors_total 1" in lines
+    assert "rag_test_async_seconds_count 1" in lines
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+
+    @registry.timed("rag_test_seconds")
+    def call():
+        return 1
+
+    assert call() == 1
+    with registry.span("rag_test_seconds"):
+        pass
+    registry.observe("rag_test_seconds", 1.0)
+    registry.increment("rag_test_total")
+    assert registry.render() == "\n"
+
+def test_collectors_are_read_at_render_time():
+    registry = MetricsRegistry(enabled=True)
+    size = [1]
+    registry.register_collector("test", lambda: [("rag_test_size", "gauge", "Size.", [({"domain": "d"}, size[0])])])
+    size[0] = 5
+    assert 'rag_test_size{domain="d"} 5' in registry.render().splitlines()
+    registry.register_collector("test", lambda: [])
+    assert "rag_test_size" not in registry.render()
+    registry.unregister_collector("test")
+
+def test_metrics_endpoint_reports_loaded_domains(es, domain_name):
+    import wrapper.api_wrapper as front_end
+    manager = front_end.manager
+    manager.add_domain(domain_name, "m")
+    manager.add_data_batch(domain_name, "m", make_documents(4))
+    manager.generate_prompt(domain_name, "m", "apple banana", "embedding", 2)
+
+    client = front_end.app.test_client()
+    client.get('/cache_stats')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    lines = response.get_data(as_text=True).splitlines()
+    assert f'rag_faiss_index_vectors{{domain="{domain_name}",model="m"}} 4' in lines
+    assert f'rag_coalescer_batch_size_count{{domain="{domain_name}",model="m"}} 1' in lines
+    assert any(line.startswith('rag_http_request_seconds_count{method="GET",route="/cache_stats",status="200"}')
+               for line in lines)
@@ -0,0 +1,85 @@
+import faiss
+import numpy as np
+import pytest
+
+from conftest import make_documents
+from rag_manager.manager import RAGManager
+from search.embedding_search import rerank_neighbours, embed_queries
+from storage.faiss_storage import (create_faiss_index, get_index_factory_string, estimate_index_memory,
+                                   get_inner_index)
+
+def random_vectors(count, dimension=64, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def test_precision_selects_the_vector_codec():
+    assert get_index_factory_string("flat", 64, params={"precision": "float16"}) == "SQfp16"
+    assert get_index_factory_string("hnsw", 64, params={"precision": "sq8", "hnsw_m": 16}) == "HNSW16,SQ8"
+    assert get_index_factory_string("ivf_flat", 64, 10000, {"precision": "sq8", "nlist": 8}) == "IVF8,SQ8"
+    # PQ compresses the vectors itself
+    assert get_index_factory_string("ivf_pq", 64, 10000, {"precision": "sq8", "nlist": 8}).startswith("IVF8,PQ")
+    with pytest.raises(ValueError):
+        get_index_factory_string("flat", 64, params={"precision": "int4"})
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_reduced_precision_shrinks_the_index_and_keeps_recall(index_type):
+    vectors = random_vectors(2000)
+    ids = np.arange(len(vectors), dtype='int64')
+    queries = random_vectors(50, seed=1)
+    reference = create_faiss_index(64, "flat")
+    reference.add_with_ids(vectors, ids)
+    _, expected = reference.search(queries, 10)
+
+    memory = {}
+    for precision in ("float32", "float16", "sq8"):
+        # SQ8 is trained on [-1, 1] when created, so vectors can be added right away
+        index = create_faiss_index(64, index_type, {"precision": precision})
+        index.add_with_ids(vectors, ids)
+        _, labels = index.search(queries, 10)
+        recall = np.mean([len(set(row) & set(expected_row)) / 10 for row, expected_row in zip(labels, expected)])
+        assert recall >= 0.85, precision
+        memory[precision] = estimate_index_memory(index)
+    assert memory["sq8"] < memory["float16"] < memory["float32"]
+
+def test_rerank_scores_candidates_with_exact_vectors(es, manager, domain_name):
+    manager.add_domain(domain_name, "m", index_params={"precision": "sq8"})
+    manager.add_data_batch(domain_name, "m", make_documents(12))
+    domain = manager.load_domain(domain_name, "m")
+    docstore = domain.docstore
+    faiss_ids, _ = next(docstore.iter_texts())
+    candidates = [(faiss_id, 0.0) for faiss_id in faiss_ids]
+    query = embed_queries(["apple banana cherry"], domain.faiss_index.d, domain.embedder)
+
+    [reranked] = rerank_neighbours(query, [candidates], docstore, domain.embedder, 5)
+    assert len(reranked) == 5
+    chunks = docstore.get_many(faiss_ids)
+    exact = {faiss_id: float(embed_queries([chunk['data']], domain.faiss_index.d, domain.embedder)[0] @ query[0])
+             for faiss_id, chunk in chunks.items()}
+    assert [faiss_id for faiss_id, _ in reranked] == sorted(exact, key=exact.get, reverse=True)[:5]
+    for faiss_id, score in reranked:
+        assert score == pytest.approx(exact[faiss_id], abs=1e-5)
+
+def test_quantized_domain_with_rerank_finds_its_documents(es, domain_name):
+    documents = make_documents(30)
+    first = RAGManager(flush_interval=3600)
+    first.add_domain(domain_name, "m", index_params={"precision": "sq8", "rerank": 4})
+    first.add_data_batch(domain_name, "m", documents)
+    first.delete_document(domain_name, "m", documents[0]['unique_id'])
+    first.shutdown()
+
+    # The precision is recorded with the domain, so a restart reopens the same index
+    manager = RAGManager(flush_interval=3600)
+    try:
+        domain = manager.load_domain(domain_name, "m")
+        inner = get_inner_index(domain.faiss_index)
+        assert isinstance(inner, faiss.IndexScalarQuantizer)
+        assert inner.sq.qtype == faiss.ScalarQuantizer.QT_8bit
+        for document in documents[1:6]:
+            hits = domain.embedding_search(document['data'], 3)
+            assert hits[0]['unique_id'] == document['unique_id']
+            assert len(hits) == 3
+        hits = domain.embedding_search(documents[0]['data'], 29)
+        assert documents[0]['unique_id'] not in {hit['unique_id'] for hit in hits}
+    finally:
+        manager.shutdown()
@@ -0,0 +1,59 @@
+import time
+
+from conftest import make_documents
+from search.query_cache import QueryCache, query_cache
+
+def test_hit_after_store_for_equivalent_query():
+    cache = QueryCache()
+    calls = []
+    compute = lambda: calls.append(1) or ["result"]
+    assert cache.get_or_compute("d", "m", "text", "Hello  World", 5, compute) == ["result"]
+    assert cache.get_or_compute("d", "m", "text", "hello world", 5, compute) == ["result"]
+    assert len(calls) == 1
+    cache.get_or_compute("d", "m", "text", "hello world", 3, compute)
+    cache.get_or_compute("d", "m", "embedding", "hello world", 5, compute)
+    assert len(calls) == 3
+    assert cache.stats()["hits"] == 1
+
+def test_invalidation_drops_only_that_domain():
+    cache = QueryCache()
+    cache.get_or_compute("a", "m", "text", "q", 5, lambda: ["a"])
+    cache.get_or_compute("b", "m", "text", "q", 5, lambda: ["b"])
+    cache.invalidate_domain("a", "m")
+    assert not cache.lookup("a", "m", "text", "q", 5)[0]
+    assert cache.lookup("b", "m", "text", "q", 5)[:2] == (True, ["b"])
+
+def test_result_computed_before_a_write_is_not_stored():
+    cache = QueryCache()
+    _, _, key, generation = cache.lookup("d", "m", "text", "q", 5)
+    cache.invalidate_domain("d", "m")  # a write lands while the search runs
+    cache.store(key, generation, ["stale"])
+    assert not cache.lookup("d", "m", "text", "q", 5)[0]
+
+def test_ttl_and_size_limits():
+    cache = QueryCache(max_entries=2, ttl=0.05)
+    for query in ("a", "b", "c"):
+        cache.get_or_compute("d", "m", "text", query, 5, lambda: [query])
+    assert not cache.lookup("d", "m", "text", "a", 5)[0]
+    assert cache.stats()["evictions"] == 1
+    time.sleep(0.06)
+    assert not cache.lookup("d", "m", "text", "c", 5)[0]
+    # A result larger than the whole budget is returned but not cached
+    small = QueryCache(max_bytes=10)
+    assert small.get_or_compute("d", "m", "text", "q", 5, lambda: ["x" * 100]) == ["x" * 100]
+    assert small.stats()["entries"] == 0
+
+def test_writes_invalidate_generate_prompt(manager, domain_name):
+    manager.add_domain(domain_name, "m")
+    manager.add_data_batch(domain_name, "m", make_documents(5))
+    query = "zebra crossing"
+    assert all("zebra" not in hit['data'] for hit in manager.generate_prompt(domain_name, "m", query, "text"))
+    hits_before = query_cache.stats()["hits"]
+    manager.generate_prompt(domain_name, "m", query, "text")
+    assert query_cache.stats()["hits"] == hits_before + 1
+
+    document = {"data": "a zebra crossing the road"}
+    manager.add_data(domain_name, "m", document)
+    assert manager.generate_prompt(domain_name, "m", query, "text")[0]['unique_id'] == document['unique_id']
+    manager.delete_document(domain_name, "m", document['unique_id'])
+    assert all(hit['unique_id'] != document['unique_id'] for hit in manager.generate_prompt(domain_name, "m", query, "text"))
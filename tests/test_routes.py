@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import make_documents
+
+@pytest.fixture(params=["flask", "asgi"])
+def post(request, es):
+    """Send a request to one of the front ends and return (status, JSON body); .manager is the front end's manager."""
+    if request.param == "flask":
+        import wrapper.api_wrapper as front_end
+        client = front_end.app.test_client()
+
+        def send(method, path, body):
+            response = client.open(path, method=method, data=body, content_type='application/json')
+            return response.status_code, response.get_json(silent=True)
+    else:
+        import wrapper.asgi_app as front_end
+
+        def send(method, path, body):
+            async def run():
+                messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+                sent = []
+
+                async def receive():
+                    return messages.pop(0)
+
+                async def collect(message):
+                    sent.append(message)
+
+                await front_end.app({'type': 'http', 'method': method, 'path': path}, receive, collect)
+                return sent[0]['status'], json.loads(sent[1]['body'])
+            return asyncio.run(run())
+
+    def request_json(method, path, payload=None, body=None):
+        return send(method, path, body if body is not None else json.dumps(payload or {}).encode())
+    request_json.manager = front_end.manager
+    return request_json
+
+def test_requests_are_dispatched(post, domain_name):
+    assert post('POST', '/add_domain', {"domain_name": domain_name, "model_name": "m"})[0] == 200
+    for document in make_documents(3):
+        assert post('POST', '/add_data', {"domain_name": domain_name, "model_name": "m",
+                                          "document": document["data"]})[0] == 200
+    status, body = post('POST', '/generate_prompt', {"domain_name": domain_name, "model_name": "m",
+                                                     "query": "apple banana", "mode": "embedding", "k": 2})
+    assert status == 200
+    assert len(body["prompt"]) == 2
+    status, body = post('POST', '/delete_document', {"domain_name": domain_name, "model_name": "m",
+                                                     "unique_id": "999"})
+    assert status == 404
+
+def test_unknown_routes(post):
+    assert post('GET', '/no_such_route')[0] == 404
+    assert post('GET', '/add_domain')[0] == 405
+
+def test_invalid_requests_are_400(post, domain_name):
+    assert post('POST', '/add_domain', {"domain_name": domain_name})[0] == 400
+    assert post('POST', '/add_data', body=b'{"domain_name"') == (400, {"error": "Request body must be JSON"})
+    assert post('POST', '/add_data', body=b'[1, 2]') == (400, {"error": "Request body must be a JSON object"})
+    status, body = post('POST', '/generate_prompt', {"domain_name": domain_name, "model_name": "m",
+                                                     "query": "apple", "mode": "fuzzy"})
+    assert status == 400
+    assert "Invalid mode" in body["error"]
+
+def test_unexpected_errors_are_500(post, monkeypatch, domain_name):
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk on fire")
+
+    monkeypatch.setattr(post.manager, "add_data", fail)
+    status, body = post('POST', '/add_data', {"domain_name": domain_name, "model_name": "m", "document": "text"})
+    assert (status, body) == (500, {"error": "Internal server error"})
+
+@pytest.mark.parametrize("k", [0, -3, 2.5, "two", None, True, [2]])
+def test_invalid_k_is_400(post, domain_name, k):
+    assert post('POST', '/add_domain', {"domain_name": domain_name, "model_name": "m"})[0] == 200
+    requests = [
+        ('/generate_prompt', {"domain_name": domain_name, "model_name": "m", "query": "apple"}),
+        ('/generate_prompt_batch', {"domain_name": domain_name, "model_name": "m", "queries": ["apple"]}),
+        ('/federated_search', {"domains": [domain_name], "query": "apple"}),
+    ]
+    for path, payload in requests:
+        assert post('POST', path, {**payload, "k": k}) == (400, {"error": "k must be a positive integer"})
+
+def test_numeric_k_is_accepted(post, domain_name):
+    assert post('POST', '/add_domain', {"domain_name": domain_name, "model_name": "m"})[0] == 200
+    for document in make_documents(3):
+        post('POST', '/add_data', {"domain_name": domain_name, "model_name": "m", "document": document["data"]})
+    for k in ("2", 2.0):
+        status, body = post('POST', '/generate_prompt', {"domain_name": domain_name, "model_name": "m",
+                                                         "query": "apple", "mode": "embedding", "k": k})
+        assert status == 200
+        assert len(body["prompt"]) == 2
@@ -0,0 +1,246 @@
+from collections import deque
+from functools import lru_cache
+import numpy as np
+from utils.config import CHUNK_STRATEGY
+
+CHUNK_STRATEGIES = ("word", "sentence", "token")
+
+SCAN_BLOCK_SIZE = 1 << 20  # Characters of an in-memory text scanned at a time
+SENTENCE_TERMINALS = np.array([ord(character) for character in ".!?"], dtype=np.uint32)
+
+class _StreamBuffer:
+    """The not yet chunked tail of a streamed text, addressed by offsets into the whole text."""
+
+    def __init__(self):
+        self.text = ""
+        self.base = 0
+
+    def append(self, block):
+        self.text += block
+
+    def slice(self, start, end):
+        return self.text[start - self.base:end - self.base]
+
+    def discard_before(self, offset):
+        """Drop text before offset, once that is at least half the buffer so trimming stays linear."""
+        drop = offset - self.base
+        if drop > 0 and drop * 2 >= len(self.text):
+            self.text = self.text[drop:]
+            self.base = offset
+
+@lru_cache(maxsize=None)
+def _character_tables():
+    """Whitespace (str.isspace) and word character (regex \\w) flags for the Basic Multilingual Plane."""
+    characters = [chr(code) for code in range(0x10000)]
+    space = np.array([character.isspace() for character in characters])
+    word = np.array([character.isalnum() or character == '_' for character in characters])
+    return space, word
+
+def _shift(flags, step, fill):
+    """Return flags moved by step positions (1 = each position sees the previous one), padded with fill."""
+    if step > 0:
+        return np.concatenate(([fill], flags[:-1]))
+    return np.concatenate((flags[1:], [fill]))
+
+def _unit_spans(strategy, text):
+    """
+    Find the units of a text with vectorised character classes.
+
+    Words are runs of non-space characters (the split of str.split); tokens are
+    runs of word characters and single other non-space characters; sentences run
+    to terminal punctuation followed by whitespace, or to the last non-space
+    character.
+
+    Returns:
+        tuple: int64 arrays of the start and end offsets of the units.
+    """
+    codes = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    if not len(codes):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    space_table, word_table = _character_tables()
+    plane = np.minimum(codes, 0xFFFF)
+    space = space_table[plane]
+    word = word_table[plane]
+    astral = codes > 0xFFFF
+    if astral.any():
+        for code in np.unique(codes[astral]).tolist():
+            matches = codes == code
+            space[matches] = chr(code).isspace()
+            word[matches] = chr(code).isalnum()
+
+    if strategy == "word":
+        solid = ~space
+        return (np.flatnonzero(solid & _shift(space, 1, True)),
+                np.flatnonzero(solid & _shift(space, -1, True)) + 1)
+    if strategy == "token":
+        other = ~space & ~word
+        return (np.flatnonzero(other | (word & ~_shift(word, 1, False))),
+                np.flatnonzero(other | (word & ~_shift(word, -1, False))) + 1)
+
+    solid = np.flatnonzero(~space)
+    if not len(solid):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    ends = np.flatnonzero(np.isin(codes, SENTENCE_TERMINALS) & _shift(space, -1, True)) + 1
+    if not len(ends) or ends[-1] <= solid[-1]:
+        ends = np.append(ends, solid[-1] + 1)
+    # Each sentence starts at the first non-space character after the previous one
+    starts = solid[np.searchsorted(solid, np.concatenate(([0], ends[:-1])))]
+    return starts, ends
+
+def _iter_blocks(source):
+    if isinstance(source, str):
+        for start in range(0, len(source), SCAN_BLOCK_SIZE):
+            yield source[start:start + SCAN_BLOCK_SIZE]
+    else:
+        yield from source
+
+def _iter_span_batches(source, strategy, buffer):
+    """
+    Yield the start and end offsets of the units of a text, one pair of arrays per block.
+
+    A unit that reaches the end of a block may continue in the next one (a
+    sentence can, even across whitespace), so the last unit of a block is held
+    back until more text arrives or the stream ends.
+    """
+    pending = 0  # Offset of the first character not yet matched
+    for block in _iter_blocks(source):
+        buffer.append(block)
+        text, base = buffer.text, buffer.base
+        starts, ends = _unit_spans(strategy, text[pending - base:])
+        starts, ends = starts + (pending - base), ends + (pending - base)
+        if len(ends) and not text[ends[-1]:].strip():
+            starts, ends = starts[:-1], ends[:-1]
+        if len(ends):
+            pending = base + int(ends[-1])
+            yield starts + base, ends + base
+    starts, ends = _unit_spans(strategy, buffer.text[pending - buffer.base:])
+    if len(ends):
+        yield starts + pending, ends + pending
+
+def _count_windows(span_batches, chunk_size, overlap, buffer):
+    """Slide a window of chunk_size units, overlapping by overlap units, over batches of unit spans."""
+    step = chunk_size - overlap
+    starts = ends = np.empty(0, dtype=np.int64)
+    covered = 0  # Leading units already part of an emitted chunk
+    for batch_starts, batch_ends in span_batches:
+        starts = np.concatenate((starts, batch_starts))
+        ends = np.concatenate((ends, batch_ends))
+        if len(starts) < chunk_size:
+            continue
+        positions = np.arange(0, len(starts) - chunk_size + 1, step)
+        yield from zip(starts[positions].tolist(), ends[positions + chunk_size - 1].tolist())
+        position = int(positions[-1]) + step
+        covered = overlap
+        starts, ends = starts[position:], ends[position:]
+        buffer.discard_before(int(starts[0]) if len(starts) else int(batch_ends[-1]))
+    # The last window holds the remaining units, unless they all belong to the previous chunk
+    if len(starts) > covered:
+        yield int(starts[0]), int(ends[-1])
+
+def _sentence_windows(span_batches, chunk_size, overlap, buffer):
+    """
+    Pack whole sentences into windows of at most chunk_size words.
+
+    The trailing sentences that fit in overlap words (and leave room for the next
+    sentence) are repeated at the start of the next window. A sentence longer than
+    chunk_size is split into word windows.
+    """
+    window = deque()  # (start, end, words)
+    words = 0
+    fresh = False
+    for batch_starts, batch_ends in span_batches:
+        for start, end in zip(batch_starts.tolist(), batch_ends.tolist()):
+            sentence = buffer.slice(start, end)
+            sentence_words = len(sentence.split())
+            if sentence_words > chunk_size:
+                if fresh:
+                    yield window[0][0], window[-1][1]
+                window.clear()
+                words = 0
+                fresh = False
+                word_starts, word_ends = _unit_spans("word", sentence)
+                yield from _count_windows([(word_starts + start, word_ends + start)], chunk_size, overlap, buffer)
+                continue
+            if window and words + sentence_words > chunk_size:
+                yield window[0][0], window[-1][1]
+                kept = 0
+                keep = deque()
+                for unit in reversed(window):
+                    # Leave room for this sentence, and never carry the whole window over
+                    if kept + unit[2] > min(overlap, chunk_size - sentence_words) or len(keep) + 1 == len(window):
+                        break
+                    keep.appendleft(unit)
+                    kept += unit[2]
+                window = keep
+                words = kept
+                buffer.discard_before(window[0][0] if window else start)
+            window.append((start, end, sentence_words))
+            words += sentence_words
+            fresh = True
+    if fresh:
+        yield window[0][0], window[-1][1]
+
+def iter_chunks(source, chunk_size=500, overlap=50, strategy=CHUNK_STRATEGY):
+    """
+    Split text into overlapping chunks, streaming.
+
+    Chunks are spans of the original text, so their offsets can be stored in place
+    of copies. The text is never split into a full word list: it is scanned block
+    by block and only the text of the current window is buffered, so a file object
+    or any iterable of string blocks can be chunked in constant memory. The last
+    chunk is only emitted if it holds text not covered by the previous one.
+
+    Args:
+        source (str | iterable): The text, or an iterable of consecutive text blocks.
+        chunk_size (int): The size of each chunk, in units of the strategy.
+        overlap (int): The number of units repeated between consecutive chunks.
+        strategy (str): 'word' (chunk_size words), 'sentence' (whole sentences up to
+            chunk_size words, overlapping by whole sentences) or 'token' (a budget of
+            chunk_size word-piece and punctuation tokens).
+
+    Yields:
+        tuple: (offset, length, text) of each chunk, where text is
+        source[offset:offset + length].
+
+    Raises:
+        ValueError: If the strategy is unknown or overlap is not smaller than chunk_size.
+    """
+    if strategy not in CHUNK_STRATEGIES:
+        raise ValueError(f"Invalid chunk strategy '{strategy}'. Choose from {CHUNK_STRATEGIES}.")
+    if not 0 <= overlap < chunk_size:
+        raise ValueError("Chunk overlap must be at least 0 and smaller than the chunk size.")
+
+    buffer = _StreamBuffer()
+    span_batches = _iter_span_batches(source, strategy, buffer)
+    if strategy == "sentence":
+        windows = _sentence_windows(span_batches, chunk_size, overlap, buffer)
+    else:
+        windows = _count_windows(span_batches, chunk_size, overlap, buffer)
+    for start, end in windows:
+        yield start, end - start, buffer.slice(start, end)
+
+def iter_chunk_documents(document, chunk_size=500, overlap=50, strategy=CHUNK_STRATEGY):
+    """
+    Split a document into chunk documents.
+
+    Each chunk document is a copy of the document with the chunk text as 'data',
+    a 'chunk_id' of "{unique_id}_{ordinal}" and the 'chunk_offset' and
+    'chunk_length' of the chunk in the document text.
+
+    Args:
+        document (dict): The document, with 'data' and 'unique_id' fields.
+        chunk_size (int): The size of each chunk, in units of the strategy.
+        overlap (int): The number of units repeated between consecutive chunks.
+        strategy (str): The chunking strategy, see iter_chunks.
+
+    Yields:
+        dict: The chunk documents, in order.
+    """
+    unique_id = document['unique_id']
+    for ordinal, (offset, length, chunk) in enumerate(iter_chunks(document['data'], chunk_size, overlap, strategy)):
+        chunk_document = document.copy()
+        chunk_document['data'] = chunk
+        chunk_document['chunk_id'] = f"{unique_id}_{ordinal}"
+        chunk_document['chunk_offset'] = offset
+        chunk_document['chunk_length'] = length
+        yield chunk_document
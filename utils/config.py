@@ -14,6 +14,96 @@ ELASTICSEARCH_PASSWORD = "AYRVyWwXLbFU-QylMbae"
 
 # FAISS configuration
 FAISS_STORAGE_PATH = os.path.normpath(os.path.join(BASE_DIR, "..", "storage", "faiss"))
+FAISS_FLUSH_INTERVAL = 30  # Seconds between background saves of indexes with unsaved writes
+FAISS_VERIFY_CHECKSUM = True  # Check an index file against its .sha256 sidecar before loading it
+DOMAIN_READ_ONLY = []  # (domain, model) pairs opened read-only from a memory-mapped index
+COMPACTION_TOMBSTONE_RATIO = 0.1  # Compact a FAISS index once this fraction of its vectors belongs to deleted documents
+
+# FAISS sharding configuration
+FAISS_SHARDS = 0  # Shard processes serving each large read-only domain (0 or 1 = search in the main process); index_params "shards" overrides it per domain
+FAISS_SHARD_MIN_VECTORS = 1000000  # Read-only domains with fewer vectors are searched in the main process
+FAISS_SHARD_PATH = os.path.normpath(os.path.join(BASE_DIR, "..", "storage", "faiss_shards"))
+
+# Chunk docstore configuration
+DOCSTORE_PATH = os.path.normpath(os.path.join(BASE_DIR, "..", "storage", "docstore"))
+CHUNK_ID_BITS = 16  # FAISS chunk ID = unique_id << CHUNK_ID_BITS | chunk ordinal
 
 # Domain metadata configuration
 DOMAIN_METADATA_PATH = os.path.normpath(os.path.join(BASE_DIR, "..", "storage", "meta"))
+
+# Ingestion configuration
+INGEST_BATCH_SIZE = 256  # Number of chunks written per Elasticsearch _bulk request and FAISS add
+ID_BLOCK_SIZE = 1000  # Number of IDs reserved per persisted high-water mark update
+CHUNK_STRATEGY = "word"  # 'word', 'sentence' or 'token'; changing it re-chunks documents differently on replay
+INGEST_WORKERS = os.cpu_count() or 1  # Processes that chunk and embed documents in the ingestion pipeline
+INGEST_QUEUE_DEPTH = 2 * INGEST_WORKERS  # Document groups in flight between pipeline stages before the reader blocks
+INGEST_PIPELINE_MIN_BYTES = 4 * 1024 * 1024  # Smaller log ranges are ingested on the calling thread
+
+# Embedding configuration
+DEFAULT_EMBEDDER = "hashing-ngram"  # Embedder recorded in the metadata of newly created domains
+
+# Hybrid search configuration
+HYBRID_FUSION = "rrf"  # 'rrf' (reciprocal rank fusion) or 'weighted' (weighted score fusion)
+HYBRID_CANDIDATE_MULTIPLIER = 2  # Each leg retrieves k * multiplier candidates before fusion
+HYBRID_SEARCH_WORKERS = 8  # Threads available for the Elasticsearch leg of hybrid searches
+RRF_K = 60
+
+# Federated search configuration
+FEDERATED_DOMAIN_TIMEOUT = 2.0  # Seconds a domain has to answer a federated search before it is left out of the results
+FEDERATED_SEARCH_WORKERS = 16  # Threads that run the per-domain legs of federated searches
+
+# FAISS index configuration
+DEFAULT_INDEX_TYPE = "auto"  # 'flat', 'ivf_flat', 'ivf_pq', 'hnsw' or 'auto' (flat, upgraded to IVF-Flat when large)
+IVF_UPGRADE_THRESHOLD = 10000  # Vectors a flat index holds before it is rebuilt as IVF
+FAISS_TRAIN_SIZE = 100000  # IVF indexes are trained on the first N vectors
+IVF_NPROBE = 16
+PQ_NBITS = 8
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+DEFAULT_PRECISION = "float32"  # Storage of the vectors: 'float32', 'float16' or 'sq8' (8-bit scalar quantized); index_params "precision" overrides it per domain
+RERANK_FACTOR = 1  # Candidates fetched per result and re-scored with exact float32 vectors (1 = no re-ranking); index_params "rerank" overrides it per domain
+
+# Query cache configuration
+QUERY_CACHE_MAX_ENTRIES = 10000  # Set to 0 to disable the cache
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Approximate memory budget for cached results
+QUERY_CACHE_TTL = 300  # Seconds a cached result stays valid
+
+# Embedding cache configuration
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = os.path.normpath(os.path.join(BASE_DIR, "..", "storage", "embedding_cache"))
+EMBEDDING_CACHE_LRU_SIZE = 50000  # Vectors kept in memory in front of the memory-mapped file
+
+# Document log configuration
+JSON_FSYNC_EVERY = 64  # fsync the JSONL document log after this many documents (1 = every write)
+JSON_FSYNC_INTERVAL = 1.0  # ...or after this many seconds since the last fsync
+
+# Domain loading configuration
+DOMAIN_LOAD_WORKERS = 4  # Threads that load domains in the background
+DOMAIN_WARMUP = []  # (domain, model) pairs loaded when RAGManager starts
+DOMAIN_MAX_LOADED = 32  # Loaded domains kept in memory before the least recently used is evicted
+DOMAIN_MEMORY_BUDGET = 2 * 1024 * 1024 * 1024  # Approximate FAISS memory across loaded domains, in bytes
+
+# Elasticsearch connection pool configuration
+ELASTICSEARCH_CONNECTIONS_PER_NODE = 32  # Kept-alive HTTP connections per node, shared by all domains
+ELASTICSEARCH_REQUEST_TIMEOUT = 10  # Seconds
+ELASTICSEARCH_MAX_RETRIES = 3
+ELASTICSEARCH_RETRY_ON_STATUS = (429, 502, 503, 504)
+ELASTICSEARCH_RETRY_BACKOFF = 0.5  # Seconds before a request's first retry, doubled for each further retry; also the dead-node backoff factor of the pool
+ELASTICSEARCH_MAX_RETRY_BACKOFF = 30  # Seconds; cap of both backoffs
+
+
+# Async server configuration
+FAISS_SEARCH_WORKERS = os.cpu_count() or 4  # Threads that run FAISS searches off the event loop
+ASGI_REQUEST_WORKERS = 64  # Threads that run request handlers; searches in them wait on the event loop
+
+# Search coalescing configuration
+COALESCE_MAX_WAIT = 0.002  # Seconds an embedding search waits for others to share its FAISS batch (0 = only batch what is queued)
+COALESCE_MAX_BATCH_SIZE = 64  # Queries per batched FAISS search
+
+# Logging configuration
+LOG_LEVEL = "INFO"  # Minimum level of the "rag" loggers: DEBUG, INFO, WARNING or ERROR
+LOG_FORMAT = "text"  # 'text' (key=value fields) or 'json' (one object per line)
+LOG_SAMPLE_EVERY = 1000  # Per-document debug records on write paths are emitted once in this many
+
+# Metrics configuration
+METRICS_ENABLED = True  # Record latency histograms and counters for /metrics; when False spans cost one attribute check
@@ -0,0 +1,184 @@
+import threading
+import numpy as np
+from utils.config import DEFAULT_EMBEDDER
+from utils.metadata import get_metadata_file_path, load_domain_metadata, update_domain_metadata
+
+class Embedder:
+    """
+    Base class for embedding engines.
+
+    Subclasses implement embed_batch, which turns a list of texts into a float32
+    matrix of shape (len(texts), dimension). Rows are L2-normalised so inner
+    product and L2 distance both rank by cosine similarity.
+    """
+
+    name = None
+
+    def __init__(self, dimension=128):
+        self.dimension = dimension
+
+    @property
+    def embedder_id(self):
+        """Identifier of the embedder and its output dimension, e.g. 'hashing-ngram:128'."""
+        return f"{self.name}:{self.dimension}"
+
+    def embed_batch(self, texts):
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            np.ndarray: A float32 matrix of shape (len(texts), dimension).
+        """
+        raise NotImplementedError
+
+    def embed(self, text):
+        """Embed a single text and return a float32 vector of shape (dimension,)."""
+        return self.embed_batch([text])[0]
+
+def normalize_rows(matrix):
+    """L2-normalise the rows of a float32 matrix in place, leaving zero rows untouched."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic, CPU-only embedder built from hashed character n-grams.
+
+    All texts of a batch are encoded into one shared byte buffer. The n-gram hashes
+    of every position are computed with whole-array operations, n-grams crossing a
+    text boundary are masked out, and the signed counts are accumulated per row with
+    a single bincount.
+    """
+
+    name = "hashing-ngram"
+
+    _PRIME = np.uint64(1099511628211)
+    _MIX = np.uint64(0xff51afd7ed558ccd)
+
+    def __init__(self, dimension=128, ngram_sizes=(2, 3, 4), seed=0):
+        super().__init__(dimension)
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.seed = seed
+
+    def embed_batch(self, texts):
+        count = len(texts)
+        matrix = np.zeros((count, self.dimension), dtype='float32')
+        if count == 0:
+            return matrix
+
+        encoded = [text.lower().encode('utf-8') for text in texts]
+        lengths = np.fromiter((len(chunk) for chunk in encoded), dtype=np.int64, count=count)
+        buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+        if buffer.size == 0:
+            return matrix
+
+        ends = np.cumsum(lengths)
+        rows_by_position = np.repeat(np.arange(count, dtype=np.int64), lengths)
+
+        flat_buckets = []
+        flat_signs = []
+        with np.errstate(over='ignore'):
+            for size in self.ngram_sizes:
+                positions = buffer.size - size + 1
+                if positions <= 0:
+                    continue
+                hashes = np.full(positions, np.uint64(self.seed * 31 + size), dtype=np.uint64)
+                for offset in range(size):
+                    hashes = hashes * self._PRIME + buffer[offset:offset + positions]
+                hashes ^= hashes >> np.uint64(33)
+                hashes *= self._MIX
+                hashes ^= hashes >> np.uint64(33)
+
+                rows = rows_by_position[:positions]
+                valid = np.arange(positions, dtype=np.int64) + size <= ends[rows]
+                hashes = hashes[valid]
+                rows = rows[valid]
+
+                buckets = (hashes % np.uint64(self.dimension)).astype(np.int64)
+                flat_buckets.append(rows * self.dimension + buckets)
+                flat_signs.append(np.where(hashes >> np.uint64(63), -1.0, 1.0))
+
+        if flat_buckets:
+            counts = np.bincount(
+                np.concatenate(flat_buckets),
+                weights=np.concatenate(flat_signs),
+                minlength=count * self.dimension,
+            )
+            matrix[:] = counts.reshape(count, self.dimension)
+        return normalize_rows(matrix)
+
+class CharCodeEmbedder(Embedder):
+    """
+    Legacy embedder: the character codes of the first `dimension` characters.
+
+    Kept so indexes built before the embedder was recorded in the domain
+    metadata are still queried with the vectors they were built from.
+    """
+
+    name = "char-code"
+
+    def embed_batch(self, texts):
+        matrix = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            codes = np.frombuffer(text[:self.dimension].encode('utf-32-le'), dtype=np.uint32)
+            matrix[row, :codes.size] = codes
+        return normalize_rows(matrix)
+
+EMBEDDERS = {
+    HashingEmbedder.name: HashingEmbedder,
+    CharCodeEmbedder.name: CharCodeEmbedder,
+}
+
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+def get_embedder(name=DEFAULT_EMBEDDER, dimension=128):
+    """
+    Return a shared embedder instance.
+
+    Args:
+        name (str): The registered embedder name.
+        dimension (int): The output dimension.
+
+    Returns:
+        Embedder: The embedder.
+
+    Raises:
+        ValueError: If no embedder is registered under the name.
+    """
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unknown embedder '{name}'. Choose from {sorted(EMBEDDERS)}.")
+    key = (name, dimension)
+    with _embedders_lock:
+        if key not in _embedders:
+            _embedders[key] = EMBEDDERS[name](dimension)
+        return _embedders[key]
+
+def get_domain_embedder(domain_name, model_name, embedding_size=128):
+    """
+    Return the embedder recorded in a domain's metadata, recording the default for new domains.
+
+    Domains whose metadata predates the "embedder" field were built with the
+    character-code embeddings and keep using them.
+
+    Args:
+        domain_name (str): The domain name.
+        model_name (str): The model name.
+        embedding_size (int): The embedding size used if the metadata has none.
+
+    Returns:
+        Embedder: The embedder for the domain.
+    """
+    metadata_file_path = get_metadata_file_path(domain_name, model_name)
+    domain_key = f"{domain_name}_{model_name}"
+    entry = load_domain_metadata(metadata_file_path).get(domain_key)
+    if entry is None:
+        entry = update_domain_metadata(metadata_file_path, domain_key,
+                                       embedding_size=embedding_size, embedder=DEFAULT_EMBEDDER)
+    elif "embedder" not in entry:
+        entry = update_domain_metadata(metadata_file_path, domain_key, embedder=CharCodeEmbedder.name)
+    return get_embedder(entry["embedder"], entry.get("embedding_size", embedding_size))
@@ -1,53 +1,364 @@
-import json
 import os
-import faiss
+from datetime import datetime, timezone
 from elasticsearch import Elasticsearch
-from storage.elastic_storage import save_to_elasticsearch, get_all_documents
-from storage.faiss_storage import save_to_faiss, load_index_from_disk, save_index_to_disk, generate_fake_embeddings
-from utils.config import JSON_STORAGE_PATH, FAISS_STORAGE_PATH
-from utils.id_generator import generate_unique_id
-from utils.config import DOMAIN_METADATA_PATH
+from storage.elastic_storage import (bulk_save_to_elasticsearch, ensure_index, get_latest_document_key,
+                                    delete_documents_by_unique_ids)
+from storage.faiss_storage import (save_batch_to_faiss, load_index_from_disk, save_index_to_disk,
+                                   get_index_file_path, CorruptIndexError, create_faiss_index, upgrade_index_if_needed, get_index_factory_string,
+                                   get_inner_index, clear_readded_document, discard_documents, get_vector_codec, INDEX_TYPES)
+from storage.faiss_shards import open_sharded_index
+from storage.embedding_cache import embed_with_cache
+from storage.docstore import get_docstore, get_chunk_faiss_id
+from storage.json_storage import iter_json_documents, get_document_log
+from utils.config import (INGEST_BATCH_SIZE, DEFAULT_INDEX_TYPE, FAISS_SHARDS, FAISS_SHARD_MIN_VECTORS, CHUNK_STRATEGY,
+                          INGEST_WORKERS, INGEST_PIPELINE_MIN_BYTES)
+from utils.chunker import iter_chunks, iter_chunk_documents
+from utils.id_generator import get_id_allocator
+from utils.ingest_pipeline import IngestPipeline, can_embed_in_workers
+from utils.logger import get_logger
+from utils.metrics import metrics
+from utils.embedder import get_domain_embedder
+from utils.metadata import get_metadata_file_path, load_domain_metadata, update_domain_metadata
 
-def split_text_into_chunks(text, chunk_size=500, overlap=50):
+logger = get_logger(__name__)
+metrics.describe("rag_chunking_seconds", "Latency of chunking one document (one document group in the ingestion pipeline).")
+metrics.describe("rag_chunks_ingested", "Chunks written to FAISS and the docstore.")
+
+def split_text_into_chunks(text, chunk_size=500, overlap=50, strategy=CHUNK_STRATEGY):
     """
     Split text into chunks of specified size with overlap.
 
     Args:
         text (str): The text to split.
-        chunk_size (int): The size of each chunk in words.
+        chunk_size (int): The size of each chunk in words (tokens for the 'token' strategy).
         overlap (int): The number of overlapping words between chunks.
+        strategy (str): The chunking strategy, see utils.chunker.iter_chunks.
 
     Returns:
         list: A list of text chunks.
     """
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i + chunk_size])
-        chunks.append(chunk)
-    return chunks
+    return [chunk for _, _, chunk in iter_chunks(text, chunk_size, overlap, strategy)]
+
+def flush_chunk_batch(es, faiss_index, batch, model_name, index_name, embedder, docstore=None):
+    """
+    Write a batch of chunk documents to Elasticsearch, the chunk docstore and FAISS.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client, or None to write to FAISS only.
+        faiss_index (faiss.Index): The FAISS index to add the embeddings to.
+        batch (list): The chunk documents to write.
+        model_name (str): The model name.
+        index_name (str): The Elasticsearch index name.
+        embedder (Embedder): The embedder used for the whole batch.
+        docstore (ChunkDocstore): The chunk docstore, written before FAISS so every
+            FAISS hit can be resolved.
+
+    Returns:
+        int: The number of chunks written.
+
+    Raises:
+        BulkIndexError: If Elasticsearch rejects chunks of the batch; nothing is
+            written to the docstore or FAISS then.
+    """
+    if not batch:
+        return 0
+    embeddings = embed_with_cache(embedder, [chunk['data'] for chunk in batch])
+    for chunk in batch:
+        chunk['model'] = model_name
+    if es is not None:
+        bulk_save_to_elasticsearch(es, batch, model_name, index_name)
+    if docstore is not None:
+        docstore.put_many(batch)
+    save_batch_to_faiss(faiss_index, [get_chunk_faiss_id(chunk) for chunk in batch], embeddings)
+    metrics.increment("rag_chunks_ingested", len(batch))
+    return len(batch)
+
+def apply_deletes(es, faiss_index, docstore, index_name, unique_ids):
+    """
+    Delete documents from Elasticsearch and the chunk docstore, leaving tombstones for their FAISS vectors.
+
+    The vectors stay in FAISS, filtered out of search results by the tombstones,
+    until the index is compacted.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client, or None when replaying into FAISS only.
+        faiss_index (faiss.Index): The FAISS index (unchanged).
+        docstore (ChunkDocstore): The chunk docstore.
+        index_name (str): The Elasticsearch index name.
+        unique_ids (list): The IDs of the deleted documents.
+    """
+    if es is not None:
+        delete_documents_by_unique_ids(es, index_name, unique_ids)
+    for unique_id in unique_ids:
+        docstore.delete_document(unique_id)
+
+def ingest_documents(es, faiss_index, documents, domain_name, model_name, chunk_size=500, overlap=50, batch_size=INGEST_BATCH_SIZE, embedder=None):
+    """
+    Chunk documents and write them to Elasticsearch, the chunk docstore and FAISS in batches.
+
+    Documents are chunked as a stream (see utils.chunker.iter_chunks); each chunk
+    records its character offset and length in the document. Chunks from
+    consecutive documents are gathered until batch_size is reached and then
+    written with one Elasticsearch _bulk request and one FAISS add_with_ids.
+    Each chunk is added to FAISS under its own ID (see storage.docstore.chunk_faiss_id).
+    Documents keep the unique_id they were stored with; documents without one
+    are assigned one, which is set on the document in place.
+
+    Delete records ({"op": "delete", "unique_id": ...}) are applied in log order.
+    A document re-added after a delete (an update) first has its old vectors
+    removed from FAISS, so the reused chunk IDs are not shadowed by them.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client, or None to write to FAISS only
+            (used to replay documents that are already in Elasticsearch).
+        faiss_index (faiss.Index): The FAISS index to add the embeddings to.
+        documents (iterable): The documents to ingest. Each must contain 'data' and 'domain' fields.
+        domain_name (str): The domain name.
+        model_name (str): The model name.
+        chunk_size (int): The size of each chunk in words.
+        overlap (int): The number of overlapping words between chunks.
+        batch_size (int): The number of chunks written per batch.
+        embedder (Embedder): The embedder to use. Defaults to the one recorded for the domain.
+
+    Returns:
+        int: The number of chunks ingested.
+    """
+    index_name = f"{domain_name}_{model_name}".lower()
+    if es is not None:
+        ensure_index(es, index_name)
+    if embedder is None:
+        embedder = get_domain_embedder(domain_name, model_name, faiss_index.d)
+    docstore = get_docstore(domain_name, model_name)
+
+    batch = []
+    deletes = []
+    ingested = 0
+    for document in documents:
+        if document.get('op') == 'delete':
+            # Write earlier chunks first, so a delete never precedes the add it follows in the log
+            ingested += flush_chunk_batch(es, faiss_index, batch, model_name, index_name, embedder, docstore)
+            batch = []
+            deletes.append(str(document['unique_id']))
+            continue
+        if deletes:
+            apply_deletes(es, faiss_index, docstore, index_name, deletes)
+            deletes = []
+
+        unique_id = document.get('unique_id')
+        if unique_id is None:
+            if es is None:
+                # Its ID in Elasticsearch is unknown, so it cannot be replayed into FAISS
+                continue
+            unique_id = get_id_allocator(domain_name, es).next_id()
+            document['unique_id'] = unique_id
+        clear_readded_document(faiss_index, docstore, unique_id)
+        with metrics.span("rag_chunking_seconds"):
+            chunk_documents = list(iter_chunk_documents(document, chunk_size, overlap))
+        for chunk_document in chunk_documents:
+            batch.append(chunk_document)
+            if len(batch) >= batch_size:
+                ingested += flush_chunk_batch(es, faiss_index, batch, model_name, index_name, embedder, docstore)
+                batch = []
+
+    ingested += flush_chunk_batch(es, faiss_index, batch, model_name, index_name, embedder, docstore)
+    if deletes:
+        apply_deletes(es, faiss_index, docstore, index_name, deletes)
+    return ingested
+
+def get_domain_index_config(domain_name, model_name, index_type=None, index_params=None):
+    """
+    Return the FAISS index type and parameters recorded for a domain.
+
+    The given values (or DEFAULT_INDEX_TYPE) are recorded the first time a domain
+    is configured; afterwards the recorded choice is used.
+
+    Args:
+        domain_name (str): The domain name.
+        model_name (str): The model name.
+        index_type (str): The index type for a new domain, one of INDEX_TYPES.
+        index_params (dict): The index parameters for a new domain.
+
+    Returns:
+        tuple: The index type and the index parameters.
+
+    Raises:
+        ValueError: If the index type or the precision in index_params is unknown.
+    """
+    metadata_file_path = get_metadata_file_path(domain_name, model_name)
+    domain_key = f"{domain_name}_{model_name}"
+    entry = load_domain_metadata(metadata_file_path).get(domain_key, {})
+    if "index_type" not in entry:
+        index_type = index_type or DEFAULT_INDEX_TYPE
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Invalid index type '{index_type}'. Choose from {INDEX_TYPES}.")
+        get_vector_codec(index_params)
+        entry = update_domain_metadata(metadata_file_path, domain_key,
+                                       index_type=index_type, index_params=index_params or {})
+    return entry["index_type"], entry.get("index_params", {})
+
+def upgrade_domain_index(faiss_index, domain_name, model_name, index_type, index_params, sync_offset):
+    """
+    Upgrade a domain's FAISS index if it has outgrown a flat index, persisting the result.
+
+    Args:
+        sync_offset (int): The document log offset the index covers, recorded when it is saved.
+
+    Returns:
+        faiss.Index: The upgraded index, or the given index if no upgrade was needed.
+    """
+    upgraded = upgrade_index_if_needed(faiss_index, index_type, index_params)
+    if upgraded is not faiss_index:
+        inner = get_inner_index(upgraded)
+        update_domain_metadata(get_metadata_file_path(domain_name, model_name), f"{domain_name}_{model_name}",
+                               index_factory=get_index_factory_string(index_type, upgraded.d, upgraded.ntotal,
+                                                                      {**index_params, "nlist": inner.nlist}))
+        save_domain_index(upgraded, domain_name, model_name, sync_offset)
+    return upgraded
+
+def get_sync_checkpoint(domain_name, model_name):
+    """
+    Return the sync checkpoints recorded for a domain.
+
+    "sync_offset" is the document log offset up to which Elasticsearch and the
+    in-memory FAISS index have been written; "faiss_sync_offset" is the offset
+    covered by the FAISS index file on disk.
+
+    Returns:
+        tuple: The sync offset and the FAISS sync offset (None when not recorded).
+    """
+    entry = load_domain_metadata(get_metadata_file_path(domain_name, model_name)).get(f"{domain_name}_{model_name}", {})
+    return entry.get("sync_offset"), entry.get("faiss_sync_offset")
+
+def save_domain_index(faiss_index, domain_name, model_name, sync_offset):
+    """Save a domain's FAISS index to disk and record the log offset it covers."""
+    save_index_to_disk(faiss_index, domain_name, model_name)
+    update_domain_metadata(get_metadata_file_path(domain_name, model_name), f"{domain_name}_{model_name}",
+                           faiss_sync_offset=sync_offset)
 
-def load_domain_metadata(metadata_file_path):
-    """Load domain metadata from JSON file."""
-    if os.path.exists(metadata_file_path):
-        with open(metadata_file_path, 'r') as f:
-            return json.load(f)
-    return {}
+def timestamp_to_millis(timestamp):
+    """Convert a naive UTC ISO timestamp to whole epoch milliseconds, as Elasticsearch stores it."""
+    return int(datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp() * 1000)
 
-def save_domain_metadata(metadata_file_path, metadata):
-    """Save domain metadata to JSON file."""
-    with open(metadata_file_path, 'w') as f:
-        json.dump(metadata, f, indent=4)
+def document_key(document):
+    """Return the (timestamp, unique_id) key that orders a log record as get_latest_document_key does."""
+    return timestamp_to_millis(document['timestamp']), int(document['unique_id'])
 
-def sync_json_to_es_faiss(es, domain_name, model_name, embedding_size=128):
+def sync_log_range(es, faiss_index, domain_name, model_name, start_offset, end_offset=None, chunk_size=500, overlap=50,
+                   batch_size=INGEST_BATCH_SIZE, embedder=None, after=None, until=None, parallel=None):
     """
-    Sync all JSON documents into Elasticsearch and FAISS.
+    Ingest the documents of a document log range, checkpointing progress after each batch.
+
+    Documents are ingested in groups of batch_size. After each group "sync_offset"
+    is set to the offset just past it, so a restart resumes there. A group that
+    fails (e.g. Elasticsearch rejects some of its chunks) raises before its
+    checkpoint, and is ingested again by the next sync. With es=None the range is
+    replayed into FAISS only and no checkpoint is written.
+
+    Ranges of at least INGEST_PIPELINE_MIN_BYTES (a rebuild, or a large backlog)
+    go through the staged IngestPipeline, which chunks and embeds the groups on
+    every core while Elasticsearch and FAISS are written; smaller ones are
+    ingested on the calling thread.
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client, or None to write to FAISS only.
+        faiss_index (faiss.Index): The FAISS index to add the embeddings to.
+        domain_name (str): The domain name.
+        model_name (str): The model name.
+        start_offset (int): The log offset to start from.
+        end_offset (int): The log offset to stop at. Defaults to the end of the log.
+        chunk_size (int): The size of each chunk in words.
+        overlap (int): The number of overlapping words between chunks.
+        batch_size (int): The number of documents per checkpointed group.
+        embedder (Embedder): The embedder to use.
+        after (tuple): Skip documents whose (timestamp, unique_id) key is not greater
+            than this one; used when recovering without a checkpoint.
+        until (tuple): Skip documents whose (timestamp, unique_id) key is greater
+            than this one; used when rebuilding FAISS without a checkpoint.
+        parallel (bool): Whether to use the ingestion pipeline. Defaults to using it
+            for large ranges.
+
+    Returns:
+        tuple: The number of chunks ingested and the offset synced up to.
+    """
+    metadata_file_path = get_metadata_file_path(domain_name, model_name)
+    domain_key = f"{domain_name}_{model_name}"
+    ingested = 0
+    offset = start_offset
+    group = []
+
+    def checkpoint(synced_offset):
+        update_domain_metadata(metadata_file_path, domain_key, sync_offset=synced_offset)
+
+    if embedder is None:
+        embedder = get_domain_embedder(domain_name, model_name, faiss_index.d)
+    if parallel is None:
+        range_end = end_offset if end_offset is not None else get_document_log(domain_name).end_offset
+        parallel = INGEST_WORKERS > 1 and range_end - start_offset >= INGEST_PIPELINE_MIN_BYTES
+    pipeline = None
+    if parallel and can_embed_in_workers(embedder):
+        pipeline = IngestPipeline(es, faiss_index, domain_name, model_name, chunk_size, overlap, batch_size, embedder,
+                                  checkpoint if es is not None else None)
+
+    def flush_group():
+        if pipeline is not None:
+            pipeline.submit(group, offset)
+            return 0
+        try:
+            chunks = ingest_documents(es, faiss_index, group, domain_name, model_name, chunk_size, overlap, batch_size,
+                                      embedder)
+        except Exception:
+            # Earlier batches of the group may be in FAISS already; the group is ingested again from its start
+            discard_documents(faiss_index, [document['unique_id'] for document in group
+                                            if document.get('op') != 'delete' and document.get('unique_id') is not None])
+            raise
+        if es is not None:
+            checkpoint(offset)
+        return chunks
+
+    try:
+        for _, next_offset, document in iter_json_documents(domain_name, start_offset):
+            if end_offset is not None and next_offset > end_offset:
+                break
+            offset = next_offset
+            if after is not None and document_key(document) <= after:
+                continue
+            if until is not None and document_key(document) > until:
+                continue
+            group.append(document)
+            if len(group) >= batch_size:
+                ingested += flush_group()
+                group = []
+
+        if group or (es is not None and offset != start_offset):
+            ingested += flush_group()
+    finally:
+        if pipeline is not None:
+            ingested = pipeline.close()
+    return ingested, offset
+
+def sync_json_to_es_faiss(es, domain_name, model_name, embedding_size=128, batch_size=INGEST_BATCH_SIZE,
+                          index_type=None, index_params=None, chunk_size=500, overlap=50):
+    """
+    Sync the domain's document log into Elasticsearch and FAISS, resuming from the last checkpoint.
+
+    A restart reads "sync_offset" from the domain metadata and streams the log from
+    there, with no Elasticsearch scan. If the FAISS file on disk is older than the
+    checkpoint, the gap is replayed into FAISS only. If the checkpoint is missing,
+    the key of the latest document in Elasticsearch is recovered with two max
+    aggregations (see get_latest_document_key) and the log is resumed after it.
+    An index file that fails its checksum is rebuilt from the log. The index is only
+    written back to disk if something was added to it.
 
     Args:
         es (Elasticsearch): The Elasticsearch client.
         domain_name (str): The domain name.
         model_name (str): The model name.
         embedding_size (int): The size of the embeddings.
+        batch_size (int): The number of chunks written per bulk batch.
+        index_type (str): The FAISS index type for a new domain.
+        index_params (dict): The FAISS index parameters for a new domain.
+        chunk_size (int): The size of each chunk in words.
+        overlap (int): The number of overlapping words between chunks.
 
     Returns:
         tuple: The FAISS index, Elasticsearch client, and embedding size.
@@ -55,61 +366,91 @@ def sync_json_to_es_faiss(es, domain_name, model_name, embedding_size=128):
     index_name = f"{domain_name}_{model_name}".lower()
     faiss_index = None
 
-    # Ensure metadata file exists
-    metadata_file_path = os.path.join(DOMAIN_METADATA_PATH, f"{domain_name}_{model_name}.json")
-    if not os.path.exists(metadata_file_path):
-        with open(metadata_file_path, 'w') as f:
-            json.dump({}, f)
-
-    # Load or create domain metadata
-    metadata = load_domain_metadata(metadata_file_path)
-    domain_key = f"{domain_name}_{model_name}"
-    if domain_key in metadata:
-        embedding_size = metadata[domain_key].get("embedding_size", embedding_size)
-    else:
-        metadata[domain_key] = {"embedding_size": embedding_size}
-        save_domain_metadata(metadata_file_path, metadata)
+    # Load or create domain metadata, including the embedder chosen for the domain
+    embedder = get_domain_embedder(domain_name, model_name, embedding_size)
+    embedding_size = embedder.dimension
+    index_type, index_params = get_domain_index_config(domain_name, model_name, index_type, index_params)
+    sync_offset, faiss_sync_offset = get_sync_checkpoint(domain_name, model_name)
 
     # Check if FAISS index exists
-    faiss_file_path = os.path.join(FAISS_STORAGE_PATH, f"{domain_name}_{model_name}.index")
+    faiss_file_path = get_index_file_path(domain_name, model_name)
+    rebuild = False
     if os.path.exists(faiss_file_path):
-        faiss_index = load_index_from_disk(domain_name, model_name)
+        try:
+            faiss_index = load_index_from_disk(domain_name, model_name, index_params)
+        except CorruptIndexError as e:
+            logger.error(str(e))
+        entry = load_domain_metadata(get_metadata_file_path(domain_name, model_name)).get(f"{domain_name}_{model_name}", {})
+        if (faiss_index is None or entry.get("faiss_ids") != "chunk"
+                or (faiss_index.ntotal and not len(get_docstore(domain_name, model_name)))):
+            # Corrupt, built with one ID per document, or its docstore is gone: rebuild it from the log
+            logger.info("Rebuilding FAISS index from the document log", domain=domain_name, model=model_name)
+            faiss_index = create_faiss_index(embedding_size, index_type, index_params)
+            rebuild = True
     else:
         # Create a new FAISS index if it does not exist
-        faiss_index = faiss.IndexIDMap(faiss.IndexFlatL2(embedding_size))
-
-    # Check if Elasticsearch index exists
-    if es.indices.exists(index=index_name):
-        # Get all documents from Elasticsearch and sort by timestamp
-        es_documents = get_all_documents(es, index_name)
-        if es_documents:
-            es_documents.sort(key=lambda x: x['timestamp'], reverse=True)
-            last_es_timestamp = es_documents[0]['timestamp']
-        else:
-            last_es_timestamp = None
+        faiss_index = create_faiss_index(embedding_size, index_type, index_params)
+        faiss_sync_offset = 0
+        rebuild = True
+    update_domain_metadata(get_metadata_file_path(domain_name, model_name), f"{domain_name}_{model_name}", faiss_ids="chunk")
+
+    after = None
+    replayed = 0
+    if sync_offset is None:
+        # No checkpoint: skip what Elasticsearch already holds, up to its latest document,
+        # and assume the FAISS index on disk matches it.
+        after = get_latest_document_key(es, index_name)
+        sync_offset = 0
+        if rebuild and after is not None:
+            replayed, _ = sync_log_range(None, faiss_index, domain_name, model_name, 0, None,
+                                         chunk_size, overlap, batch_size, embedder, until=after)
     else:
-        last_es_timestamp = None
-
-    file_path = os.path.join(JSON_STORAGE_PATH, f"{domain_name}.json")
-    if not os.path.exists(file_path):
-        # Create an empty JSON file if it does not exist
-        with open(file_path, 'w') as f:
-            json.dump([], f)
-
-    with open(file_path, 'r') as f:
-        documents = json.load(f)
-        for document in documents:
-            if last_es_timestamp and document['timestamp'] <= last_es_timestamp:
-                continue
-            unique_id = generate_unique_id(es, index_name)
-            document['unique_id'] = unique_id
-            chunks = split_text_into_chunks(document['data'])
-            for chunk in chunks:
-                chunk_document = document.copy()
-                chunk_document['data'] = chunk
-                chunk_embeddings = generate_fake_embeddings(chunk)
-                save_to_elasticsearch(es, chunk_document, model_name, unique_id)
-                save_to_faiss(chunk_document, model_name, faiss_index, unique_id, chunk_embeddings)
+        if rebuild:
+            faiss_sync_offset = 0
+        if faiss_sync_offset is not None and faiss_sync_offset < sync_offset:
+            # The FAISS file was saved before the last checkpoint: replay the gap into FAISS only
+            replayed, _ = sync_log_range(None, faiss_index, domain_name, model_name, faiss_sync_offset, sync_offset,
+                                         chunk_size, overlap, batch_size, embedder)
 
-    save_index_to_disk(faiss_index, domain_name, model_name)
+    chunks, sync_offset = sync_log_range(es, faiss_index, domain_name, model_name, sync_offset, None,
+                                         chunk_size, overlap, batch_size, embedder, after)
+    if rebuild or replayed or chunks:
+        save_domain_index(faiss_index, domain_name, model_name, sync_offset)
+    elif faiss_sync_offset != sync_offset:
+        # Nothing was added to FAISS, so the file on disk already covers the new offset
+        update_domain_metadata(get_metadata_file_path(domain_name, model_name), f"{domain_name}_{model_name}",
+                               faiss_sync_offset=sync_offset)
+    faiss_index = upgrade_domain_index(faiss_index, domain_name, model_name, index_type, index_params, sync_offset)
     return faiss_index, es, embedding_size
+
+def load_read_only_index(domain_name, model_name):
+    """
+    Open a domain's saved FAISS index read-only through a memory map, without syncing.
+
+    The index serves what was saved; documents logged after the save are not
+    searchable until the domain is opened for writing again.
+
+    An index of at least FAISS_SHARD_MIN_VECTORS vectors is served by shard
+    processes when the domain is configured with more than one shard.
+
+    Args:
+        domain_name (str): The domain name.
+        model_name (str): The model name.
+
+    Returns:
+        tuple: The FAISS index (a ShardedIndex when sharded) and the document log offset it covers.
+
+    Raises:
+        ValueError: If the domain has no saved index.
+    """
+    if not os.path.exists(get_index_file_path(domain_name, model_name)):
+        raise ValueError(f"Domain {domain_name} with model {model_name} has no saved index to open read-only.")
+    index_type, index_params = get_domain_index_config(domain_name, model_name)
+    sync_offset, faiss_sync_offset = get_sync_checkpoint(domain_name, model_name)
+    faiss_index = load_index_from_disk(domain_name, model_name, index_params, mmap=True)
+    if faiss_sync_offset is not None and faiss_sync_offset < (sync_offset or 0):
+        logger.warning("Read-only FAISS index is behind the document log", domain=domain_name, model=model_name)
+    shards = index_params.get("shards", FAISS_SHARDS)
+    if shards > 1 and faiss_index.ntotal >= FAISS_SHARD_MIN_VECTORS:
+        faiss_index = open_sharded_index(domain_name, model_name, faiss_index, shards, index_type, index_params)
+    return faiss_index, faiss_sync_offset or 0
@@ -1,52 +1,146 @@
+import threading
 from elasticsearch import Elasticsearch
+from utils.config import ID_BLOCK_SIZE
+from utils.metadata import get_metadata_file_path, load_domain_metadata, update_domain_metadata
+from utils.logger import get_logger
 
-def generate_unique_id(es, index_name):
+logger = get_logger(__name__)
+
+def get_max_unique_id(es, index_name):
     """
-    Generate a unique sequential ID by checking the latest ID in Elasticsearch.
+    Get the numerically largest unique_id stored in an Elasticsearch index.
+
+    unique_id is a keyword field, so sorting on it is lexicographic ("9" > "10").
+    A max aggregation over the parsed value is used instead.
 
     Args:
         es (Elasticsearch): The Elasticsearch client.
-        index_name (str): The name of the index to check for the latest ID.
+        index_name (str): The name of the index to check.
 
     Returns:
-        str: A unique sequential ID.
+        int: The largest ID, or 0 if the index is empty or missing.
     """
-    # Ensure the index has the correct mapping
-    if not es.indices.exists(index=index_name):
-        es.indices.create(index=index_name, body={
-            "mappings": {
-                "properties": {
-                    "unique_id": {"type": "keyword"},
-                    "timestamp": {"type": "date"},
-                    "data": {"type": "text"},
-                    "model": {"type": "keyword"},
-                    "domain": {"type": "keyword"}
-                }
-            }
-        })
-    
-    # Get the latest ID from Elasticsearch
     try:
+        if not es.indices.exists(index=index_name):
+            return 0
         response = es.search(
             index=index_name,
             body={
-                "query": {
-                    "match_all": {}
-                },
-                "sort": [
-                    {"unique_id": {"order": "desc"}}
-                ],
-                "size": 1
+                "size": 0,
+                "aggs": {
+                    "max_unique_id": {
+                        "max": {
+                            "script": {"source": "Long.parseLong(doc['unique_id'].value)"}
+                        }
+                    }
+                }
             }
         )
-        hits = response['hits']['hits']
-        if hits:
-            latest_id = int(hits[0]['_source']['unique_id'])
-            new_id = str(latest_id + 1)
-        else:
-            new_id = "1"
+        value = response['aggregations']['max_unique_id']['value']
+        return int(value) if value is not None else 0
     except Exception as e:
-        print(f"Failed to retrieve the latest ID: {e}")
-        new_id = "1"
-    
-    return new_id
\ No newline at end of file
+        logger.warning("Failed to retrieve the latest ID", index=index_name, error=e)
+        return 0
+
+def generate_unique_id(es, index_name):
+    """
+    Generate a unique sequential ID by checking the latest ID in Elasticsearch.
+
+    This queries Elasticsearch on every call; ingestion uses the per-domain
+    IDAllocator instead (see get_id_allocator).
+
+    Args:
+        es (Elasticsearch): The Elasticsearch client.
+        index_name (str): The name of the index to check for the latest ID.
+
+    Returns:
+        str: A unique sequential ID.
+    """
+    # Imported here because storage.elastic_storage imports this module
+    from storage.elastic_storage import ensure_index
+
+    # Ensure the index has the correct mapping
+    ensure_index(es, index_name)
+
+    return str(get_max_unique_id(es, index_name) + 1)
+
+class IDAllocator:
+    """
+    Monotonic, thread-safe ID allocator for one domain.
+
+    IDs are shared by all models of the domain, because documents are stored once
+    in the domain's document log with their unique_id. They are handed out from
+    blocks reserved in memory. Before a block is used its upper bound is persisted
+    as "id_high_water_mark" in the domain metadata, so a restarted process resumes
+    above every ID that may have been handed out.
+    """
+
+    def __init__(self, domain_name, es=None, block_size=ID_BLOCK_SIZE):
+        self.domain_name = domain_name
+        self.block_size = block_size
+        self.metadata_file_path = get_metadata_file_path(domain_name)
+        self.domain_key = domain_name
+        self._lock = threading.Lock()
+        self._next_id = self._recover_high_water_mark(es) + 1
+        self._reserved_until = self._next_id - 1
+
+    def _recover_high_water_mark(self, es):
+        """Return the highest ID that may already be in use."""
+        metadata = load_domain_metadata(self.metadata_file_path)
+        high_water_mark = metadata.get(self.domain_key, {}).get("id_high_water_mark")
+        if high_water_mark is not None:
+            return int(high_water_mark)
+        # No checkpoint yet (new domain or one created before the allocator existed):
+        # take the largest ID across the Elasticsearch indices of every model
+        if es is not None:
+            return get_max_unique_id(es, f"{self.domain_name}_*".lower())
+        return 0
+
+    def _reserve(self, count):
+        """Persist a new high-water mark covering at least count more IDs. Caller holds the lock."""
+        blocks = -(-count // self.block_size)
+        self._reserved_until += blocks * self.block_size
+        update_domain_metadata(self.metadata_file_path, self.domain_key, id_high_water_mark=self._reserved_until)
+
+    def allocate(self, count=1):
+        """
+        Allocate a contiguous range of IDs.
+
+        Args:
+            count (int): The number of IDs to allocate.
+
+        Returns:
+            list: The allocated IDs as strings, in increasing order.
+        """
+        with self._lock:
+            available = self._reserved_until - self._next_id + 1
+            if available < count:
+                self._reserve(count - available)
+            start = self._next_id
+            self._next_id += count
+        return [str(unique_id) for unique_id in range(start, start + count)]
+
+    def next_id(self):
+        """Allocate a single ID."""
+        return self.allocate(1)[0]
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+def get_id_allocator(domain_name, es=None):
+    """
+    Return the process-wide IDAllocator for a domain, creating it on first use.
+
+    Args:
+        domain_name (str): The domain name.
+        es (Elasticsearch): Used once to recover the high-water mark if the metadata has none.
+
+    Returns:
+        IDAllocator: The allocator for the domain.
+    """
+    with _allocators_lock:
+        allocator = _allocators.get(domain_name)
+        if allocator is None:
+            allocator = IDAllocator(domain_name, es)
+            _allocators[domain_name] = allocator
+        return allocator
@@ -0,0 +1,326 @@
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from storage.elastic_storage import bulk_save_to_elasticsearch, ensure_index, delete_documents_by_unique_ids
+from storage.faiss_storage import save_batch_to_faiss, clear_readded_document, discard_documents
+from storage.embedding_cache import EmbeddingCache, embed_missing, get_embedding_cache
+from storage.docstore import get_docstore, get_chunk_faiss_id
+from utils.config import (INGEST_BATCH_SIZE, INGEST_WORKERS, INGEST_QUEUE_DEPTH, CHUNK_STRATEGY,
+                          EMBEDDING_CACHE_ENABLED)
+from utils.chunker import iter_chunk_documents
+from utils.embedder import get_embedder, get_domain_embedder, EMBEDDERS
+from utils.id_generator import get_id_allocator
+from utils.metrics import metrics
+
+# Workers are spawned, not forked: forking a process with running FAISS/OpenMP threads can deadlock
+_context = multiprocessing.get_context("spawn")
+_pool = None
+_pool_lock = threading.Lock()
+
+# Read-only embedding caches opened by a worker process, per (embedder_id, directory)
+_worker_caches = {}
+
+def get_ingest_pool():
+    """Return the process pool shared by ingestion pipelines, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=_context)
+        return _pool
+
+def shutdown_ingest_pool():
+    """Stop the worker processes of the ingestion pool, if it was started."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _discard_broken_pool(pool):
+    """Drop a pool whose worker died, so the next pipeline starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+def can_embed_in_workers(embedder):
+    """Return True if worker processes can recreate an embedder by its registered name."""
+    return type(embedder) is EMBEDDERS.get(embedder.name)
+
+def _chunk_and_embed(documents, chunk_size, overlap, strategy, embedder_name, dimension, cache_directory):
+    """
+    Chunk a group of documents and embed the chunks. Runs in a worker process.
+
+    Vectors are looked up in a read-only view of the embedding cache; the new ones
+    are returned for the main process to store.
+
+    Returns:
+        tuple: The chunk documents, their float32 embeddings, the digests and
+        vectors missing from the cache, and the seconds spent chunking and embedding
+        (the worker's own metrics are not visible to the main process).
+    """
+    embedder = get_embedder(embedder_name, dimension)
+    start = time.perf_counter()
+    chunks = [chunk for document in documents for chunk in iter_chunk_documents(document, chunk_size, overlap, strategy)]
+    texts = [chunk['data'] for chunk in chunks]
+    chunked = time.perf_counter()
+    if cache_directory is None or not texts:
+        embeddings = embedder.embed_batch(texts)
+        return chunks, embeddings, [], None, (chunked - start, time.perf_counter() - chunked, len(texts))
+
+    key = (embedder.embedder_id, cache_directory)
+    cache = _worker_caches.get(key)
+    if cache is None:
+        cache = EmbeddingCache(embedder.embedder_id, dimension, cache_directory, read_only=True)
+        _worker_caches[key] = cache
+    else:
+        cache.refresh()
+    embeddings, digests, vectors = embed_missing(embedder, texts, cache)
+    return chunks, embeddings, digests, vectors, (chunked - start, time.perf_counter() - chunked, len(digests))
+
+class IngestPipeline:
+    """
+    Staged ingestion of document groups into Elasticsearch, the chunk docstore and FAISS.
+
+    The caller is the reader stage: it submits groups of logged documents in log
+    order, and each group is chunked and embedded by a process in the shared
+    ingestion pool. A dispatcher thread collects the results in submission order
+    and hands them to two writer threads, one making Elasticsearch _bulk and
+    delete requests and one writing the docstore and FAISS, so Elasticsearch
+    network time overlaps with chunking, embedding and FAISS adds. The stages are
+    connected by bounded queues: once queue_depth groups are in flight, submit
+    blocks until the writers catch up.
+
+    After a group is written by both writers, checkpoint is called with its log
+    offset. A failure in any stage stops the pipeline; the error is raised by the
+    next submit or by close, after the vectors the FAISS writer added past the
+    last checkpoint are removed again, since those groups are ingested again.
+    """
+
+    def __init__(self, es, faiss_index, domain_name, model_name, chunk_size=500, overlap=50,
+                 batch_size=INGEST_BATCH_SIZE, embedder=None, checkpoint=None, queue_depth=INGEST_QUEUE_DEPTH):
+        """
+        Args:
+            es (Elasticsearch): The Elasticsearch client, or None to write to FAISS only.
+            faiss_index (faiss.Index): The FAISS index to add the embeddings to. Only the
+                FAISS writer thread touches it until close returns.
+            domain_name (str): The domain name.
+            model_name (str): The model name.
+            chunk_size (int): The size of each chunk in words.
+            overlap (int): The number of overlapping words between chunks.
+            batch_size (int): The number of chunks written per batch.
+            embedder (Embedder): The embedder to use. Defaults to the one recorded for the domain.
+            checkpoint (callable): Called with the offset of each submitted group once it is written.
+            queue_depth (int): The number of groups each stage may hold before the previous one blocks.
+        """
+        self.es = es
+        self.faiss_index = faiss_index
+        self.domain_name = domain_name
+        self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.embedder = embedder or get_domain_embedder(domain_name, model_name, faiss_index.d)
+        self.checkpoint = checkpoint
+        self.index_name = f"{domain_name}_{model_name}".lower()
+        self.docstore = get_docstore(domain_name, model_name)
+        self.cache = get_embedding_cache(self.embedder) if EMBEDDING_CACHE_ENABLED else None
+        if es is not None:
+            ensure_index(es, self.index_name)
+
+        self.ingested = 0
+        self._errors = []
+        self._closed = False
+        self._pool = get_ingest_pool()
+        self._pending = queue.Queue(maxsize=queue_depth)
+        self._writer_queues = [queue.Queue(maxsize=queue_depth)]
+        writers = [("ingest-faiss-writer", self._faiss_writer)]
+        if es is not None:
+            self._writer_queues.append(queue.Queue(maxsize=queue_depth))
+            writers.append(("ingest-es-writer", self._es_writer))
+        self._checkpoint_lock = threading.Lock()
+        self._checkpoint_counts = {}
+        self._last_offset = None
+        # unique_ids written to FAISS per group, with None where the FAISS writer passed a checkpoint;
+        # entries up to the oldest None are dropped once that checkpoint is reached by every writer
+        self._uncheckpointed = []
+        self._threads = [threading.Thread(target=self._dispatch, name="ingest-dispatcher", daemon=True)]
+        for (name, write), items in zip(writers, self._writer_queues):
+            self._threads.append(threading.Thread(target=self._run_writer, args=(write, items), name=name, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, documents, offset=None):
+        """
+        Queue a group of documents, blocking while the pipeline is full.
+
+        Documents without a unique_id are assigned one, in place (or skipped when
+        writing to FAISS only, since their Elasticsearch ID is unknown). Delete
+        records ({"op": "delete", "unique_id": ...}) are applied in log order.
+
+        Args:
+            documents (list): The documents of the group, in log order.
+            offset (int): The log offset just past the group, passed to checkpoint
+                once the group is written. None for no checkpoint. An offset already
+                queued is not queued again.
+
+        Raises:
+            Exception: The error of a failed stage.
+        """
+        self._raise_error()
+        run = []
+        deletes = []
+        for document in documents:
+            if document.get('op') == 'delete':
+                if run:
+                    self._submit_run(run)
+                    run = []
+                deletes.append(str(document['unique_id']))
+                continue
+            if deletes:
+                self._pending.put(("delete", deletes))
+                deletes = []
+            if document.get('unique_id') is None:
+                if self.es is None:
+                    continue
+                document['unique_id'] = get_id_allocator(self.domain_name, self.es).next_id()
+            run.append(document)
+        if run:
+            self._submit_run(run)
+        if deletes:
+            self._pending.put(("delete", deletes))
+        # Writers count their arrivals per offset, so each offset is queued once
+        if offset is not None and self.checkpoint is not None and offset != self._last_offset:
+            self._pending.put(("checkpoint", offset))
+            self._last_offset = offset
+
+    def _submit_run(self, documents):
+        """Send consecutive documents to a worker process."""
+        try:
+            future = self._pool.submit(_chunk_and_embed, documents, self.chunk_size, self.overlap, CHUNK_STRATEGY,
+                                       self.embedder.name, self.embedder.dimension,
+                                       self.cache.directory if self.cache is not None else None)
+        except BrokenProcessPool:
+            _discard_broken_pool(self._pool)
+            raise
+        self._pending.put(("documents", ([document['unique_id'] for document in documents], future)))
+
+    def close(self):
+        """
+        Wait for every submitted group to be written and stop the pipeline threads.
+
+        Returns:
+            int: The number of chunks ingested.
+
+        Raises:
+            Exception: The error of a failed stage.
+        """
+        if not self._closed:
+            self._closed = True
+            self._pending.put(None)
+            for thread in self._threads:
+                thread.join()
+            if self._errors:
+                discard_documents(self.faiss_index, [unique_id for unique_ids in self._uncheckpointed
+                                                     if unique_ids is not None for unique_id in unique_ids])
+        self._raise_error()
+        return self.ingested
+
+    def _raise_error(self):
+        if self._errors:
+            raise self._errors[0]
+
+    def _dispatch(self):
+        """Collect worker results in submission order and pass them on to every writer."""
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            kind, payload = item
+            if kind == "documents":
+                unique_ids, future = payload
+                if self._errors:
+                    future.cancel()
+                    continue
+                try:
+                    chunks, embeddings, digests, vectors, (chunk_seconds, embed_seconds, embedded) = future.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        _discard_broken_pool(self._pool)
+                    self._errors.append(e)
+                    continue
+                metrics.observe("rag_chunking_seconds", chunk_seconds)
+                if embedded:
+                    metrics.observe("rag_embedding_seconds", embed_seconds, source="documents")
+                    metrics.increment("rag_embedded_texts", embedded, source="documents")
+                for chunk in chunks:
+                    chunk['model'] = self.model_name
+                item = ("documents", (unique_ids, chunks, embeddings, digests, vectors))
+            for items in self._writer_queues:
+                items.put(item)
+        for items in self._writer_queues:
+            items.put(None)
+
+    def _run_writer(self, write, items):
+        """Apply queued items in order. After a failure anywhere, keep draining so no stage blocks."""
+        while True:
+            item = items.get()
+            if item is None:
+                break
+            if self._errors:
+                continue
+            kind, payload = item
+            try:
+                if kind == "checkpoint":
+                    self._reach_checkpoint(payload, write)
+                else:
+                    write(kind, payload)
+            except Exception as e:
+                self._errors.append(e)
+
+    def _reach_checkpoint(self, offset, write):
+        """Record that a writer is past offset, calling checkpoint once every writer is."""
+        with self._checkpoint_lock:
+            if write == self._faiss_writer:
+                self._uncheckpointed.append(None)
+            count = self._checkpoint_counts.pop(offset, 0) + 1
+            if count < len(self._writer_queues):
+                self._checkpoint_counts[offset] = count
+            else:
+                self.checkpoint(offset)
+                del self._uncheckpointed[:self._uncheckpointed.index(None) + 1]
+
+    def _es_writer(self, kind, payload):
+        if kind == "delete":
+            delete_documents_by_unique_ids(self.es, self.index_name, payload)
+            return
+        _, chunks, _, _, _ = payload
+        for start in range(0, len(chunks), self.batch_size):
+            # Copies, as the bulk request sets fields on the documents the FAISS writer is storing
+            batch = [chunk.copy() for chunk in chunks[start:start + self.batch_size]]
+            bulk_save_to_elasticsearch(self.es, batch, self.model_name, self.index_name)
+
+    def _faiss_writer(self, kind, payload):
+        if kind == "delete":
+            for unique_id in payload:
+                self.docstore.delete_document(unique_id)
+            return
+        unique_ids, chunks, embeddings, digests, vectors = payload
+        for unique_id in unique_ids:
+            clear_readded_document(self.faiss_index, self.docstore, unique_id)
+        if self.checkpoint is not None:
+            with self._checkpoint_lock:
+                self._uncheckpointed.append(unique_ids)
+        for start in range(0, len(chunks), self.batch_size):
+            batch = chunks[start:start + self.batch_size]
+            self.docstore.put_many(batch)
+            save_batch_to_faiss(self.faiss_index, [get_chunk_faiss_id(chunk) for chunk in batch],
+                                embeddings[start:start + self.batch_size])
+        if digests and self.cache is not None:
+            self.cache.put_many(digests, vectors)
+        metrics.increment("rag_chunks_ingested", len(chunks))
+        self.ingested += len(chunks)
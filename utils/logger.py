@@ -0,0 +1,145 @@
+import itertools
+import json
+import logging
+import sys
+import threading
+from datetime import datetime, timezone
+from utils.config import LOG_LEVEL, LOG_FORMAT
+
+ROOT_LOGGER_NAME = "rag"
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+def _format_value(value):
+    """Format a field value for the text format, quoting strings that contain whitespace."""
+    text = str(value)
+    if not text or any(character.isspace() for character in text):
+        return json.dumps(text)
+    return text
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats a record as "time level logger message key=value ..." or, with
+    fmt='json', as one JSON object per line.
+    """
+
+    def __init__(self, fmt="text"):
+        super().__init__()
+        self.fmt = fmt
+
+    def format(self, record):
+        timestamp = datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds')
+        fields = getattr(record, 'fields', {})
+        if self.fmt == "json":
+            entry = {"time": timestamp, "level": record.levelname, "logger": record.name,
+                     "message": record.getMessage(), **fields}
+            if record.exc_info:
+                entry["exception"] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        line = f"{timestamp} {record.levelname} {record.name} {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={_format_value(value)}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+_configure_lock = threading.Lock()
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """
+    Set the level of the package loggers and write them to a stream (stdout by default).
+
+    Called on first use of get_logger; an application that configures the "rag"
+    logger itself can call it again or attach its own handlers.
+
+    Args:
+        level (str | int): The minimum level, e.g. "INFO" or logging.DEBUG.
+        fmt (str): 'text' or 'json'.
+        stream: The stream to write to.
+    """
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    with _configure_lock:
+        for handler in list(root.handlers):
+            if getattr(handler, '_rag_handler', False):
+                root.removeHandler(handler)
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(StructuredFormatter(fmt))
+        handler._rag_handler = True
+        root.addHandler(handler)
+        root.setLevel(level)
+        root.propagate = False
+
+class StructuredLogger:
+    """
+    Leveled logger with key=value fields, lazy formatting and sampling.
+
+    Nothing is formatted unless the level is enabled: the message is %-formatted
+    with its args by the logging module, and field values that are callables are
+    only called for records that are emitted. Hot paths pass every=N to emit
+    only one in N records of a message (the record carries sampled=N).
+    """
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+        self._counters = {}
+        self._counters_lock = threading.Lock()
+
+    def is_enabled_for(self, level):
+        """Return True if records of the level would be emitted."""
+        return self._logger.isEnabledFor(level)
+
+    def _sampled_out(self, message, every):
+        counter = self._counters.get(message)
+        if counter is None:
+            with self._counters_lock:
+                counter = self._counters.setdefault(message, itertools.count())
+        return next(counter) % every != 0
+
+    def log(self, level, message, *args, every=None, exc_info=None, **fields):
+        """
+        Log a message with structured fields.
+
+        Args:
+            level (int): The level, e.g. logger.INFO.
+            message (str): The message, %-formatted with args when emitted.
+            every (int): Emit only one in every records of this message.
+            exc_info: Exception information to attach, as for logging.
+            **fields: Key/value context. Callable values are called when the record is emitted.
+        """
+        if not self._logger.isEnabledFor(level):
+            return
+        if every is not None and every > 1:
+            if self._sampled_out(message, every):
+                return
+            fields["sampled"] = every
+        fields = {key: value() if callable(value) else value for key, value in fields.items()}
+        self._logger.log(level, message, *args, exc_info=exc_info, extra={"fields": fields}, stacklevel=3)
+
+    def debug(self, message, *args, **fields):
+        self.log(DEBUG, message, *args, **fields)
+
+    def info(self, message, *args, **fields):
+        self.log(INFO, message, *args, **fields)
+
+    def warning(self, message, *args, **fields):
+        self.log(WARNING, message, *args, **fields)
+
+    def error(self, message, *args, **fields):
+        self.log(ERROR, message, *args, **fields)
+
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+def get_logger(name):
+    """Return the shared StructuredLogger for a module, configuring output on first use."""
+    with _loggers_lock:
+        if not _loggers and not logging.getLogger(ROOT_LOGGER_NAME).handlers:
+            configure_logging()
+        logger = _loggers.get(name)
+        if logger is None:
+            logger = StructuredLogger(name)
+            _loggers[name] = logger
+        return logger
@@ -0,0 +1,54 @@
+import json
+import os
+import threading
+from utils.config import DOMAIN_METADATA_PATH
+
+# Serialises read-modify-write cycles on the metadata files within this process
+_metadata_lock = threading.RLock()
+
+def get_metadata_file_path(domain_name, model_name=None):
+    """
+    Return the path of the metadata file for a domain-model pair.
+
+    Without a model name, return the path of the file for state shared by all
+    models of a domain (such as the ID allocator).
+    """
+    if model_name is None:
+        return os.path.join(DOMAIN_METADATA_PATH, f"{domain_name}.domain.json")
+    return os.path.join(DOMAIN_METADATA_PATH, f"{domain_name}_{model_name}.json")
+
+def load_domain_metadata(metadata_file_path):
+    """Load domain metadata from JSON file."""
+    if os.path.exists(metadata_file_path):
+        with open(metadata_file_path, 'r') as f:
+            return json.load(f)
+    return {}
+
+def save_domain_metadata(metadata_file_path, metadata):
+    """Save domain metadata to JSON file, replacing it atomically."""
+    os.makedirs(os.path.dirname(metadata_file_path), exist_ok=True)
+    temp_path = f"{metadata_file_path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(metadata, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, metadata_file_path)
+
+def update_domain_metadata(metadata_file_path, domain_key, **fields):
+    """
+    Update fields of one domain entry in a metadata file.
+
+    Args:
+        metadata_file_path (str): The path of the metadata file.
+        domain_key (str): The domain key inside the metadata file.
+        **fields: The fields to set on the domain entry.
+
+    Returns:
+        dict: The updated domain entry.
+    """
+    with _metadata_lock:
+        metadata = load_domain_metadata(metadata_file_path)
+        entry = metadata.setdefault(domain_key, {})
+        entry.update(fields)
+        save_domain_metadata(metadata_file_path, metadata)
+        return dict(entry)
@@ -0,0 +1,236 @@
+import bisect
+import functools
+import inspect
+import math
+import threading
+import time
+from utils.config import METRICS_ENABLED
+
+# Upper bounds, in seconds, of the latency histograms recorded by spans
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """
+    Thread-safe histogram with fixed bucket upper bounds.
+
+    Counts are kept per bucket (the last bucket is unbounded), together with the
+    number and sum of observations, which is what Prometheus-style histograms expose.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Record one observation."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self):
+        """Return the count, sum, mean and cumulative count per bucket upper bound."""
+        with self._lock:
+            counts = list(self._counts)
+            count = self._count
+            total = self._sum
+        cumulative = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "buckets": cumulative,
+        }
+
+class Counter:
+    """Thread-safe monotonically increasing counter."""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def increment(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+class _NoopSpan:
+    """Span returned while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+class _Span:
+    """Times a block into a latency histogram, counting blocks that raise."""
+
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            self.registry.increment(f"{self.name}_errors", **self.labels)
+        return False
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+def _format_number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """
+    Process-wide latency histograms, counters and gauge collectors, exposed in the
+    Prometheus text format.
+
+    Hot paths record through span(), timed() or increment(). While the registry
+    is disabled these return or do nothing after one attribute check, so
+    instrumentation can stay in place. Gauges (index sizes, cache hit rates) are
+    read from collectors only when the metrics are rendered.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._descriptions = {}  # name -> help text
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}  # (name, labels) -> Counter
+        self._collectors = {}
+
+    def describe(self, name, help_text):
+        """Set the HELP text of a metric."""
+        self._descriptions[name] = help_text
+
+    def _series(self, series, name, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        metric = series.get(key)
+        if metric is None:
+            with self._lock:
+                metric = series.get(key)
+                if metric is None:
+                    metric = factory()
+                    series[key] = metric
+        return metric
+
+    def observe(self, name, value, **labels):
+        """Record a value (seconds, for latency metrics) in a histogram."""
+        if self.enabled:
+            self._series(self._histograms, name, labels, lambda: Histogram(LATENCY_BUCKETS)).observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        """Add to a counter. Its name gets a _total suffix when rendered."""
+        if self.enabled:
+            self._series(self._counters, name, labels, Counter).increment(amount)
+
+    def span(self, name, **labels):
+        """
+        Return a context manager that records the duration of its block in a histogram.
+
+        Blocks that raise are also counted in {name}_errors.
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, labels)
+
+    def timed(self, name, **labels):
+        """Decorator that records every call of a function (or coroutine function) in a span."""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await func(*args, **kwargs)
+                    with _Span(self, name, labels):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, name, labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def register_collector(self, key, collect):
+        """
+        Register a function that reports metrics read at render time, replacing any registered under key.
+
+        collect() returns (name, type, help, samples) tuples. type is 'gauge' or
+        'counter' with samples of (labels dict, value), or 'histogram' with
+        samples of (labels dict, Histogram.snapshot()).
+        """
+        with self._lock:
+            self._collectors[key] = collect
+
+    def unregister_collector(self, key):
+        with self._lock:
+            self._collectors.pop(key, None)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        families = {}
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+            collectors = list(self._collectors.values())
+        for (name, labels), histogram in histograms:
+            families.setdefault(name, ["histogram", self._descriptions.get(name, ""), []])[2].append(
+                (labels, histogram.snapshot()))
+        for (name, labels), counter in counters:
+            families.setdefault(f"{name}_total", ["counter", self._descriptions.get(name, ""), []])[2].append(
+                (labels, counter.value))
+        for collect in collectors:
+            for name, kind, help_text, samples in collect():
+                family = families.setdefault(name, [kind, help_text, []])
+                family[2].extend((tuple(sorted(labels.items())), value) for labels, value in samples)
+
+        lines = []
+        for name in sorted(families):
+            kind, help_text, samples = families[name]
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(samples, key=lambda sample: sample[0]):
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+                    continue
+                for bound, count in value["buckets"]:
+                    bucket_labels = labels + (("le", bound if bound == "+Inf" else _format_number(float(bound))),)
+                    lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(float(value['sum']))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
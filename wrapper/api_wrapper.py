@@ -1,45 +1,42 @@
-from flask import Flask, request, jsonify
+import atexit
+import time
+from flask import Flask, Response, request, jsonify, g
 from rag_manager.manager import RAGManager
+from utils.metrics import metrics
+from wrapper.routes import ROUTES, handle_request
+
+# Flask front end. Routes, validation and errors live in routes.py, shared with the ASGI server.
 
 app = Flask(__name__)
 manager = RAGManager()
+atexit.register(manager.shutdown)
+
+metrics.describe("rag_http_request_seconds", "Latency of API requests, by route, method and status.")
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.observe("rag_http_request_seconds", time.perf_counter() - start,
+                        route=route, method=request.method, status=response.status_code)
+    return response
 
-@app.route('/add_domain', methods=['POST'])
-def add_domain():
-    data = request.json
-    domain_name = data.get('domain_name')
-    model_name = data.get('model_name')
-    if not domain_name or not model_name:
-        return jsonify({"error": "Domain name and model name are required"}), 400
-    manager.add_domain(domain_name, model_name)
-    return jsonify({"message": f"Domain {domain_name} with model {model_name} added."}), 200
-
-@app.route('/list_domains', methods=['GET'])
-def list_domains():
-    domains = manager.list_domains()
-    return jsonify(domains), 200
-
-@app.route('/add_data', methods=['POST'])
-def add_data():
-    data = request.json
-    domain_name = data.get('domain_name')
-    model_name = data.get('model_name')
-    document = data.get('document')
-    if not domain_name or not model_name or not document:
-        return jsonify({"error": "Domain name, model name, and document are required"}), 400
-    manager.add_data(domain_name, model_name, {"data": document})
-    return jsonify({"message": f"Data added to domain {domain_name} with model {model_name}."}), 200
-
-@app.route('/generate_prompt', methods=['POST'])
-def generate_prompt():
-    data = request.json
-    domain_name = data.get('domain_name')
-    model_name = data.get('model_name')
-    query = data.get('query')
-    mode = data.get('mode', 'hybrid')
-    if not domain_name or not model_name or not query:
-        return jsonify({"error": "Domain name, model name, and query are required"}), 400
-    prompt = manager.generate_prompt(domain_name, model_name, query, mode)
-    return jsonify({"prompt": prompt}), 200
+def call(method_name, *args, **kwargs):
+    """Run a manager method in the request thread."""
+    return getattr(manager, method_name)(*args, **kwargs)
 
+def dispatch():
+    payload, status = handle_request(request.path, request.method, request.get_data(), call)
+    if isinstance(payload, str):
+        return Response(payload, status=status, mimetype='text/plain; version=0.0.4')
+    return jsonify(payload), status
 
+for path in {path for path, _ in ROUTES}:
+    app.add_url_rule(path, endpoint=path, view_func=dispatch,
+                     methods=[method for route_path, method in ROUTES if route_path == path])
@@ -0,0 +1,84 @@
+import asyncio
+import functools
+import inspect
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from rag_manager.manager import RAGManager
+from storage.elastic_storage import close_async_elasticsearch_client
+from utils.config import ASGI_REQUEST_WORKERS
+from utils.metrics import metrics
+from wrapper.routes import ROUTES, handle_request
+
+# ASGI version of the Flask API in api_wrapper.py, serving the same routes from routes.py.
+# Handlers run on a pool of request threads. Searches are handed back to the event
+# loop, where they use the async Elasticsearch client and a bounded FAISS worker
+# pool; domain creation and ingestion run in the request thread.
+# Serve with: uvicorn wrapper.asgi_app:app  (or python main.py --asgi)
+
+manager = RAGManager()
+request_executor = ThreadPoolExecutor(max_workers=ASGI_REQUEST_WORKERS, thread_name_prefix="asgi-request")
+metrics.describe("rag_http_request_seconds", "Latency of API requests, by route, method and status.")
+
+def call(loop, method_name, *args, **kwargs):
+    """Run the manager method's _async coroutine on the event loop if it has one, otherwise the method in this thread."""
+    method = getattr(manager, f"{method_name}_async", None)
+    if inspect.iscoroutinefunction(method):
+        return asyncio.run_coroutine_threadsafe(method(*args, **kwargs), loop).result()
+    return getattr(manager, method_name)(*args, **kwargs)
+
+async def read_body(receive):
+    """Read the full request body from the ASGI receive channel."""
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+async def send_json(send, payload, status):
+    """Send a JSON response, or a plain text one for a str payload."""
+    if isinstance(payload, str):
+        body = payload.encode('utf-8')
+        content_type = b'text/plain; version=0.0.4'
+    else:
+        body = json.dumps(payload).encode('utf-8')
+        content_type = b'application/json'
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def lifespan(receive, send):
+    """Handle server startup and shutdown: save every loaded domain and close the async client on exit."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.to_thread(manager.shutdown)
+            request_executor.shutdown(wait=False)
+            await close_async_elasticsearch_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    start = time.perf_counter() if metrics.enabled else None
+    body = await read_body(receive)
+    loop = asyncio.get_running_loop()
+    payload, status = await loop.run_in_executor(request_executor, handle_request, scope['path'], scope['method'], body,
+                                                 functools.partial(call, loop))
+    await send_json(send, payload, status)
+    if start is not None:
+        route = scope['path'] if any(path == scope['path'] for path, _ in ROUTES) else "unmatched"
+        metrics.observe("rag_http_request_seconds", time.perf_counter() - start,
+                        route=route, method=scope['method'], status=status)
@@ -0,0 +1,185 @@
+import json
+from utils.config import FEDERATED_DOMAIN_TIMEOUT
+from utils.logger import get_logger
+
+# Request validation and dispatch shared by the Flask (api_wrapper.py) and ASGI
+# (asgi_app.py) front ends, so each route is written once. A handler takes the
+# request's JSON object and call, a function that runs a RAGManager method the
+# way the front end serves it: call("add_data", ...) runs the method directly
+# under Flask, and under ASGI, where handlers run on a request thread, runs its
+# _async coroutine on the event loop if it has one. Handlers return
+# (payload, status); a str payload is sent as text/plain.
+
+logger = get_logger(__name__)
+
+ROUTES = {}  # (path, method) -> handler
+
+def route(path, method):
+    """Register a handler for a path and HTTP method."""
+    def register(handler):
+        ROUTES[(path, method)] = handler
+        return handler
+    return register
+
+def get_k(data, default=5):
+    """
+    Return the request's "k" as a positive int.
+
+    Raises:
+        ValueError: If k is not an integer (JSON numbers like 3.0 and numeric strings
+            are accepted) or is smaller than 1.
+    """
+    k = data.get('k', default)
+    if isinstance(k, bool) or (isinstance(k, float) and not k.is_integer()):
+        raise ValueError("k must be a positive integer")
+    try:
+        k = int(k)
+    except (TypeError, ValueError):
+        raise ValueError("k must be a positive integer") from None
+    if k < 1:
+        raise ValueError("k must be a positive integer")
+    return k
+
+@route('/add_domain', 'POST')
+def add_domain(data, call):
+    domain_name = data.get('domain_name')
+    model_name = data.get('model_name')
+    index_type = data.get('index_type')
+    index_params = data.get('index_params')
+    read_only = data.get('read_only')
+    if not domain_name or not model_name:
+        return {"error": "Domain name and model name are required"}, 400
+    call("add_domain", domain_name, model_name, index_type=index_type, index_params=index_params,
+               read_only=read_only)
+    return {"message": f"Domain {domain_name} with model {model_name} added."}, 200
+
+@route('/list_domains', 'GET')
+def list_domains(data, call):
+    return call("list_domains"), 200
+
+@route('/add_data', 'POST')
+def add_data(data, call):
+    domain_name = data.get('domain_name')
+    model_name = data.get('model_name')
+    document = data.get('document')
+    if not domain_name or not model_name or not document:
+        return {"error": "Domain name, model name, and document are required"}, 400
+    call("add_data", domain_name, model_name, {"data": document})
+    return {"message": f"Data added to domain {domain_name} with model {model_name}."}, 200
+
+@route('/add_data_batch', 'POST')
+def add_data_batch(data, call):
+    domain_name = data.get('domain_name')
+    model_name = data.get('model_name')
+    documents = data.get('documents')
+    if not domain_name or not model_name or not documents or not isinstance(documents, list):
+        return {"error": "Domain name, model name, and a list of documents are required"}, 400
+    documents = [document if isinstance(document, dict) else {"data": document} for document in documents]
+    chunks = call("add_data_batch", domain_name, model_name, documents)
+    return {"message": f"{len(documents)} documents ({chunks} chunks) added to domain {domain_name} with model {model_name}."}, 200
+
+@route('/delete_document', 'POST')
+def delete_document(data, call):
+    domain_name = data.get('domain_name')
+    model_name = data.get('model_name')
+    unique_id = data.get('unique_id')
+    if not domain_name or not model_name or unique_id is None:
+        return {"error": "Domain name, model name, and unique_id are required"}, 400
+    if not call("delete_document", domain_name, model_name, unique_id):
+        return {"error": f"Document {unique_id} not found in domain {domain_name} with model {model_name}."}, 404
+    return {"message": f"Document {unique_id} deleted from domain {domain_name} with model {model_name}."}, 200
+
+@route('/update_document', 'POST')
+def update_document(data, call):
+    domain_name = data.get('domain_name')
+    model_name = data.get('model_name')
+    unique_id = data.get('unique_id')
+    document = data.get('document')
+    if not domain_name or not model_name or unique_id is None or not document:
+        return {"error": "Domain name, model name, unique_id, and document are required"}, 400
+    if not call("update_document", domain_name, model_name, unique_id, {"data": document}):
+        return {"error": f"Document {unique_id} not found in domain {domain_name} with model {model_name}."}, 404
+    return {"message": f"Document {unique_id} updated in domain {domain_name} with model {model_name}."}, 200
+
+@route('/generate_prompt', 'POST')
+def generate_prompt(data, call):
+    domain_name = data.get('domain_name')
+    model_name = data.get('model_name')
+    query = data.get('query')
+    mode = data.get('mode', 'hybrid')
+    if not domain_name or not model_name or not query:
+        return {"error": "Domain name, model name, and query are required"}, 400
+    k = get_k(data)
+    return {"prompt": call("generate_prompt", domain_name, model_name, query, mode, k)}, 200
+
+@route('/generate_prompt_batch', 'POST')
+def generate_prompt_batch(data, call):
+    domain_name = data.get('domain_name')
+    model_name = data.get('model_name')
+    queries = data.get('queries')
+    mode = data.get('mode', 'hybrid')
+    if not domain_name or not model_name or not queries or not isinstance(queries, list):
+        return {"error": "Domain name, model name, and a list of queries are required"}, 400
+    k = get_k(data)
+    return {"prompts": call("generate_prompt_batch", domain_name, model_name, queries, mode, k)}, 200
+
+@route('/federated_search', 'POST')
+def federated_search(data, call):
+    domains = data.get('domains')
+    query = data.get('query')
+    model_name = data.get('model_name')
+    mode = data.get('mode', 'hybrid')
+    timeout = data.get('timeout', FEDERATED_DOMAIN_TIMEOUT)
+    if not domains or not isinstance(domains, (str, list)) or not query:
+        return {"error": "A list of domains (or a glob) and a query are required"}, 400
+    k = get_k(data)
+    return call("federated_search", domains, query, mode, k, model_name, timeout), 200
+
+@route('/cache_stats', 'GET')
+def cache_stats(data, call):
+    return call("cache_stats"), 200
+
+@route('/coalescer_stats', 'GET')
+def coalescer_stats(data, call):
+    return call("coalescer_stats"), 200
+
+@route('/elasticsearch_stats', 'GET')
+def elasticsearch_stats(data, call):
+    return call("elasticsearch_stats"), 200
+
+@route('/metrics', 'GET')
+def prometheus_metrics(data, call):
+    return call("metrics_text"), 200
+
+def handle_request(path, method, body, call):
+    """
+    Parse a request body, validate it and run the route's handler.
+
+    Args:
+        path (str): The request path.
+        method (str): The HTTP method.
+        body (bytes): The raw request body; an empty body is an empty JSON object.
+        call (callable): Function called with (manager method name, *args, **kwargs).
+
+    Returns:
+        tuple: (payload, status). A ValueError from the manager is a 400 with its message;
+        any other exception is logged and returned as a JSON 500.
+    """
+    handler = ROUTES.get((path, method))
+    if handler is None:
+        if any(route_path == path for route_path, _ in ROUTES):
+            return {"error": "Method not allowed"}, 405
+        return {"error": "Not found"}, 404
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        return {"error": "Request body must be JSON"}, 400
+    if not isinstance(data, dict):
+        return {"error": "Request body must be a JSON object"}, 400
+    try:
+        return handler(data, call)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except Exception as e:
+        logger.error("Request failed", path=path, method=method, error=e, exc_info=True)
+        return {"error": "Internal server error"}, 500